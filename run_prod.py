@@ -1,27 +1,33 @@
 #!/usr/bin/env python3
 """
 Script de deploy em produção — ciclo completo blue-green:
-  1. Executa ETL na staging
-  2. Valida staging
+  1. Executa ETL na staging (no próprio processo, via src.etl.pipeline)
+  2. Valida staging (estrutura, carga e teste de fumaça de desempenho)
   3. Confirma switch
-  4. Executa switch (rename + drop old)
+  4. Executa switch (rename + drop old) — de bancos, ou de schemas com
+     BLUE_GREEN_LAYOUT=schema (sem derrubar as conexões da API)
 
 Uso:
   uv run run_prod.py                  # baixa versão mais recente
   uv run run_prod.py 01-2025          # baixa versão específica
   uv run run_prod.py --skip-etl       # pula ETL, só valida e faz switch
   uv run run_prod.py --auto-switch    # não pede confirmação antes do switch
+  uv run run_prod.py --progressive    # switch só com os índices CORE; os GIN
+                                      # trigram são criados depois, no ativo
+  uv run run_prod.py --daemon --switch-window 02:00-05:00
+                                      # fica de plantão: carrega cada mês novo
+                                      # assim que publicado e troca na janela
 """
 
 import argparse
 import asyncio
+import math
 import os
-import subprocess
 import sys
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 
-import asyncpg
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.panel import Panel
@@ -33,12 +39,30 @@ load_dotenv(_ROOT / ".env")
 
 sys.path.insert(0, str(_ROOT))
 
+from src.blue_green.schema_switch import (
+    active_target,
+    create_switcher,
+    staging_target,
+)
 from src.blue_green.state import StateManager
-from src.blue_green.switch import BlueGreenSwitcher
 from src.blue_green.validator import BlueGreenValidator
+from src.blue_green.relocate import RELOCATE_WORKERS, relocate_relations, relocation_size
+from src.blue_green.retention import PG_DATA_DIR, free_disk_gb
+from src.blue_green.window import SWITCH_WINDOW, parse_window, seconds_until_window
+from src.etl.bulk_mode import RECOVERY_COMMAND, read_bulk_state
+from src.etl.pipeline import EtlConfig, run
+from src.indexes.deferred import build_deferred_indexes
+from src.validation.smoke import SMOKE_MODE, smoke_test
 
 console = Console()
 
+# Modo daemon: intervalo entre consultas à Receita, nova tentativa de um mês
+# que falhou, fração da máquina para o ETL e prioridade (nice) do processo
+POLL_MINUTES = float(os.getenv("SCHEDULER_POLL_MINUTES", 30))
+RETRY_HOURS = float(os.getenv("SCHEDULER_RETRY_HOURS", 6))
+RESOURCE_SHARE = os.getenv("SCHEDULER_RESOURCE_SHARE", "0.5")
+NICE = int(os.getenv("SCHEDULER_NICE", 10))
+
 
 def _step(n: int, total: int, title: str) -> None:
     console.print(Rule(f"[bold cyan]Passo {n}/{total}: {title}[/bold cyan]"))
@@ -103,6 +127,33 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Executa o switch sem pedir confirmação interativa",
     )
+    parser.add_argument(
+        "--retain-hours",
+        type=float,
+        default=None,
+        help=(
+            "Mantém o ativo anterior por N horas para rollback instantâneo "
+            "(blue_green rollback); padrão: ROLLBACK_RETENTION_HOURS ou 0"
+        ),
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        dest="no_warmup",
+        help=(
+            "Não aquece o cache do banco promovido (pg_prewarm das tabelas de "
+            "referência, B-tree de CNPJ e faixas quentes do ativo anterior)"
+        ),
+    )
+    parser.add_argument(
+        "--drain-seconds",
+        type=float,
+        default=None,
+        help=(
+            "Prazo para as transações em andamento no banco ativo terminarem antes "
+            "do switch; as que sobrarem são encerradas (padrão: SWITCH_DRAIN_SECONDS ou 60)"
+        ),
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -112,38 +163,99 @@ def parse_args() -> argparse.Namespace:
         "--relocate-to-main",
         action="store_true",
         help=(
-            "Após o switch, move 'receita_federal' para o tablespace pg_default "
-            "(disco principal). Use quando a staging foi criada em um tablespace de "
-            "volume (STAGING_TABLESPACE) e você quer o banco principal no disco "
-            "principal, liberando o volume para o próximo ciclo. Encerra as conexões "
-            "ativas e copia os dados — leva alguns minutos."
+            "Antes da validação e do switch, move as tabelas e índices da staging "
+            "para o tablespace pg_default (disco principal). Use quando a carga vai "
+            "para um tablespace de volume (STAGING_TABLESPACE): a cópia roda em "
+            f"várias sessões (RELOCATE_WORKERS, hoje {RELOCATE_WORKERS}), sem tocar "
+            "no banco ativo, e o switch continua sendo só o rename."
+        ),
+    )
+    parser.add_argument(
+        "--smoke",
+        choices=["block", "warn", "off"],
+        default=SMOKE_MODE,
+        help=(
+            "Teste de fumaça de desempenho (staging x ativo) antes do switch: "
+            "block reprova a staging mais lenta, warn só avisa, off não roda "
+            "(padrão: SMOKE_TEST ou block)"
+        ),
+    )
+    parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help=(
+            "Disponibilidade progressiva: o ETL cria só os índices CORE (consulta "
+            "por CNPJ e filtros), o switch acontece assim que eles ficam prontos e "
+            "os índices de busca textual (GIN trigram) são criados depois, com "
+            "CONCURRENTLY, no banco já ativo"
         ),
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--switch-window",
+        default=SWITCH_WINDOW,
+        metavar="HH:MM-HH:MM",
+        help=(
+            "Janela de manutenção (horário local): validada a staging fora dela, "
+            "o switch espera a janela abrir (padrão: SWITCH_WINDOW ou sem janela)"
+        ),
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help=(
+            "Fica em execução consultando a Receita Federal (SCHEDULER_POLL_MINUTES); "
+            "quando um mês mais novo que o ativo termina de ser publicado, roda o "
+            "ciclo completo com --auto-switch, o ETL com uma fração da máquina "
+            "(SCHEDULER_RESOURCE_SHARE) e o switch na --switch-window"
+        ),
+    )
+    args = parser.parse_args()
+    try:
+        parse_window(args.switch_window)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.daemon and (args.date or args.skip_etl or args.skip_download or args.dry_run):
+        parser.error("--daemon escolhe o mês sozinho e sempre carrega e troca")
+    return args
 
 
 # ---------------------------------------------------------------------------
 # Passo 1 — ETL
 # ---------------------------------------------------------------------------
 
-def run_etl(args: argparse.Namespace) -> bool:
-    etl_script = _ROOT / "src" / "etl" / "ETL_dados_publicos_empresas.py"
-
-    cmd = ["uv", "run", str(etl_script), "--db-target", "receita_federal_staging"]
-    if args.date:
-        cmd.append(args.date)
-    elif args.last:
-        cmd.append("--last")
-    else:
-        cmd.append("--last")
-
-    if args.skip_download:
-        cmd.append("--skip-download")
-
-    console.print(f"[dim]Comando: {' '.join(cmd)}[/dim]\n")
-
-    result = subprocess.run(cmd, cwd=_ROOT)
-    return result.returncode == 0
+async def run_etl(args: argparse.Namespace):
+    """ETL no próprio processo; devolve o EtlResult ou None se falhar."""
+    db_name, schema = staging_target()
+    config = EtlConfig(
+        date=args.date,
+        last=not args.date,
+        db_target=db_name,
+        db_schema=schema,
+        skip_download=args.skip_download,
+        defer_indexes=args.progressive,
+    )
+    try:
+        return await run(config)
+    except Exception as e:
+        # O ETL já registrou o erro no log e no console
+        console.print(f"[dim]{type(e).__name__}: {e}[/dim]")
+        return None
+
+
+def print_etl_rows(result) -> None:
+    t = Table(title=f"Carga {result.source_month}", show_header=True, header_style="bold")
+    t.add_column("Tabela")
+    t.add_column("Lidas", justify="right")
+    t.add_column("Gravadas", justify="right")
+    t.add_column("Rejeitadas", justify="right")
+    for table, counts in result.rows.items():
+        t.add_row(
+            table,
+            f"{counts['lidas']:,}",
+            f"{counts['gravadas']:,}",
+            f"{counts['rejeitadas']:,}" if counts["rejeitadas"] else "-",
+        )
+    console.print(t)
 
 
 # ---------------------------------------------------------------------------
@@ -153,7 +265,11 @@ def run_etl(args: argparse.Namespace) -> bool:
 async def run_validation() -> tuple[bool, object]:
     config = _build_db_config()
     validator = BlueGreenValidator(config)
-    result = await validator.validate("receita_federal_staging")
+    db_name, schema = staging_target()
+    active_db, active_schema = active_target()
+    result = await validator.validate(
+        db_name, schema=schema, active_db=active_db, active_schema=active_schema
+    )
     return result.is_valid, result
 
 
@@ -164,7 +280,12 @@ def print_validation_report(result) -> None:
     t.add_column("Detalhes")
 
     tables_ok = not result.missing_tables and not result.empty_tables
-    indexes_ok = not result.missing_indexes
+    indexes_ok = not result.missing_indexes and not result.invalid_indexes
+    index_problems = []
+    if result.missing_indexes:
+        index_problems.append(f"ausentes: {', '.join(result.missing_indexes)}")
+    if result.invalid_indexes:
+        index_problems.append(f"inválidos: {', '.join(result.invalid_indexes)}")
 
     t.add_row(
         "Tabelas existentes",
@@ -179,49 +300,154 @@ def print_validation_report(result) -> None:
     t.add_row(
         "Índices",
         "[green]OK[/green]" if indexes_ok else "[red]FALHOU[/red]",
-        ", ".join(result.missing_indexes) if result.missing_indexes else "todos presentes",
+        "; ".join(index_problems)
+        or (
+            f"CORE prontos; adiados para depois do switch: {', '.join(result.deferred_indexes)}"
+            if result.deferred_indexes
+            else "todos presentes e válidos"
+        ),
+    )
+    t.add_row(
+        "Finalização",
+        "[green]OK[/green]" if not result.not_finalized else "[red]FALHOU[/red]",
+        "VACUUM (FREEZE, ANALYZE) pendente" if result.not_finalized else "concluída",
+    )
+    t.add_row(
+        "Conciliação da carga",
+        "[green]OK[/green]" if not result.ledger_issues else "[red]FALHOU[/red]",
+        "\n".join(str(i) for i in result.ledger_issues)
+        if result.ledger_issues
+        else "livro de lotes confere com o catálogo",
+    )
+    reference = (
+        f"comparadas com {result.compared_with}"
+        if result.compared_with
+        else "sem banco ativo para comparar"
+    )
+    t.add_row(
+        "Contagens vs ativo",
+        "[green]OK[/green]" if not result.row_deltas else "[red]FALHOU[/red]",
+        "\n".join(result.row_deltas) if result.row_deltas else reference,
+    )
+    t.add_row(
+        "Perfil (amostra)",
+        "[green]OK[/green]" if not result.profile_issues else "[red]FALHOU[/red]",
+        "\n".join(result.profile_issues)
+        if result.profile_issues
+        else "NULLs, datas e códigos dentro dos limites",
     )
 
     console.print(t)
+    if result.rejected_rows:
+        rejected = ", ".join(f"{table}: {n:,}" for table, n in result.rejected_rows.items())
+        console.print(f"[dim]Linhas com campo descartado no tratamento — {rejected}[/dim]")
+
+
+async def run_smoke_test():
+    return await smoke_test(_build_db_config(), staging_target(), active_target())
+
+
+def print_smoke_report(result) -> None:
+    t = Table(title="Teste de fumaça — staging x ativo", show_header=True, header_style="bold")
+    t.add_column("Consulta")
+    t.add_column("Mediana (ms)", justify="right")
+    t.add_column("p95 (ms)", justify="right")
+    t.add_column("Plano (staging)", style="dim")
+
+    def cell(s, a, fn):
+        if s.error:
+            return "[red]erro[/red]"
+        if not s.latencies:
+            return "—"
+        if a is None or a.error or not a.latencies:
+            return f"{fn(s):.1f}"
+        return f"{fn(s):.1f} / {fn(a):.1f}"
+
+    for name, s in result.staging.items():
+        a = result.active.get(name)
+        t.add_row(
+            name,
+            cell(s, a, lambda x: x.p50()),
+            cell(s, a, lambda x: x.p95()),
+            "\n".join(s.plan) or (s.error or ""),
+        )
+    console.print(t)
+    if result.active:
+        console.print("[dim]Latências: staging / ativo[/dim]")
+    if result.skipped:
+        console.print(f"[dim]Puladas (índice adiado): {', '.join(result.skipped)}[/dim]")
 
 
 # ---------------------------------------------------------------------------
 # Passo 3 — Switch
 # ---------------------------------------------------------------------------
 
-async def run_switch() -> bool:
+async def run_switch(
+    drain_seconds: float = None, retention_hours: float = None, warmup: bool = True
+) -> bool:
     config = _build_db_config()
     sm = StateManager()
-    switcher = BlueGreenSwitcher(config, sm)
-    result = await switcher.switch(force=True)  # validação já foi feita no passo 2
+    switcher = create_switcher(config, sm)
+    # validação já foi feita no passo 2
+    result = await switcher.switch(
+        force=True, drain_seconds=drain_seconds, retention_hours=retention_hours, warmup=warmup
+    )
     return result.success, result
 
 
-async def relocate_to_main() -> tuple[bool, str]:
-    """Move 'receita_federal' para o tablespace pg_default (disco principal).
+def print_warmup(report) -> None:
+    if report is None:
+        return
+    if report.skipped:
+        _warn(f"Cache não aquecido — {report.skipped}")
+        return
+    console.print(
+        f"[dim]Cache aquecido: {report.gb:.1f} GB em {report.seconds:.0f}s — "
+        f"{len(report.relations)} relação(ões) inteira(s), "
+        f"{report.hot_ranges} faixa(s) quente(s) do ativo anterior[/dim]"
+    )
+
+
+# Folga exigida no disco principal além do tamanho da staging
+_RELOCATE_MARGIN = 1.1
 
-    Necessário quando a staging foi criada em tablespace de volume: após o switch
-    (rename), o banco ativo fica fisicamente no volume. Este passo o traz de volta
-    ao disco principal e libera o volume. Exige encerrar conexões ativas.
+
+async def relocation_fits() -> tuple[bool, str]:
     """
-    config = _build_db_config()
-    admin = await asyncpg.connect(**config, database="postgres", timeout=30)
-    try:
-        await admin.execute(
-            """
-            SELECT pg_terminate_backend(pid)
-            FROM pg_stat_activity
-            WHERE datname = 'receita_federal' AND pid <> pg_backend_pid()
-            """
+    O disco principal comporta a staging ao lado do ativo? Sem como medir
+    (Postgres em outra máquina), presume que sim.
+    """
+    needed = await relocation_size(_build_db_config(), *staging_target()) / 1024**3
+    free = free_disk_gb()
+    if free is None or needed * _RELOCATE_MARGIN <= free:
+        return True, f"{needed:.1f} GB a mover"
+    return False, f"staging com {needed:.1f} GB, {free:.1f} GB livres em {PG_DATA_DIR}"
+
+
+def print_relocation(report) -> None:
+    if not report.moved and not report.failed:
+        _ok(f"Staging já está toda em {report.tablespace}")
+    else:
+        rate = report.gb / report.seconds * 1024 if report.seconds else 0
+        _ok(
+            f"{len(report.moved)} relação(ões) movida(s) para {report.tablespace}: "
+            f"{report.gb:.1f} GB em {report.seconds / 60:.1f} min ({rate:.0f} MB/s)"
         )
-        await admin.execute(
-            'ALTER DATABASE "receita_federal" SET TABLESPACE pg_default'
+    for name, error in report.failed:
+        _warn(f"{name} não foi movida: {error}")
+    if report.database_tablespace:
+        # Staging criada antes da relocação por relação (CREATE DATABASE ...
+        # TABLESPACE): o catálogo fica no volume
+        _warn(
+            f"O catálogo do banco continua em '{report.database_tablespace}' — "
+            "recrie a staging pelo ETL para liberar o volume por completo"
         )
-        return True, "receita_federal movido para pg_default (disco principal)"
-    except Exception as e:  # noqa: BLE001
-        return False, f"Falha ao relocar para pg_default: {e}"
-    finally:
-        await admin.close()
+
+
+async def build_deferred() -> list:
+    """Cria no banco ativo os índices adiados pelo ETL (--progressive)."""
+    database, schema = active_target()
+    return await build_deferred_indexes(_build_db_config(), database, schema, StateManager())
 
 
 # ---------------------------------------------------------------------------
@@ -265,20 +491,45 @@ async def main_async(args: argparse.Namespace) -> int:
 
     step = 0
 
+    # Ativo anterior retido para rollback: sai se a janela acabou, antes do
+    # ETL disputar o disco com ele
+    reason = await create_switcher(_build_db_config(), StateManager()).expire_old()
+    if reason:
+        _warn(f"Carga anterior retida dropada — {reason}")
+
     # ------------------------------------------------------------------
     # Passo ETL
     # ------------------------------------------------------------------
     if not args.skip_etl:
         step += 1
         _step(step, total_steps, "ETL — carregando dados na staging")
-        ok = run_etl(args)
-        if not ok:
+        etl_result = await run_etl(args)
+        if etl_result is None:
             _fail("ETL falhou — abortando deploy")
+            if read_bulk_state() is not None:
+                # O ETL morreu sem desfazer synchronous_commit/max_wal_size etc.
+                _warn(f"Modo carga em massa ainda ativo — restaure com: {RECOVERY_COMMAND}")
             return 1
-        _ok("ETL concluído com sucesso")
+        print_etl_rows(etl_result)
+        _ok(f"ETL concluído em {etl_result.seconds['total']:.0f}s")
     else:
         _warn("ETL pulado (--skip-etl) — usando staging existente")
 
+    # Staging do volume para o disco principal antes de validar: a validação
+    # e o teste de fumaça medem os dados já onde vão ficar
+    relocate_after = False
+    if args.relocate_to_main:
+        fits, detail = await relocation_fits()
+        if fits:
+            console.print(
+                f"\n[dim]Movendo a staging para o disco principal (pg_default) — {detail}, "
+                f"{RELOCATE_WORKERS} sessões em paralelo...[/dim]"
+            )
+            print_relocation(await relocate_relations(_build_db_config(), *staging_target()))
+        else:
+            relocate_after = True
+            _warn(f"Sem espaço para relocar antes do switch ({detail}) — fica para depois dele")
+
     # ------------------------------------------------------------------
     # Passo Validação
     # ------------------------------------------------------------------
@@ -293,6 +544,20 @@ async def main_async(args: argparse.Namespace) -> int:
         _warn("Corrija os problemas antes de fazer o switch")
         return 1
 
+    # Desempenho: estatísticas faltando ou um índice que o planner não usa
+    # passam pela validação estrutural e só aparecem com tráfego de produção
+    if args.smoke != "off":
+        console.print("\n[dim]Teste de fumaça de desempenho (staging x ativo)...[/dim]")
+        smoke = await run_smoke_test()
+        print_smoke_report(smoke)
+        if not smoke.passed:
+            issues = "; ".join(smoke.issues)
+            if args.smoke == "block":
+                _fail(f"Staging mais lenta que o ativo: {issues}")
+                _warn("Investigue antes do switch, ou rode com --smoke warn")
+                return 1
+            _warn(f"Staging mais lenta que o ativo: {issues}")
+
     _ok("Staging validada — pronta para switch")
 
     if args.dry_run:
@@ -306,6 +571,15 @@ async def main_async(args: argparse.Namespace) -> int:
     step += 1
     _step(step, total_steps, "Switch blue-green")
 
+    # Staging validada fora da janela de manutenção: espera a janela abrir
+    wait = seconds_until_window(parse_window(args.switch_window), datetime.now().astimezone())
+    if wait:
+        console.print(
+            f"\n[dim]Fora da janela de manutenção ({args.switch_window}) — "
+            f"switch em {wait / 3600:.1f} h...[/dim]"
+        )
+        await asyncio.sleep(wait)
+
     if not args.auto_switch:
         sm = StateManager()
         staging = sm.get_staging() or {}
@@ -319,30 +593,117 @@ async def main_async(args: argparse.Namespace) -> int:
             _warn("Switch cancelado pelo usuário")
             return 0
 
-    ok, switch_result = await run_switch()
+    ok, switch_result = await run_switch(
+        args.drain_seconds, args.retain_hours, warmup=not args.no_warmup
+    )
 
     if not ok:
         _fail(f"Switch falhou: {switch_result.message}")
         return 1
 
     _ok(switch_result.message)
+    if switch_result.unavailable_seconds is not None:
+        console.print(
+            f"[dim]Banco indisponível por {switch_result.unavailable_seconds:.2f}s — "
+            f"{switch_result.terminated} conexão(ões) encerrada(s) ao fim do prazo[/dim]"
+        )
+    print_warmup(switch_result.warmup)
 
-    # Reloca o banco ativo para o disco principal (libera o volume da staging)
-    if args.relocate_to_main:
-        console.print("\n[dim]Movendo receita_federal para o disco principal (pg_default)...[/dim]")
-        ok_reloc, msg = await relocate_to_main()
-        if ok_reloc:
-            _ok(msg)
-        else:
-            _warn(msg)  # switch já foi feito; a relocação é best-effort
+    # Sem espaço antes: com o anterior dropado, o ativo vem tabela a tabela —
+    # cada uma travada só durante a própria cópia
+    if relocate_after:
+        console.print(
+            "\n[dim]Movendo o banco ativo para o disco principal (pg_default), "
+            f"{RELOCATE_WORKERS} sessões em paralelo...[/dim]"
+        )
+        print_relocation(await relocate_relations(_build_db_config(), *active_target()))
+
+    # Disponibilidade progressiva: o banco já atende consultas por CNPJ; as
+    # buscas textuais passam a valer à medida que cada índice fica pronto
+    if result.deferred_indexes:
+        console.print(
+            "\n[dim]Criando índices adiados no banco ativo (CONCURRENTLY): "
+            f"{', '.join(result.deferred_indexes)}...[/dim]"
+        )
+        try:
+            builds = await build_deferred()
+        except Exception as e:  # noqa: BLE001
+            builds = []
+            _warn(f"Falha ao criar índices adiados: {e}")
+        failed = [name for name, status, _ in builds if status == "failed"]
+        if failed:
+            # switch já foi feito; refaça com: uv run src/indexes/deferred.py
+            _warn(f"Índices adiados com erro: {', '.join(failed)} — rode src/indexes/deferred.py")
+        elif builds:
+            _ok("Índices adiados criados — todas as capacidades de consulta disponíveis")
 
     sm = StateManager()
     print_summary(sm, start, success=True)
     return 0
 
 
+# ---------------------------------------------------------------------------
+# Modo daemon
+# ---------------------------------------------------------------------------
+
+async def daemon_async(args: argparse.Namespace) -> int:
+    from src.etl.release_watch import SETTLE_MINUTES, ReleaseWatcher
+
+    # O ETL roda neste processo: o perfil de tuning enxerga só uma fração da
+    # máquina (o ativo continua atendendo consultas nela) e os processos de
+    # codificação herdam a prioridade menor
+    os.environ.setdefault("ETL_RESOURCE_SHARE", RESOURCE_SHARE)
+    os.nice(NICE)
+
+    console.print(Panel(
+        "[bold]Deploy blue-green — modo daemon[/bold]\n"
+        f"Consulta a cada {POLL_MINUTES:.0f} min | "
+        f"mês publicado após {SETTLE_MINUTES:.0f} min sem mudanças | "
+        f"ETL com {float(os.environ['ETL_RESOURCE_SHARE']):.0%} da máquina | "
+        f"janela de switch: {args.switch_window or 'qualquer hora'}",
+        border_style="magenta",
+    ))
+
+    watcher = ReleaseWatcher()
+    # Mês → instante da última falha, para não recarregar a cada consulta
+    failed = {}
+    while True:
+        active = (StateManager().get_active() or {}).get("source_month")
+        try:
+            release = await asyncio.to_thread(watcher.check, active)
+        except Exception as e:  # noqa: BLE001
+            _warn(f"Consulta à Receita Federal falhou: {e}")
+            release = None
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        if release is None:
+            status = watcher.waiting or f"ativo em dia ({active or 'nenhum'})"
+            console.print(f"[dim]{now} {status}[/dim]")
+        elif time.monotonic() - failed.get(release.source_month, -math.inf) < RETRY_HOURS * 3600:
+            console.print(f"[dim]{now} {release.source_month} falhou há pouco — aguardando[/dim]")
+        else:
+            console.print(Rule(f"[bold cyan]Mês novo publicado: {release.source_month}[/bold cyan]"))
+            run_args = argparse.Namespace(
+                **{**vars(args), "date": release.source_month, "last": False, "auto_switch": True}
+            )
+            try:
+                code = await main_async(run_args)
+            except Exception as e:  # noqa: BLE001
+                _fail(f"Deploy de {release.source_month} interrompido: {e}")
+                code = 1
+            if code:
+                failed[release.source_month] = time.monotonic()
+                _warn(f"Nova tentativa de {release.source_month} em {RETRY_HOURS:.0f} h")
+            else:
+                failed.pop(release.source_month, None)
+
+        await asyncio.sleep(POLL_MINUTES * 60)
+
+
 def main() -> None:
     args = parse_args()
+    if args.daemon:
+        sys.exit(asyncio.run(daemon_async(args)))
     sys.exit(asyncio.run(main_async(args)))
 
 
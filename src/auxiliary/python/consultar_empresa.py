@@ -5,15 +5,12 @@ Receita Federal - Dados Públicos CNPJ
 """
 
 import asyncio
-import asyncpg
-import json
 import os
 import sys
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
-from rich.json import JSON
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -30,41 +27,9 @@ DB_CONFIG = {
 }
 
 
-def format_cnpj(cnpj):
-    """Formata CNPJ para exibição"""
-    if len(cnpj) == 14:
-        return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
-    elif len(cnpj) == 8:
-        return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}"
-    return cnpj
-
-
-def validate_cnpj(cnpj):
-    """Valida formato do CNPJ"""
-    # Remove caracteres não numéricos
-    cnpj_clean = ''.join(filter(str.isdigit, cnpj))
-    
-    if len(cnpj_clean) not in [8, 14]:
-        return False, "CNPJ deve ter 8 (básico) ou 14 (completo) dígitos"
-    
-    return True, cnpj_clean
-
-
-async def create_db_connection():
-    """Cria conexão com o banco"""
-    try:
-        conn = await asyncpg.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        console.print(f"[red]Erro ao conectar com o banco: {e}[/red]")
-        return None
-
-
-async def consultar_empresa_basico(conn, cnpj):
-    """Consulta dados básicos da empresa"""
-    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
-    
-    query = """
+# Consultas do cartão CNPJ — $1 = cnpj_basico. Também usadas pelo
+# src/indexes/benchmark.py para medir o efeito de índices novos
+QUERY_EMPRESA = """
     SELECT 
         e.cnpj_basico,
         e.razao_social,
@@ -86,15 +51,8 @@ async def consultar_empresa_basico(conn, cnpj):
     LEFT JOIN qualificacao qr ON e.qualificacao_responsavel = qr.codigo
     WHERE e.cnpj_basico = $1
     """
-    
-    return await conn.fetchrow(query, cnpj_basico)
-
 
-async def consultar_estabelecimentos(conn, cnpj):
-    """Consulta estabelecimentos da empresa"""
-    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
-    
-    query = """
+QUERY_ESTABELECIMENTOS = """
     SELECT 
         est.cnpj_basico,
         est.cnpj_ordem,
@@ -142,15 +100,8 @@ async def consultar_estabelecimentos(conn, cnpj):
     WHERE est.cnpj_basico = $1
     ORDER BY est.cnpj_ordem
     """
-    
-    return await conn.fetch(query, cnpj_basico)
-
 
-async def consultar_socios(conn, cnpj):
-    """Consulta sócios da empresa"""
-    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
-    
-    query = """
+QUERY_SOCIOS = """
     SELECT 
         s.cnpj_basico,
         s.identificador_socio,
@@ -185,15 +136,8 @@ async def consultar_socios(conn, cnpj):
     WHERE s.cnpj_basico = $1
     ORDER BY s.nome_socio
     """
-    
-    return await conn.fetch(query, cnpj_basico)
-
 
-async def consultar_simples(conn, cnpj):
-    """Consulta informações do Simples Nacional"""
-    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
-    
-    query = """
+QUERY_SIMPLES = """
     SELECT 
         sim.cnpj_basico,
         sim.opcao_pelo_simples,
@@ -215,8 +159,75 @@ async def consultar_simples(conn, cnpj):
     FROM simples sim
     WHERE sim.cnpj_basico = $1
     """
+
+CONSULTAS = {
+    "empresa": QUERY_EMPRESA,
+    "estabelecimentos": QUERY_ESTABELECIMENTOS,
+    "socios": QUERY_SOCIOS,
+    "simples": QUERY_SIMPLES,
+}
+
+
+def format_cnpj(cnpj):
+    """Formata CNPJ para exibição"""
+    if len(cnpj) == 14:
+        return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
+    elif len(cnpj) == 8:
+        return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}"
+    return cnpj
+
+
+def validate_cnpj(cnpj):
+    """Valida formato do CNPJ"""
+    # Remove caracteres não numéricos
+    cnpj_clean = ''.join(filter(str.isdigit, cnpj))
+    
+    if len(cnpj_clean) not in [8, 14]:
+        return False, "CNPJ deve ter 8 (básico) ou 14 (completo) dígitos"
+    
+    return True, cnpj_clean
+
+
+async def create_db_connection():
+    """Cria conexão com o banco"""
+    # Importado aqui: o teste de fumaça e o benchmark de índices importam
+    # este módulo só pelas consultas (CONSULTAS)
+    import asyncpg
+
+    try:
+        conn = await asyncpg.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        console.print(f"[red]Erro ao conectar com o banco: {e}[/red]")
+        return None
+
+
+async def consultar_empresa_basico(conn, cnpj):
+    """Consulta dados básicos da empresa"""
+    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
+    
+    return await conn.fetchrow(QUERY_EMPRESA, cnpj_basico)
+
+
+async def consultar_estabelecimentos(conn, cnpj):
+    """Consulta estabelecimentos da empresa"""
+    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
+    
+    return await conn.fetch(QUERY_ESTABELECIMENTOS, cnpj_basico)
+
+
+async def consultar_socios(conn, cnpj):
+    """Consulta sócios da empresa"""
+    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
+    
+    return await conn.fetch(QUERY_SOCIOS, cnpj_basico)
+
+
+async def consultar_simples(conn, cnpj):
+    """Consulta informações do Simples Nacional"""
+    cnpj_basico = cnpj[:8] if len(cnpj) == 14 else cnpj
     
-    return await conn.fetchrow(query, cnpj_basico)
+    return await conn.fetchrow(QUERY_SIMPLES, cnpj_basico)
 
 
 def exibir_empresa_basico(empresa):
@@ -24,6 +24,14 @@ from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, MofNCo
 from rich.table import Table
 from rich.panel import Panel
 
+# Raiz do projeto no sys.path — permite importar src.validation.table_stats
+# quando o script roda direto via `uv run`
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.validation.table_stats import format_rows, table_stats  # noqa: E402
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -111,14 +119,9 @@ async def get_database_info():
             ORDER BY pg_total_relation_size(schemaname||'.'||tablename) DESC
         """)
         
-        # Contagem de registros por tabela
-        tables_count = {}
-        for table in TABLES_ORDER:
-            try:
-                count = await conn.fetchval(f"SELECT COUNT(*) FROM {table}")
-                tables_count[table] = count
-            except:
-                tables_count[table] = 0
+        # Contagem de registros por tabela (catálogo/ETL, sem COUNT(*))
+        stats = await table_stats(conn, TABLES_ORDER)
+        tables_count = {table: info.rows for table, info in stats.items()}
         
         return {
             'database_size': db_size,
@@ -525,14 +528,14 @@ async def validate_restored_database(target_config):
         
         total_records = 0
         
-        for table_name in TABLES_ORDER:
-            if table_name in existing_table_names:
-                try:
-                    count = await conn.fetchval(f"SELECT COUNT(*) FROM {table_name}")
-                    total_records += count
-                    table.add_row(table_name, f"{count:,}", "✅ OK")
-                except Exception as e:
-                    table.add_row(table_name, "0", f"❌ Erro: {e}")
+        # Contagens do catálogo (após o restore, o contador do coletor de
+        # estatísticas já reflete as linhas inseridas) — sem COUNT(*)
+        stats = await table_stats(conn, TABLES_ORDER)
+        
+        for table_name, info in stats.items():
+            if info.exists:
+                total_records += info.rows
+                table.add_row(table_name, format_rows(info), "✅ OK" if info.has_rows else "⚠️  Vazia")
             else:
                 table.add_row(table_name, "0", "❌ Não encontrada")
         
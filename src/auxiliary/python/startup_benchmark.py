@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mede o tempo de partida das ferramentas de linha de comando.
+
+Cada comando roda num processo novo com `python -X importtime`, algumas vezes;
+o relatório traz a mediana do tempo total (relógio), o tempo gasto em imports,
+os imports mais caros e quais dependências pesadas (asyncpg, Polars, httpx,
+asyncio) foram carregadas. Os comandos escolhidos não tocam o banco — `status`
+só lê o JSON de estado, e os demais param na ajuda ou no uso — então o número
+é o custo fixo que o cron e as consultas avulsas pagam a cada chamada.
+
+    uv run src/auxiliary/python/startup_benchmark.py
+    uv run src/auxiliary/python/startup_benchmark.py --runs 10 --budget-ms 300
+
+Com `--budget-ms`, sai com código 1 se algum comando passar do limite.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[3]
+
+console = Console()
+
+# (rótulo, argumentos do python)
+COMMANDS = [
+    ("blue_green status", ["src/blue_green/cli.py", "status"]),
+    ("blue_green --help", ["src/blue_green/cli.py", "--help"]),
+    ("consultar_empresa (uso)", ["src/auxiliary/python/consultar_empresa.py"]),
+    ("check_database_status --help", ["src/validation/check_database_status.py", "--help"]),
+    ("run_prod --help", ["run_prod.py", "--help"]),
+    ("import src.etl.pipeline", ["-c", "import src.etl.pipeline"]),
+]
+
+HEAVY = ["asyncio", "asyncpg", "polars", "httpx"]
+
+
+def parse_importtime(stderr):
+    """
+    (módulo de topo → microssegundos acumulados, incluindo o que ele
+    importou; nomes de todos os módulos importados)
+    """
+    top, names = {}, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # cabeçalho
+        names.add(name.strip())
+        # Módulos de topo têm um espaço só antes do nome
+        if not name.startswith("  "):
+            top[name.strip()] = int(cumulative)
+    return top, names
+
+
+def measure(argv, runs):
+    walls, imports = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", *argv],
+            cwd=_PROJECT_ROOT,
+            env={**os.environ, "PYTHONPATH": str(_PROJECT_ROOT)},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        walls.append((time.perf_counter() - start) * 1000)
+        if "Traceback" in proc.stderr:
+            # Um import quebrado terminaria rápido e pareceria ótimo
+            raise RuntimeError(f"{' '.join(argv)} falhou:\n{proc.stderr[-2000:]}")
+        top, names = parse_importtime(proc.stderr)
+        imports.append(sum(top.values()) / 1000)
+    return statistics.median(walls), statistics.median(imports), top, names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de partida das ferramentas de linha de comando")
+    parser.add_argument("--runs", type=int, default=5, help="Execuções por comando (padrão: 5)")
+    parser.add_argument(
+        "--budget-ms", type=float, help="Falha se a mediana de algum comando passar disto"
+    )
+    args = parser.parse_args()
+
+    # Partida do próprio interpretador, para descontar dos números acima
+    baseline, *_ = measure(["-c", "pass"], args.runs)
+
+    t = Table(title=f"Partida (mediana de {args.runs}; python vazio: {baseline:.0f} ms)")
+    t.add_column("Comando", style="cyan")
+    t.add_column("Total (ms)", justify="right")
+    t.add_column("Imports (ms)", justify="right")
+    t.add_column("Mais caros")
+    t.add_column("Pesados carregados")
+    over = []
+    for label, argv in COMMANDS:
+        wall, imported, top, names = measure(argv, args.runs)
+        # site (os .pth do ambiente) entra também no python vazio
+        heaviest = sorted(
+            ((name, us) for name, us in top.items() if name != "site"), key=lambda item: -item[1]
+        )[:3]
+        heavy = [name for name in HEAVY if name in names]
+        if args.budget_ms is not None and wall > args.budget_ms:
+            over.append(label)
+        t.add_row(
+            label,
+            f"[red]{wall:.0f}[/red]" if label in over else f"{wall:.0f}",
+            f"{imported:.0f}",
+            ", ".join(f"{name} {us / 1000:.0f}" for name, us in heaviest),
+            ", ".join(heavy) or "[dim]—[/dim]",
+        )
+    console.print(t)
+
+    if over:
+        console.print(f"[red]Acima de {args.budget_ms:.0f} ms: {', '.join(over)}[/red]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import asyncio
+import io
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import asyncpg
+import polars as pl
+
+from src.blue_green.constants import FACT_TABLE_KEYS
+from src.blue_green.layout import active_target, staging_target
+from src.blue_green.state import StateManager
+
+# Coluna gravada pelo ETL (hash do CSV bruto) — não faz parte do conteúdo
+_ROW_HASH = "row_hash"
+
+# Hash do conteúdo de cada linha, calculado sobre o texto devolvido pelo
+# Postgres — igual nos dois bancos para linhas idênticas
+_HASH = "_hash"
+
+# Todas as tabelas de fato têm cnpj_basico: os dois bancos são lidos em ordem
+# de cnpj_basico e o merge avança por faixas dessa chave
+_MERGE_KEY = "cnpj_basico"
+
+_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class ChangeFeedResult:
+    output_dir: str
+    counts: dict = field(default_factory=dict)
+    files: list = field(default_factory=list)
+
+
+def _last_row_boundary(buf: bytearray) -> int:
+    """
+    Posição logo após o último fim de linha do CSV em `buf`. Um '\\n' só
+    termina a linha se estiver fora de aspas — como o buffer sempre começa no
+    início de uma linha, basta a paridade das aspas antes dele.
+    """
+    pos = buf.rfind(b"\n")
+    while pos != -1:
+        if buf.count(b'"', 0, pos) % 2 == 0:
+            return pos + 1
+        pos = buf.rfind(b"\n", 0, pos)
+    return 0
+
+
+def _parse_csv(data: bytes, columns: list) -> pl.DataFrame:
+    df = pl.read_csv(
+        io.BytesIO(data),
+        has_header=False,
+        new_columns=columns,
+        schema={c: pl.Utf8 for c in columns},
+    )
+    return df.with_columns(
+        pl.concat_str(
+            [pl.col(c).fill_null("\x00") for c in columns], separator="\x1f"
+        )
+        .hash()
+        .alias(_HASH)
+    )
+
+
+async def _stream_sorted(conn, query: str, columns: list):
+    """
+    Executa `COPY (query) TO STDOUT` e devolve o resultado como uma sequência
+    de DataFrames (~_CHUNK_BYTES cada), sem nunca materializar a tabela
+    inteira. A fila limitada faz o COPY esperar enquanto o merge consome.
+    """
+    queue = asyncio.Queue(maxsize=8)
+
+    async def sink(data):
+        await queue.put(data)
+
+    async def run():
+        try:
+            await conn.copy_from_query(query, output=sink, format="csv")
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(run())
+    buf = bytearray()
+    try:
+        while True:
+            data = await queue.get()
+            if data is None:
+                break
+            buf += data
+            if len(buf) >= _CHUNK_BYTES:
+                cut = _last_row_boundary(buf)
+                if cut:
+                    yield _parse_csv(bytes(buf[:cut]), columns)
+                    del buf[:cut]
+        await task  # propaga erro do COPY
+        if buf:
+            yield _parse_csv(bytes(buf), columns)
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class _Side:
+    """Um dos lados do merge: stream ordenado + linhas ainda não consumidas."""
+
+    def __init__(self, stream, columns):
+        self._stream = stream
+        self.pending = pl.DataFrame(schema={**{c: pl.Utf8 for c in columns}, _HASH: pl.UInt64})
+        self.done = False
+
+    async def fetch(self):
+        try:
+            chunk = await anext(self._stream)
+        except StopAsyncIteration:
+            self.done = True
+            return
+        self.pending = pl.concat([self.pending, chunk])
+
+    def last_key(self):
+        return self.pending[_MERGE_KEY][-1]
+
+    def take_below(self, bound):
+        if bound is None:
+            taken, self.pending = self.pending, self.pending.clear()
+            return taken
+        mask = pl.col(_MERGE_KEY) < bound
+        taken = self.pending.filter(mask)
+        self.pending = self.pending.filter(~mask)
+        return taken
+
+
+class ChangeFeedExporter:
+    """
+    Gera o change feed mensal entre duas cargas (por padrão: ativo = mês
+    anterior, staging = mês novo — bancos ou schemas, conforme
+    BLUE_GREEN_LAYOUT). Cada tabela de fato é lida dos dois bancos
+    em ordem de cnpj_basico e comparada por merge em janelas — memória
+    limitada ao tamanho da janela, sem FULL OUTER JOIN no Postgres.
+
+    Saída particionada em `<output>/<mes_antigo>_para_<mes_novo>/<tabela>/`,
+    um arquivo por janela com mudanças. Cada linha traz `op`
+    (insert/delete/update), as colunas da tabela (valores novos; os antigos
+    para delete) e, em update, `changed_columns`.
+    """
+
+    def __init__(self, db_config: dict, state_manager: StateManager = None):
+        self._config = db_config
+        self._state = state_manager or StateManager()
+
+    async def _columns(self, conn, table: str) -> list:
+        rows = await conn.fetch(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = $1 AND table_schema = current_schema()
+            ORDER BY ordinal_position
+            """,
+            table,
+        )
+        return [r["column_name"] for r in rows if r["column_name"] != _ROW_HASH]
+
+    def _feed_dir(self, output_dir: str) -> Path:
+        state = self._state.read()
+        old_month = ((state.get("active") or {}).get("source_month")) or "anterior"
+        new_month = ((state.get("staging") or {}).get("source_month")) or "novo"
+        return Path(output_dir) / f"{old_month}_para_{new_month}"
+
+    @staticmethod
+    def _diff(old: pl.DataFrame, new: pl.DataFrame, keys: list, columns: list) -> pl.DataFrame:
+        inserted = new.join(old, on=keys, how="anti", nulls_equal=True)
+        removed = old.join(new, on=keys, how="anti", nulls_equal=True)
+
+        no_changes = pl.lit(None, dtype=pl.List(pl.Utf8)).alias("changed_columns")
+        if _HASH in keys:
+            # Identidade = linha inteira: não existe update, só delete + insert
+            changed = new.clear().select(columns).with_columns(no_changes)
+        else:
+            value_cols = [c for c in columns if c not in keys]
+            both = new.join(old, on=keys, how="inner", suffix="_old", nulls_equal=True)
+            changed = both.filter(pl.col(_HASH) != pl.col(f"{_HASH}_old"))
+            changed = changed.with_columns(
+                pl.concat_list(
+                    [
+                        pl.when(pl.col(c).ne_missing(pl.col(f"{c}_old")))
+                        .then(pl.lit(c))
+                        .otherwise(pl.lit(None, dtype=pl.Utf8))
+                        for c in value_cols
+                    ]
+                )
+                .list.drop_nulls()
+                .alias("changed_columns")
+            ).select(columns + ["changed_columns"])
+
+        return pl.concat(
+            [
+                inserted.select(columns).with_columns(no_changes, pl.lit("insert").alias("op")),
+                removed.select(columns).with_columns(no_changes, pl.lit("delete").alias("op")),
+                changed.with_columns(pl.lit("update").alias("op")),
+            ]
+        ).select(["op"] + columns + ["changed_columns"])
+
+    def _write(self, df: pl.DataFrame, table_dir: Path, part: int, fmt: str) -> str:
+        table_dir.mkdir(parents=True, exist_ok=True)
+        if fmt == "jsonl":
+            path = table_dir / f"part-{part:05d}.jsonl"
+            df.write_ndjson(path)
+        else:
+            path = table_dir / f"part-{part:05d}.parquet"
+            df.write_parquet(path, compression="zstd")
+        return str(path)
+
+    async def _export_table(self, table, old_conn, new_conn, feed_dir, fmt, result):
+        columns = await self._columns(new_conn, table)
+        old_columns = set(await self._columns(old_conn, table))
+        columns = [c for c in columns if c in old_columns]
+
+        # socios não tem chave natural (FACT_TABLE_KEYS usa o row_hash): a linha
+        # inteira é a identidade, e alteração aparece como delete + insert
+        keys = [k for k in FACT_TABLE_KEYS[table] if k != _ROW_HASH]
+        if _ROW_HASH in FACT_TABLE_KEYS[table]:
+            keys = keys + [_HASH]
+
+        # cnpj_basico tem tamanho fixo (8 dígitos): a ordem do ORDER BY é a
+        # mesma em qualquer collation, e o índice de cnpj pode ser usado
+        query = f"SELECT {', '.join(columns)} FROM {table} ORDER BY {_MERGE_KEY}"
+        old = _Side(_stream_sorted(old_conn, query, columns), columns)
+        new = _Side(_stream_sorted(new_conn, query, columns), columns)
+
+        counts = {"insert": 0, "delete": 0, "update": 0}
+        part = 0
+        table_dir = feed_dir / table
+        while True:
+            for side in (old, new):
+                if not side.done and side.pending.height == 0:
+                    await side.fetch()
+            if old.done and new.done and not old.pending.height and not new.pending.height:
+                break
+
+            # Linhas com cnpj_basico < bound estão completas nos dois lados:
+            # nenhum chunk futuro pode trazer um cnpj_basico menor que isso
+            open_sides = [s for s in (old, new) if not s.done]
+            bound = min(s.last_key() for s in open_sides) if open_sides else None
+            old_rows = old.take_below(bound)
+            new_rows = new.take_below(bound)
+            if not old_rows.height and not new_rows.height:
+                # Janela inteira num só cnpj_basico — lê mais do lado que limitou
+                for side in open_sides:
+                    if side.last_key() == bound:
+                        await side.fetch()
+                continue
+
+            changes = self._diff(old_rows, new_rows, keys, columns)
+            if changes.height:
+                for op, n in changes.group_by("op").len().iter_rows():
+                    counts[op] += n
+                result.files.append(self._write(changes, table_dir, part, fmt))
+                part += 1
+
+        result.counts[table] = counts
+
+    async def _connect(self, database, schema):
+        return await asyncpg.connect(
+            **self._config,
+            database=database,
+            timeout=30,
+            server_settings={"search_path": f'"{schema}", public'} if schema else None,
+        )
+
+    async def export(
+        self,
+        output_dir: str,
+        fmt: str = "parquet",
+        old: tuple = None,
+        new: tuple = None,
+        tables: list = None,
+    ) -> ChangeFeedResult:
+        """
+        `old` e `new` são (banco, schema); por padrão o ativo e a staging do
+        layout configurado.
+        """
+        feed_dir = self._feed_dir(output_dir)
+        result = ChangeFeedResult(output_dir=str(feed_dir))
+        old_conn = await self._connect(*(old or active_target()))
+        try:
+            new_conn = await self._connect(*(new or staging_target()))
+        except BaseException:
+            await old_conn.close()
+            raise
+        try:
+            for table in tables or list(FACT_TABLE_KEYS):
+                await self._export_table(table, old_conn, new_conn, feed_dir, fmt, result)
+        finally:
+            await old_conn.close()
+            await new_conn.close()
+        os.makedirs(feed_dir, exist_ok=True)
+        return result
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import argparse
-import asyncio
 import os
 import sys
 from pathlib import Path
@@ -14,9 +13,12 @@ load_dotenv(_PROJECT_ROOT / ".env")
 
 sys.path.insert(0, str(_PROJECT_ROOT))
 
+# Só o estado (um JSON) e o layout (variáveis de ambiente) no topo: asyncio,
+# asyncpg, Polars e os módulos de switch/validação são importados pelo
+# subcomando que os usa — `status`, que o cron roda a cada poucos minutos,
+# volta em milissegundos
+from src.blue_green.layout import active_target, staging_target
 from src.blue_green.state import StateManager
-from src.blue_green.switch import BlueGreenSwitcher
-from src.blue_green.validator import BlueGreenValidator
 
 console = Console()
 
@@ -30,6 +32,17 @@ def _build_db_config() -> dict:
     }
 
 
+def _run(coro):
+    import asyncio
+
+    return asyncio.run(coro)
+
+
+def _label(target) -> str:
+    """(banco, schema) → 'banco.schema', ou só o banco no layout por bancos."""
+    return f"{target[0]}.{target[1]}" if target[1] else target[0]
+
+
 def _fmt(value) -> str:
     return str(value) if value is not None else "[dim]—[/dim]"
 
@@ -49,8 +62,8 @@ def cmd_status(_args) -> None:
 
     t = Table(show_header=True, header_style="bold cyan")
     t.add_column("Campo")
-    t.add_column("Ativo (receita_federal)", style="green")
-    t.add_column("Staging (receita_federal_staging)", style="yellow")
+    t.add_column(f"Ativo ({_label(active_target())})", style="green")
+    t.add_column(f"Staging ({_label(staging_target())})", style="yellow")
 
     fields = [
         ("source_month", "Mês dos dados"),
@@ -69,12 +82,52 @@ def cmd_status(_args) -> None:
     if state.get("last_switch"):
         console.print(f"\n[dim]Último switch: {state['last_switch']}[/dim]")
 
+    capabilities = (active or {}).get("capabilities")
+    if capabilities:
+        ready = [name for name, ok in capabilities.items() if ok]
+        console.print(f"[green]Consultas disponíveis: {', '.join(ready) or '—'}[/green]")
+        pending = active.get("pending_indexes") or []
+        if pending:
+            console.print(
+                f"[yellow]Índices pendentes: {', '.join(pending)} "
+                "(uv run src/blue_green/cli.py build-deferred)[/yellow]"
+            )
+
+    previous = state.get("previous")
+    if previous:
+        console.print(
+            f"[cyan]Rollback disponível para {previous.get('source_month') or '?'} "
+            f"até {previous.get('retained_until')}[/cyan]"
+        )
+
+    history = state.get("history") or []
+    if history:
+        h = Table(title="Histórico", show_header=True, header_style="bold cyan")
+        h.add_column("Quando")
+        h.add_column("Evento")
+        h.add_column("Ativo")
+        h.add_column("Anterior retido")
+        for entry in history[-5:]:
+            h.add_row(
+                entry["at"],
+                entry["event"],
+                _fmt((entry.get("active") or {}).get("source_month")),
+                _fmt((entry.get("previous") or {}).get("source_month")),
+            )
+        console.print(h)
+
 
 async def _cmd_validate_async(_args) -> int:
+    from src.blue_green.validator import BlueGreenValidator
+
     config = _build_db_config()
     validator = BlueGreenValidator(config)
-    console.print("\n[bold]Validando receita_federal_staging...[/bold]\n")
-    result = await validator.validate()
+    db_name, schema = staging_target()
+    active_db, active_schema = active_target()
+    console.print(f"\n[bold]Validando {schema or db_name}...[/bold]\n")
+    result = await validator.validate(
+        db_name, schema=schema, active_db=active_db, active_schema=active_schema
+    )
 
     if result.is_valid:
         console.print(f"[bold green]✅ {result.summary}[/bold green]")
@@ -88,25 +141,96 @@ async def _cmd_validate_async(_args) -> int:
         console.print(f"[yellow]  Tabelas vazias: {', '.join(result.empty_tables)}[/yellow]")
     if result.missing_indexes:
         console.print(f"[red]  Índices ausentes: {', '.join(result.missing_indexes)}[/red]")
+    if result.invalid_indexes:
+        console.print(
+            f"[red]  Índices inválidos (build interrompido): {', '.join(result.invalid_indexes)}[/red]"
+        )
+    if result.deferred_indexes:
+        console.print(
+            f"[blue]  Índices adiados para depois do switch: {', '.join(result.deferred_indexes)}[/blue]"
+        )
+    if result.not_finalized:
+        console.print(
+            "[red]  Finalização pendente: o ETL não concluiu o VACUUM (FREEZE, ANALYZE)[/red]"
+        )
+    for issue in result.ledger_issues:
+        console.print(f"[red]  Carga incompleta — {issue}[/red]")
+    for issue in result.row_deltas:
+        console.print(f"[red]  Contagem fora do limite — {issue}[/red]")
+    for issue in result.profile_issues:
+        console.print(f"[red]  Perfil da amostra — {issue}[/red]")
     return 1
 
 
 def cmd_validate(args) -> None:
-    sys.exit(asyncio.run(_cmd_validate_async(args)))
+    sys.exit(_run(_cmd_validate_async(args)))
+
+
+async def _cmd_smoke_async(_args) -> int:
+    from src.validation.smoke import smoke_test
+
+    console.print("\n[bold]Teste de fumaça de desempenho (staging x ativo)...[/bold]\n")
+    result = await smoke_test(_build_db_config(), staging_target(), active_target())
+
+    t = Table(show_header=True, header_style="bold cyan")
+    t.add_column("Consulta")
+    t.add_column("Staging p50/p95 (ms)", justify="right")
+    t.add_column("Ativo p50/p95 (ms)", justify="right")
+    for name, s in result.staging.items():
+        a = result.active.get(name)
+        t.add_row(
+            name,
+            f"{s.p50():.1f} / {s.p95():.1f}" if s.latencies else _fmt(s.error),
+            f"{a.p50():.1f} / {a.p95():.1f}" if a and a.latencies else _fmt(a and a.error),
+        )
+    console.print(t)
+    if result.skipped:
+        console.print(f"[dim]Puladas (índice adiado): {', '.join(result.skipped)}[/dim]")
+
+    if result.passed:
+        console.print("[bold green]✅ Staging sem regressão de desempenho[/bold green]")
+        return 0
+    for issue in result.issues:
+        console.print(f"[red]  {issue}[/red]")
+    return 1
+
+
+def cmd_smoke(args) -> None:
+    sys.exit(_run(_cmd_smoke_async(args)))
 
 
 async def _cmd_switch_async(args) -> int:
+    from src.blue_green.schema_switch import create_switcher
+
     config = _build_db_config()
     sm = StateManager()
-    switcher = BlueGreenSwitcher(config, sm)
+    switcher = create_switcher(config, sm)
 
     console.print("\n[bold]Executando blue-green switch...[/bold]\n")
-    result = await switcher.switch(force=args.force)
+    result = await switcher.switch(
+        force=args.force,
+        drain_seconds=args.drain_seconds,
+        retention_hours=args.retain_hours,
+        warmup=not args.no_warmup,
+    )
 
     if result.success:
         console.print(f"[bold green]✅ {result.message}[/bold green]")
         if result.source_month:
             console.print(f"[green]   Mês dos dados: {result.source_month}[/green]")
+        if result.unavailable_seconds is not None:
+            console.print(
+                f"[green]   Banco indisponível por {result.unavailable_seconds:.2f}s "
+                f"({result.terminated} conexão(ões) encerrada(s) no prazo)[/green]"
+            )
+        if result.warmup and result.warmup.skipped:
+            console.print(f"[yellow]   Cache não aquecido — {result.warmup.skipped}[/yellow]")
+        elif result.warmup:
+            console.print(
+                f"[green]   Cache aquecido: {result.warmup.gb:.1f} GB em "
+                f"{result.warmup.seconds:.0f}s ({result.warmup.hot_ranges} faixa(s) "
+                "quente(s) do ativo anterior)[/green]"
+            )
         return 0
 
     console.print(f"[bold red]❌ {result.message}[/bold red]")
@@ -114,18 +238,141 @@ async def _cmd_switch_async(args) -> int:
 
 
 def cmd_switch(args) -> None:
-    sys.exit(asyncio.run(_cmd_switch_async(args)))
+    sys.exit(_run(_cmd_switch_async(args)))
+
+
+async def _cmd_rollback_async(args) -> int:
+    from src.blue_green.schema_switch import create_switcher
+
+    switcher = create_switcher(_build_db_config(), StateManager())
+
+    console.print("\n[bold]Voltando para a carga anterior...[/bold]\n")
+    result = await switcher.rollback(drain_seconds=args.drain_seconds)
+
+    if not result.success:
+        console.print(f"[bold red]❌ {result.message}[/bold red]")
+        return 1
+    console.print(f"[bold green]✅ {result.message}[/bold green]")
+    if result.source_month:
+        console.print(f"[green]   Mês dos dados: {result.source_month}[/green]")
+    if result.unavailable_seconds is not None:
+        console.print(
+            f"[green]   Banco indisponível por {result.unavailable_seconds:.2f}s "
+            f"({result.terminated} conexão(ões) encerrada(s) no prazo)[/green]"
+        )
+    return 0
 
 
-async def _cmd_cleanup_async(_args) -> None:
+def cmd_rollback(args) -> None:
+    sys.exit(_run(_cmd_rollback_async(args)))
+
+
+async def _cmd_cleanup_async(args) -> None:
+    from src.blue_green.schema_switch import create_switcher
+
     config = _build_db_config()
     sm = StateManager()
-    switcher = BlueGreenSwitcher(config, sm)
+    switcher = create_switcher(config, sm)
+    if args.expired:
+        reason = await switcher.expire_old()
+        if reason:
+            console.print(f"[green]Carga anterior dropada — {reason}[/green]")
+        else:
+            console.print("[blue]Janela de rollback ainda aberta (ou nada retido)[/blue]")
+        return
     await switcher.cleanup_old()
 
 
 def cmd_cleanup(args) -> None:
-    asyncio.run(_cmd_cleanup_async(args))
+    _run(_cmd_cleanup_async(args))
+
+
+async def _cmd_setup_schemas_async(_args) -> int:
+    from src.blue_green.schema_switch import SchemaSwitcher, schema_layout
+
+    switcher = SchemaSwitcher(_build_db_config(), StateManager())
+    console.print("\n[bold]Migrando receita_federal para o layout por schemas...[/bold]\n")
+    moved = await switcher.setup()
+    if moved:
+        console.print(f"[green]✅ Tabelas movidas para o schema ativo: {', '.join(moved)}[/green]")
+    else:
+        console.print("[blue]Nenhuma tabela em public — layout já migrado[/blue]")
+    console.print("[yellow]Clientes conectados antes da migração precisam reconectar.[/yellow]")
+    if not schema_layout():
+        console.print("[yellow]Defina BLUE_GREEN_LAYOUT=schema no .env para usar o layout.[/yellow]")
+    return 0
+
+
+def cmd_setup_schemas(args) -> None:
+    sys.exit(_run(_cmd_setup_schemas_async(args)))
+
+
+async def _cmd_build_deferred_async(_args) -> int:
+    from src.indexes.deferred import build_deferred_indexes
+
+    database, schema = active_target()
+    console.print(f"\n[bold]Criando índices adiados em {schema or database}...[/bold]\n")
+    results = await build_deferred_indexes(
+        _build_db_config(), database, schema, StateManager()
+    )
+    for name, status, seconds in results:
+        if status == "created":
+            console.print(f"[green]✅ {name} criado em {seconds / 60:.1f} min[/green]")
+        elif status == "exists":
+            console.print(f"[blue]  {name} já existia[/blue]")
+        else:
+            console.print(f"[red]❌ {name} falhou[/red]")
+    return 1 if any(status == "failed" for _, status, _ in results) else 0
+
+
+def cmd_build_deferred(args) -> None:
+    sys.exit(_run(_cmd_build_deferred_async(args)))
+
+
+async def _cmd_change_feed_async(args) -> int:
+    from src.blue_green.change_feed import ChangeFeedExporter
+
+    config = _build_db_config()
+    exporter = ChangeFeedExporter(config, StateManager())
+
+    # Padrão: ativo e staging do layout (bancos, ou schemas do mesmo banco)
+    active_db, active_schema = active_target()
+    staging_db, staging_schema = staging_target()
+    old = (args.old_db or active_db, args.old_schema or active_schema)
+    new = (args.new_db or staging_db, args.new_schema or staging_schema)
+
+    console.print(
+        f"\n[bold]Gerando change feed {_label(old)} → {_label(new)}...[/bold]\n"
+    )
+    result = await exporter.export(
+        output_dir=args.output,
+        fmt=args.format,
+        old=old,
+        new=new,
+        tables=args.tables,
+    )
+
+    t = Table(show_header=True, header_style="bold cyan")
+    t.add_column("Tabela")
+    t.add_column("Inclusões", justify="right")
+    t.add_column("Remoções", justify="right")
+    t.add_column("Alterações", justify="right")
+    for table, counts in result.counts.items():
+        t.add_row(
+            table,
+            f"{counts['insert']:,}",
+            f"{counts['delete']:,}",
+            f"{counts['update']:,}",
+        )
+    console.print(t)
+    console.print(
+        f"[green]✅ {len(result.files)} arquivo(s) gravado(s) em {result.output_dir}[/green]"
+    )
+    return 0
+
+
+def cmd_change_feed(args) -> None:
+    sys.exit(_run(_cmd_change_feed_async(args)))
 
 
 def main() -> None:
@@ -137,21 +384,103 @@ def main() -> None:
 
     sub.add_parser("status", help="Exibe estado atual dos slots ativo e staging")
 
-    sub.add_parser("validate", help="Valida receita_federal_staging antes do switch")
+    sub.add_parser("validate", help="Valida a staging (banco ou schema) antes do switch")
+
+    sub.add_parser(
+        "smoke", help="Compara latência e planos de consultas típicas entre staging e ativo"
+    )
 
     switch_p = sub.add_parser("switch", help="Valida e promove staging para ativo")
     switch_p.add_argument(
         "--force", action="store_true", help="Pula validação e força o switch"
     )
+    switch_p.add_argument(
+        "--retain-hours",
+        type=float,
+        default=None,
+        help=(
+            "Mantém o ativo anterior para rollback por N horas "
+            "(padrão: ROLLBACK_RETENTION_HOURS ou 0 — drop imediato)"
+        ),
+    )
+    switch_p.add_argument(
+        "--no-warmup",
+        action="store_true",
+        dest="no_warmup",
+        help="Não aquece o cache do banco promovido (pg_prewarm) antes de concluir",
+    )
+    switch_p.add_argument(
+        "--drain-seconds",
+        type=float,
+        default=None,
+        help=(
+            "Prazo para as transações em andamento no banco ativo terminarem "
+            "antes do switch (padrão: SWITCH_DRAIN_SECONDS ou 60)"
+        ),
+    )
+
+    rollback_p = sub.add_parser(
+        "rollback", help="Volta para o ativo anterior retido (desfaz o último switch)"
+    )
+    rollback_p.add_argument(
+        "--drain-seconds",
+        type=float,
+        default=None,
+        help="Prazo para as transações em andamento terminarem (padrão: SWITCH_DRAIN_SECONDS ou 60)",
+    )
+
+    cleanup_p = sub.add_parser(
+        "cleanup", help="Dropa a carga anterior (banco ou schema _old) se existir"
+    )
+    cleanup_p.add_argument(
+        "--expired",
+        action="store_true",
+        help="Só dropa se a janela de rollback acabou (prazo ou disco livre)",
+    )
+
+    sub.add_parser(
+        "setup-schemas",
+        help="Migração única para o layout por schemas (BLUE_GREEN_LAYOUT=schema)",
+    )
 
-    sub.add_parser("cleanup", help="Dropa receita_federal_old se existir")
+    sub.add_parser(
+        "build-deferred",
+        help="Cria no banco ativo, com CONCURRENTLY, os índices adiados pelo ETL com --defer-indexes",
+    )
+
+    feed_p = sub.add_parser(
+        "change-feed",
+        help="Exporta as linhas incluídas, removidas e alteradas entre ativo e staging",
+    )
+    feed_p.add_argument(
+        "--output", default="change_feed", help="Diretório de saída (padrão: change_feed)"
+    )
+    feed_p.add_argument(
+        "--format", choices=["parquet", "jsonl"], default="parquet", help="Formato dos arquivos"
+    )
+    feed_p.add_argument("--old-db", help="Banco da carga anterior (padrão: o do ativo)")
+    feed_p.add_argument(
+        "--old-schema", help="Schema da carga anterior (padrão: o do ativo no layout por schemas)"
+    )
+    feed_p.add_argument("--new-db", help="Banco da carga nova (padrão: o da staging)")
+    feed_p.add_argument(
+        "--new-schema", help="Schema da carga nova (padrão: o da staging no layout por schemas)"
+    )
+    feed_p.add_argument(
+        "--tables", nargs="+", help="Tabelas de fato a comparar (padrão: todas)"
+    )
 
     args = parser.parse_args()
     {
         "status": cmd_status,
         "validate": cmd_validate,
+        "smoke": cmd_smoke,
         "switch": cmd_switch,
+        "rollback": cmd_rollback,
         "cleanup": cmd_cleanup,
+        "setup-schemas": cmd_setup_schemas,
+        "build-deferred": cmd_build_deferred,
+        "change-feed": cmd_change_feed,
     }[args.command](args)
 
 
@@ -1,3 +1,5 @@
+from src.indexes.catalog import index_names
+
 EXPECTED_TABLES = [
     "empresa",
     "estabelecimento",
@@ -11,14 +13,21 @@ EXPECTED_TABLES = [
     "qualificacao",
 ]
 
-EXPECTED_INDEXES = [
-    "empresa_cnpj",
-    "estabelecimento_cnpj",
-    "estabelecimento_cnpj_completo",
-    "socios_cnpj",
-    "simples_cnpj",
-    "estabelecimento_situacao",
-    "estabelecimento_municipio",
-    "empresa_razao_social_trgm",
-    "estabelecimento_nome_fantasia_trgm",
-]
+# Schemas do layout blue-green por schemas (BLUE_GREEN_LAYOUT=schema), todos
+# no banco receita_federal — ver src/blue_green/schema_switch.py
+ACTIVE_SCHEMA = "cnpj"
+STAGING_SCHEMA = "cnpj_staging"
+OLD_SCHEMA = "cnpj_old"
+
+# Índices que a staging precisa ter antes do switch (src/indexes/catalog.py)
+EXPECTED_INDEXES = index_names()
+
+# Chave natural de cada tabela de fato — usada pela carga incremental (row_hash).
+# socios não tem chave natural: a própria linha (row_hash) identifica o registro,
+# então uma alteração em socios aparece como remoção + inclusão.
+FACT_TABLE_KEYS = {
+    "empresa": ["cnpj_basico"],
+    "estabelecimento": ["cnpj_basico", "cnpj_ordem", "cnpj_dv"],
+    "socios": ["cnpj_basico", "row_hash"],
+    "simples": ["cnpj_basico"],
+}
@@ -0,0 +1,31 @@
+"""
+Onde ficam ativo e staging no layout blue-green configurado
+(`BLUE_GREEN_LAYOUT`): bancos separados ou schemas de `receita_federal`.
+
+Só variáveis de ambiente e constantes — sem asyncpg —, para o `status` da CLI
+mostrar os nomes certos sem pagar os imports do switch.
+"""
+
+import os
+
+from src.blue_green.constants import ACTIVE_SCHEMA, STAGING_SCHEMA
+
+_ACTIVE_DB = "receita_federal"
+_STAGING_DB = "receita_federal_staging"
+
+
+def schema_layout() -> bool:
+    """Layout blue-green configurado: por schemas (True) ou por bancos."""
+    return os.getenv("BLUE_GREEN_LAYOUT", "database").strip().lower() == "schema"
+
+
+def staging_target() -> tuple[str, str | None]:
+    """(banco, schema) onde o ETL carrega e o validador confere a staging."""
+    if schema_layout():
+        return _ACTIVE_DB, STAGING_SCHEMA
+    return _STAGING_DB, None
+
+
+def active_target() -> tuple[str, str | None]:
+    """(banco, schema) do ativo — referência da validação da staging."""
+    return _ACTIVE_DB, ACTIVE_SCHEMA if schema_layout() else None
@@ -0,0 +1,147 @@
+"""
+Relocação da staging para o disco principal, relação por relação.
+
+Com `STAGING_TABLESPACE` o ETL grava tabelas e índices da staging num volume
+separado (`default_tablespace` nas conexões da carga; o banco em si nasce no
+pg_default). Antes do switch, `relocate_relations` traz cada tabela e cada
+índice para o disco principal com `ALTER TABLE/INDEX ... SET TABLESPACE`,
+várias sessões em paralelo — a vazão acompanha o disco, não um backend só, e a
+produção não é tocada: o switch continua sendo só o rename.
+
+As maiores relações saem primeiro, para as sessões terminarem juntas. Um
+`ALTER` trava a relação (e a tabela de um índice) durante a cópia, o que na
+staging não incomoda ninguém. Cada relação movida já está no destino: uma
+relocação interrompida é retomada de onde parou.
+
+Antes do switch o disco principal precisa comportar ativo e staging juntos
+(`relocation_size`). Quando não comporta, o run_prod.py reloca o ativo logo
+depois do switch, com o anterior já dropado: aí cada tabela fica travada só
+durante a própria cópia — sem encerrar conexões nem parar o banco inteiro.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+
+import asyncpg
+
+# Sessões copiando relações ao mesmo tempo
+RELOCATE_WORKERS = int(os.getenv("RELOCATE_WORKERS", 4))
+
+_KIND = {"r": "TABLE", "m": "MATERIALIZED VIEW", "i": "INDEX"}
+
+
+@dataclass
+class RelocationReport:
+    tablespace: str
+    # (relação, bytes, segundos)
+    moved: list = field(default_factory=list)
+    # (relação, erro)
+    failed: list = field(default_factory=list)
+    seconds: float = 0.0
+    # Tablespace padrão do banco, quando não é o destino (staging criada com
+    # CREATE DATABASE ... TABLESPACE): o catálogo continua nele
+    database_tablespace: str | None = None
+
+    @property
+    def gb(self) -> float:
+        return sum(size for _, size, _ in self.moved) / 1024**3
+
+
+async def pending_relations(conn, tablespace: str):
+    """Tabelas e índices do schema atual fora de `tablespace`, maiores primeiro."""
+    return await conn.fetch(
+        """
+        SELECT c.relname, c.relkind, pg_table_size(c.oid) AS bytes
+        FROM pg_class c
+        JOIN pg_database d ON d.datname = current_database()
+        WHERE c.relnamespace = current_schema()::regnamespace
+          AND c.relkind IN ('r', 'm', 'i')
+          AND COALESCE(NULLIF(c.reltablespace, 0), d.dattablespace)
+              <> (SELECT oid FROM pg_tablespace WHERE spcname = $1)
+        ORDER BY 3 DESC
+        """,
+        tablespace,
+    )
+
+
+async def _connect(db_config, database, schema):
+    return await asyncpg.connect(
+        **db_config,
+        database=database,
+        timeout=30,
+        server_settings={"search_path": f'"{schema}", public'} if schema else None,
+    )
+
+
+async def relocation_size(
+    db_config: dict, database: str, schema: str | None = None, tablespace: str = "pg_default"
+) -> int:
+    """Bytes que a relocação de `database`/`schema` copiaria para `tablespace`."""
+    conn = await _connect(db_config, database, schema)
+    try:
+        return sum(r["bytes"] for r in await pending_relations(conn, tablespace))
+    finally:
+        await conn.close()
+
+
+async def _worker(connect, queue, tablespace, report):
+    conn = await connect()
+    try:
+        while True:
+            try:
+                rel = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.monotonic()
+            try:
+                await conn.execute(
+                    f'ALTER {_KIND[rel["relkind"]]} "{rel["relname"]}" '
+                    f'SET TABLESPACE "{tablespace}"',
+                    timeout=None,
+                )
+                report.moved.append((rel["relname"], rel["bytes"], time.monotonic() - start))
+            except asyncpg.PostgresError as e:
+                report.failed.append((rel["relname"], str(e)))
+    finally:
+        await conn.close()
+
+
+async def relocate_relations(
+    db_config: dict,
+    database: str,
+    schema: str | None = None,
+    tablespace: str = "pg_default",
+    workers: int = RELOCATE_WORKERS,
+) -> RelocationReport:
+    """Move para `tablespace` tudo o que `database`/`schema` tem fora dele."""
+
+    async def connect():
+        return await _connect(db_config, database, schema)
+
+    report = RelocationReport(tablespace)
+    start = time.monotonic()
+    conn = await connect()
+    try:
+        pending = await pending_relations(conn, tablespace)
+        default = await conn.fetchval(
+            """
+            SELECT t.spcname FROM pg_database d
+            JOIN pg_tablespace t ON t.oid = d.dattablespace
+            WHERE d.datname = current_database()
+            """
+        )
+    finally:
+        await conn.close()
+    if default != tablespace:
+        report.database_tablespace = default
+
+    queue = asyncio.Queue()
+    for rel in pending:
+        queue.put_nowait(rel)
+    await asyncio.gather(
+        *(_worker(connect, queue, tablespace, report) for _ in range(min(workers, len(pending))))
+    )
+    report.seconds = time.monotonic() - start
+    return report
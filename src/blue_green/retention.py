@@ -0,0 +1,51 @@
+"""
+Janela de rollback: por quanto tempo o ativo anterior (receita_federal_old,
+ou o schema cnpj_old) sobrevive ao switch.
+
+- `ROLLBACK_RETENTION_HOURS` (padrão 0): prazo de retenção. Com 0 o ativo
+  anterior é dropado logo depois do switch, como sempre foi.
+- `ROLLBACK_MIN_FREE_GB` (padrão 0, desligado): o ativo anterior é dropado
+  antes do prazo se o disco do Postgres (`PG_DATA_DIR`) ficar com menos que
+  isso livre — a próxima staging precisa do espaço.
+
+O prazo é conferido por `expire_old` dos switchers: no início do run_prod.py
+(antes do ETL ocupar disco) e em `cli.py cleanup --expired`.
+"""
+
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+
+RETENTION_HOURS = float(os.getenv("ROLLBACK_RETENTION_HOURS", 0))
+MIN_FREE_GB = float(os.getenv("ROLLBACK_MIN_FREE_GB", 0))
+# Diretório de dados do Postgres — só vale com o banco na mesma máquina
+PG_DATA_DIR = os.getenv("PG_DATA_DIR", "/var/lib/postgresql")
+
+
+def retained_until(hours: float = None) -> str | None:
+    """Prazo de retenção a partir de agora (ISO), ou None sem retenção."""
+    hours = RETENTION_HOURS if hours is None else hours
+    if hours <= 0:
+        return None
+    until = datetime.now(timezone.utc) + timedelta(hours=hours)
+    return until.replace(microsecond=0).isoformat()
+
+
+def free_disk_gb(path: str = PG_DATA_DIR) -> float | None:
+    if not os.path.exists(path):
+        return None
+    return shutil.disk_usage(path).free / 1024**3
+
+
+def expiry_reason(previous: dict | None) -> str | None:
+    """Por que o ativo anterior deve ser dropado agora (None: manter)."""
+    until = (previous or {}).get("retained_until")
+    if not until:
+        return "sem prazo de retenção registrado"
+    if datetime.now(timezone.utc) >= datetime.fromisoformat(until):
+        return f"prazo de retenção vencido em {until}"
+    if MIN_FREE_GB > 0:
+        free = free_disk_gb()
+        if free is not None and free < MIN_FREE_GB:
+            return f"{free:.1f} GB livres em {PG_DATA_DIR}, abaixo de {MIN_FREE_GB:g} GB"
+    return None
@@ -0,0 +1,271 @@
+"""
+Blue-green por schemas: ativo e staging convivem no mesmo banco.
+
+No layout por bancos (src/blue_green/switch.py) o switch renomeia bancos, o
+que exige derrubar todas as conexões do banco ativo — a API vê um pico de
+erros a cada mês. Aqui os dados ficam em schemas de `receita_federal`:
+
+- `cnpj` (ACTIVE_SCHEMA): o que os clientes leem. O banco tem
+  `search_path = cnpj, public`, então as consultas continuam sem qualificar
+  as tabelas;
+- `cnpj_staging` (STAGING_SCHEMA): onde o ETL carrega
+  (`--db-target receita_federal --db-schema cnpj_staging`);
+- `cnpj_old` (OLD_SCHEMA): o ativo anterior, logo depois do switch ou
+  durante a janela de rollback (src/blue_green/retention.py).
+
+O switch é uma transação com dois `ALTER SCHEMA ... RENAME` — só catálogo,
+sem lock nas tabelas. Conexões abertas continuam de pé: o Postgres guarda o
+search_path dos planos em cache como OIDs de schema e, com o rename, replaneja
+os prepared statements contra as tabelas novas na próxima execução.
+
+As extensões (pg_trgm) ficam em `public`, fora da troca. Ative com
+`BLUE_GREEN_LAYOUT=schema` no .env, depois de migrar uma vez o banco ativo com
+`uv run src/blue_green/cli.py setup-schemas`.
+"""
+
+import asyncpg
+
+from src.blue_green.constants import (
+    ACTIVE_SCHEMA,
+    EXPECTED_TABLES,
+    OLD_SCHEMA,
+    STAGING_SCHEMA,
+)
+from src.blue_green.layout import _ACTIVE_DB, active_target, schema_layout, staging_target
+from src.blue_green.retention import expiry_reason, retained_until
+from src.blue_green.state import StateManager
+from src.blue_green.switch import BlueGreenSwitcher, SwitchResult
+from src.blue_green.validator import BlueGreenValidator
+from src.blue_green.warmup import snapshot_active, warm_active
+
+# Tabelas movidas para ACTIVE_SCHEMA na migração: dados e controle do ETL
+LAYOUT_TABLES = EXPECTED_TABLES + ["etl_metadados", "etl_lotes"]
+
+# Espera máxima por locks no switch e no DROP do schema antigo: uma consulta
+# longa no ativo anterior adia o DROP (fica para o `cleanup`), não o switch
+LOCK_TIMEOUT = "5s"
+
+
+def create_switcher(db_config: dict, state_manager: StateManager):
+    if schema_layout():
+        return SchemaSwitcher(db_config, state_manager)
+    return BlueGreenSwitcher(db_config, state_manager)
+
+
+async def _schema_exists(conn, name: str) -> bool:
+    return bool(
+        await conn.fetchval("SELECT 1 FROM pg_namespace WHERE nspname = $1", name)
+    )
+
+
+async def ensure_staging_schema(conn, schema: str) -> None:
+    """
+    Prepara `schema` para a carga do ETL. Recusa um banco ainda não migrado:
+    com tabelas em `public`, os DROP TABLE sem schema do ETL poderiam
+    alcançá-las pelo search_path.
+    """
+    leftovers = await conn.fetch(
+        """
+        SELECT tablename FROM pg_tables
+        WHERE schemaname = 'public' AND tablename = ANY($1::text[])
+        """,
+        LAYOUT_TABLES,
+    )
+    if leftovers:
+        raise RuntimeError(
+            "Tabelas do CNPJ ainda em 'public' "
+            f"({', '.join(r['tablename'] for r in leftovers)}) — "
+            "rode antes: uv run src/blue_green/cli.py setup-schemas"
+        )
+    # Extensões em public: sobrevivem à troca e ao DROP dos schemas
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public")
+    await conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+
+
+class SchemaSwitcher:
+    def __init__(self, db_config: dict, state_manager: StateManager, database: str = _ACTIVE_DB):
+        self._config = db_config
+        self._state = state_manager
+        self._database = database
+
+    async def _conn(self):
+        return await asyncpg.connect(**self._config, database=self._database, timeout=30)
+
+    async def _drop_schema(self, conn, schema: str) -> bool:
+        """DROP SCHEMA ... CASCADE; False se uma consulta ainda segura as tabelas."""
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                await conn.execute(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE')
+            return True
+        except asyncpg.LockNotAvailableError:
+            return False
+
+    async def setup(self) -> list:
+        """
+        Migração única para o layout por schemas: move as tabelas de `public`
+        para ACTIVE_SCHEMA (só catálogo — índices vão junto) e fixa o
+        search_path do banco. Vale para conexões novas: clientes conectados
+        durante a migração precisam reconectar esta última vez.
+        """
+        conn = await self._conn()
+        try:
+            async with conn.transaction():
+                await conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{ACTIVE_SCHEMA}"')
+                moved = [
+                    r["tablename"]
+                    for r in await conn.fetch(
+                        """
+                        SELECT tablename FROM pg_tables
+                        WHERE schemaname = 'public' AND tablename = ANY($1::text[])
+                        """,
+                        LAYOUT_TABLES,
+                    )
+                ]
+                for table in moved:
+                    await conn.execute(f'ALTER TABLE public."{table}" SET SCHEMA "{ACTIVE_SCHEMA}"')
+                await conn.execute(
+                    f'ALTER DATABASE "{self._database}" SET search_path = "{ACTIVE_SCHEMA}", public'
+                )
+            return moved
+        finally:
+            await conn.close()
+
+    async def _rename_pair(self, conn, park_as: str, promote: str) -> None:
+        """Ativo vira `park_as` e `promote` vira o ativo, numa transação."""
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+            if await _schema_exists(conn, ACTIVE_SCHEMA):
+                await conn.execute(f'ALTER SCHEMA "{ACTIVE_SCHEMA}" RENAME TO "{park_as}"')
+            await conn.execute(f'ALTER SCHEMA "{promote}" RENAME TO "{ACTIVE_SCHEMA}"')
+
+    async def switch(
+        self,
+        force: bool = False,
+        drain_seconds: float = None,
+        retention_hours: float = None,
+        warmup: bool = True,
+    ) -> SwitchResult:
+        # `drain_seconds` existe pela interface comum com BlueGreenSwitcher: a
+        # troca de schemas não bloqueia logins, não há o que drenar
+        if not force:
+            validator = BlueGreenValidator(self._config)
+            result = await validator.validate(
+                self._database,
+                schema=STAGING_SCHEMA,
+                active_db=self._database,
+                active_schema=ACTIVE_SCHEMA,
+            )
+            if not result.is_valid:
+                return SwitchResult(success=False, message=result.summary)
+
+        conn = await self._conn()
+        try:
+            if not await _schema_exists(conn, STAGING_SCHEMA):
+                return SwitchResult(
+                    success=False,
+                    message=f"Schema '{STAGING_SCHEMA}' não encontrado — execute o ETL primeiro",
+                )
+
+            # Só um ativo anterior por vez: o retido do switch passado sai
+            if not await self._drop_schema(conn, OLD_SCHEMA):
+                return SwitchResult(
+                    success=False,
+                    message=f"'{OLD_SCHEMA}' ainda em uso por uma consulta — tente de novo",
+                )
+
+            # Foto do cache do ativo enquanto ainda atende — guia o aquecimento
+            snapshot = (
+                await snapshot_active(self._config, self._database, ACTIVE_SCHEMA)
+                if warmup
+                else None
+            )
+
+            # A troca: dois renames na mesma transação, sem derrubar ninguém
+            await self._rename_pair(conn, OLD_SCHEMA, STAGING_SCHEMA)
+
+            until = retained_until(retention_hours)
+            self._state.promote_staging(retained_until=until)
+            staging_info = self._state.get_active() or {}
+
+            warmed = (
+                await warm_active(self._config, self._database, ACTIVE_SCHEMA, snapshot)
+                if warmup
+                else None
+            )
+
+            message = f"Switch concluído — '{ACTIVE_SCHEMA}' agora contém os dados novos"
+            if until:
+                message += f"; '{OLD_SCHEMA}' mantido para rollback até {until}"
+            elif not await self._drop_schema(conn, OLD_SCHEMA):
+                message += f" ('{OLD_SCHEMA}' ainda em uso — remova depois com cleanup)"
+
+            return SwitchResult(
+                success=True,
+                message=message,
+                source_month=staging_info.get("source_month"),
+                warmup=warmed,
+            )
+        except Exception as e:
+            return SwitchResult(success=False, message=f"Erro durante o switch: {e}")
+        finally:
+            await conn.close()
+
+    async def rollback(self, drain_seconds: float = None) -> SwitchResult:
+        """Ativo anterior retido volta a ser o ativo; a carga desfeita vira staging."""
+        conn = await self._conn()
+        try:
+            if not await _schema_exists(conn, OLD_SCHEMA):
+                return SwitchResult(
+                    success=False,
+                    message=f"'{OLD_SCHEMA}' não existe — não há carga anterior para voltar",
+                )
+            if await _schema_exists(conn, STAGING_SCHEMA):
+                return SwitchResult(
+                    success=False,
+                    message=f"'{STAGING_SCHEMA}' existe — remova-o antes do rollback",
+                )
+            await self._rename_pair(conn, STAGING_SCHEMA, OLD_SCHEMA)
+            self._state.rollback()
+            active = self._state.get_active() or {}
+            return SwitchResult(
+                success=True,
+                message=(
+                    f"Rollback concluído — '{ACTIVE_SCHEMA}' voltou à carga anterior; "
+                    f"a carga desfeita está em '{STAGING_SCHEMA}'"
+                ),
+                source_month=active.get("source_month"),
+            )
+        except Exception as e:
+            return SwitchResult(success=False, message=f"Erro durante o rollback: {e}")
+        finally:
+            await conn.close()
+
+    async def expire_old(self) -> str | None:
+        """Dropa o ativo anterior se a janela de rollback acabou; devolve o motivo."""
+        conn = await self._conn()
+        try:
+            if not await _schema_exists(conn, OLD_SCHEMA):
+                self._state.clear_previous()
+                return None
+            reason = expiry_reason(self._state.get_previous())
+            if reason and await self._drop_schema(conn, OLD_SCHEMA):
+                self._state.clear_previous()
+                return reason
+            return None
+        finally:
+            await conn.close()
+
+    async def cleanup_old(self) -> None:
+        conn = await self._conn()
+        try:
+            if not await _schema_exists(conn, OLD_SCHEMA):
+                print(f"[blue-green] '{OLD_SCHEMA}' não existe — nada a fazer")
+                self._state.clear_previous()
+            elif await self._drop_schema(conn, OLD_SCHEMA):
+                print(f"[blue-green] '{OLD_SCHEMA}' dropado com sucesso")
+                self._state.clear_previous()
+            else:
+                print(f"[blue-green] '{OLD_SCHEMA}' ainda em uso por uma consulta — tente de novo")
+        finally:
+            await conn.close()
@@ -5,7 +5,17 @@ from pathlib import Path
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 _DEFAULT_STATE_FILE = _PROJECT_ROOT / "blue_green_state.json"
 
-_EMPTY_STATE = {"active": None, "staging": None, "last_switch": None}
+_EMPTY_STATE = {
+    "active": None,
+    "staging": None,
+    # Ativo anterior mantido para rollback (receita_federal_old), com prazo
+    "previous": None,
+    "last_switch": None,
+    # Switches e rollbacks, com os slots de cada momento — mais recentes no fim
+    "history": [],
+}
+
+_HISTORY_LIMIT = 24
 
 
 def _now_iso() -> str:
@@ -48,10 +58,32 @@ class StateManager:
             state["staging"]["processed_at"] = _now_iso()
             self._write(state)
 
-    def promote_staging(self) -> None:
+    def _record(self, state: dict, event: str, now: str) -> None:
+        history = state.get("history") or []
+        history.append(
+            {
+                "event": event,
+                "at": now,
+                "active": state.get("active"),
+                "previous": state.get("previous"),
+            }
+        )
+        state["history"] = history[-_HISTORY_LIMIT:]
+
+    def promote_staging(self, retained_until: str | None = None) -> None:
+        """
+        Staging vira ativo. Com `retained_until`, o ativo anterior fica em
+        `previous` (banco/schema _old) disponível para rollback até essa data.
+        """
         state = self.read()
         staging = state.get("staging") or {}
         now = _now_iso()
+        previous = state.get("active")
+        state["previous"] = (
+            {**previous, "database": "receita_federal_old", "retained_until": retained_until}
+            if previous and retained_until
+            else None
+        )
         state["active"] = {
             "database": "receita_federal",
             "source_month": staging.get("source_month"),
@@ -61,10 +93,63 @@ class StateManager:
         }
         state["staging"] = None
         state["last_switch"] = now
+        self._record(state, "switch", now)
+        self._write(state)
+
+    def rollback(self) -> None:
+        """
+        Ativo anterior volta a ser o ativo; a carga desfeita vira staging
+        (pode ser promovida de novo depois de corrigida).
+        """
+        state = self.read()
+        now = _now_iso()
+        rolled_back = state.get("active") or {}
+        previous = state.get("previous") or {}
+        state["staging"] = {
+            "database": "receita_federal_staging",
+            "source_month": rolled_back.get("source_month"),
+            "downloaded_at": rolled_back.get("downloaded_at"),
+            "processed_at": rolled_back.get("processed_at"),
+        }
+        state["active"] = {
+            "database": "receita_federal",
+            "source_month": previous.get("source_month"),
+            "downloaded_at": previous.get("downloaded_at"),
+            "processed_at": previous.get("processed_at"),
+            "switched_at": now,
+        }
+        state["previous"] = None
+        state["last_switch"] = now
+        self._record(state, "rollback", now)
+        self._write(state)
+
+    def update_capabilities(self, capabilities: dict, pending_indexes: list) -> None:
+        """
+        Capacidades de consulta do ativo (catálogo de índices) e os índices
+        que ainda faltam — na disponibilidade progressiva, os adiados.
+        """
+        state = self.read()
+        if not state.get("active"):
+            return
+        state["active"]["capabilities"] = capabilities
+        state["active"]["pending_indexes"] = pending_indexes
+        state["active"]["capabilities_at"] = _now_iso()
         self._write(state)
 
+    def clear_previous(self) -> None:
+        state = self.read()
+        if state.get("previous"):
+            state["previous"] = None
+            self._write(state)
+
     def get_active(self) -> dict | None:
         return self.read().get("active")
 
     def get_staging(self) -> dict | None:
         return self.read().get("staging")
+
+    def get_previous(self) -> dict | None:
+        return self.read().get("previous")
+
+    def get_history(self) -> list:
+        return self.read().get("history") or []
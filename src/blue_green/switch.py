@@ -1,13 +1,23 @@
-import asyncpg
+import asyncio
+import os
+import time
 from dataclasses import dataclass
 
+import asyncpg
+
+from src.blue_green.layout import _ACTIVE_DB, _STAGING_DB
+from src.blue_green.retention import expiry_reason, retained_until
 from src.blue_green.state import StateManager
 from src.blue_green.validator import BlueGreenValidator
+from src.blue_green.warmup import WarmupReport, snapshot_active, warm_active
 
-_ACTIVE_DB = "receita_federal"
-_STAGING_DB = "receita_federal_staging"
 _OLD_DB = "receita_federal_old"
 
+# Tempo que as transações em andamento no banco ativo têm para terminar antes
+# do switch; as que passarem disso são encerradas
+DRAIN_SECONDS = int(os.getenv("SWITCH_DRAIN_SECONDS", 60))
+_DRAIN_POLL_SECONDS = 2
+
 
 @dataclass
 class SwitchResult:
@@ -15,6 +25,20 @@ class SwitchResult:
     message: str
     active_db: str = _ACTIVE_DB
     source_month: str | None = None
+    # Janela em que o banco ativo recusou conexões (do bloqueio de logins ao
+    # rename da staging) e backends encerrados por não terminarem no prazo
+    unavailable_seconds: float | None = None
+    terminated: int = 0
+    # Aquecimento do cache do ativo novo, feito antes de reportar o switch
+    warmup: WarmupReport | None = None
+
+
+@dataclass
+class DrainReport:
+    seconds: float
+    # Transações que terminaram sozinhas durante a espera
+    finished: int
+    terminated: int
 
 
 class BlueGreenSwitcher:
@@ -40,11 +64,84 @@ class BlueGreenSwitcher:
             db_name,
         )
 
+    async def _sessions(self, conn, db_name: str):
+        return await conn.fetch(
+            """
+            SELECT pid, state, usename, application_name,
+                   EXTRACT(EPOCH FROM now() - xact_start)::float8 AS xact_age
+            FROM pg_stat_activity
+            WHERE datname = $1 AND pid <> pg_backend_pid() AND backend_type = 'client backend'
+            """,
+            db_name,
+        )
+
+    async def _drain_connections(self, conn, db_name: str, grace: float) -> DrainReport:
+        """
+        Espera as transações em andamento em `db_name` terminarem (até `grace`
+        segundos) e encerra só as que sobrarem. Logins novos já devem estar
+        bloqueados (ALLOW_CONNECTIONS false). Conexões ociosas, sem transação
+        aberta, não têm trabalho a perder e são encerradas de imediato.
+        """
+        start = time.monotonic()
+        deadline = start + grace
+        in_flight = set()
+        finished = 0
+        while True:
+            sessions = await self._sessions(conn, db_name)
+            busy = [r for r in sessions if r["xact_age"] is not None]
+            idle = [r["pid"] for r in sessions if r["xact_age"] is None]
+            if idle:
+                await conn.execute("SELECT pg_terminate_backend(pid) FROM unnest($1::int[]) pid", idle)
+            current = {r["pid"] for r in busy}
+            finished += len(in_flight - current)
+            in_flight = current
+            if not busy or time.monotonic() >= deadline:
+                break
+            oldest = max(busy, key=lambda r: r["xact_age"])
+            print(
+                f"[blue-green] drenando '{db_name}': {len(busy)} transação(ões) em andamento, "
+                f"{finished} concluída(s); mais antiga há {oldest['xact_age']:.0f}s "
+                f"({oldest['usename']}/{oldest['application_name'] or '—'}); "
+                f"prazo em {deadline - time.monotonic():.0f}s"
+            )
+            await asyncio.sleep(_DRAIN_POLL_SECONDS)
+
+        if busy:
+            print(f"[blue-green] prazo esgotado — encerrando {len(busy)} transação(ões)")
+            await self._terminate_connections(conn, db_name)
+        return DrainReport(time.monotonic() - start, finished, len(busy))
+
     async def _drop_db(self, conn, db_name: str) -> None:
         await self._terminate_connections(conn, db_name)
         await conn.execute(f'DROP DATABASE IF EXISTS "{db_name}"')
 
-    async def switch(self, force: bool = False) -> SwitchResult:
+    async def _swap(self, admin, grace: float, park_as: str, promote: str):
+        """
+        Troca o banco ativo: bloqueia logins, drena, renomeia o ativo para
+        `park_as` e `promote` para o nome do ativo. Devolve (segundos sem
+        aceitar conexões, DrainReport). O banco estacionado continua com
+        logins bloqueados.
+        """
+        blocked_at = time.monotonic()
+        await admin.execute(f'ALTER DATABASE "{_ACTIVE_DB}" ALLOW_CONNECTIONS false')
+        try:
+            drain = await self._drain_connections(admin, _ACTIVE_DB, grace)
+            await admin.execute(f'ALTER DATABASE "{_ACTIVE_DB}" RENAME TO "{park_as}"')
+        except Exception:
+            await admin.execute(f'ALTER DATABASE "{_ACTIVE_DB}" ALLOW_CONNECTIONS true')
+            raise
+        # O ativo anterior retido fica com logins bloqueados desde o switch
+        await admin.execute(f'ALTER DATABASE "{promote}" ALLOW_CONNECTIONS true')
+        await admin.execute(f'ALTER DATABASE "{promote}" RENAME TO "{_ACTIVE_DB}"')
+        return time.monotonic() - blocked_at, drain
+
+    async def switch(
+        self,
+        force: bool = False,
+        drain_seconds: float = None,
+        retention_hours: float = None,
+        warmup: bool = True,
+    ) -> SwitchResult:
         if not force:
             validator = BlueGreenValidator(self._config)
             result = await validator.validate(_STAGING_DB)
@@ -59,33 +156,99 @@ class BlueGreenSwitcher:
                     message=f"Staging '{_STAGING_DB}' não encontrada — execute o ETL primeiro",
                 )
 
-            # Invariante: nunca mais de 2 bancos — dropa old se existir
+            # Só um ativo anterior por vez: o retido do switch passado sai
             if await self._db_exists(admin, _OLD_DB):
                 await self._drop_db(admin, _OLD_DB)
 
-            # Encerra conexões no banco ativo antes do rename
-            await self._terminate_connections(admin, _ACTIVE_DB)
+            # Foto do cache do ativo enquanto ainda atende — guia o aquecimento
+            snapshot = await snapshot_active(self._config, _ACTIVE_DB) if warmup else None
 
-            await admin.execute(f'ALTER DATABASE "{_ACTIVE_DB}" RENAME TO "{_OLD_DB}"')
-            await admin.execute(f'ALTER DATABASE "{_STAGING_DB}" RENAME TO "{_ACTIVE_DB}"')
+            # Drena o banco ativo antes do rename: daqui até a staging assumir
+            # o nome, ninguém consegue conectar
+            grace = DRAIN_SECONDS if drain_seconds is None else drain_seconds
+            unavailable, drain = await self._swap(admin, grace, _OLD_DB, _STAGING_DB)
 
             # Atualiza estado antes do drop do old para não perder metadados se drop falhar
-            self._state.promote_staging()
+            until = retained_until(retention_hours)
+            self._state.promote_staging(retained_until=until)
             staging_info = (self._state.get_active() or {})
 
-            # Drop imediato do old — mantém invariante dos 2 bancos
-            await self._drop_db(admin, _OLD_DB)
+            warmed = await warm_active(self._config, _ACTIVE_DB, None, snapshot) if warmup else None
+
+            message = f"Switch concluído — '{_ACTIVE_DB}' agora contém os dados novos"
+            if until:
+                message += f"; '{_OLD_DB}' mantido para rollback até {until}"
+            else:
+                # Sem janela de rollback: drop imediato do old
+                await self._drop_db(admin, _OLD_DB)
 
             return SwitchResult(
                 success=True,
-                message=f"Switch concluído — '{_ACTIVE_DB}' agora contém os dados novos",
+                message=message,
                 source_month=staging_info.get("source_month"),
+                unavailable_seconds=unavailable,
+                terminated=drain.terminated,
+                warmup=warmed,
             )
         except Exception as e:
             return SwitchResult(success=False, message=f"Erro durante o switch: {e}")
         finally:
             await admin.close()
 
+    async def rollback(self, drain_seconds: float = None) -> SwitchResult:
+        """
+        Desfaz o último switch em segundos: o ativo anterior retido volta a
+        ser o ativo e a carga desfeita vira staging.
+        """
+        admin = await self._admin_conn()
+        try:
+            if not await self._db_exists(admin, _OLD_DB):
+                return SwitchResult(
+                    success=False,
+                    message=f"'{_OLD_DB}' não existe — não há carga anterior para voltar",
+                )
+            if await self._db_exists(admin, _STAGING_DB):
+                return SwitchResult(
+                    success=False,
+                    message=f"'{_STAGING_DB}' existe — remova-a antes do rollback",
+                )
+
+            grace = DRAIN_SECONDS if drain_seconds is None else drain_seconds
+            unavailable, drain = await self._swap(admin, grace, _STAGING_DB, _OLD_DB)
+            await admin.execute(f'ALTER DATABASE "{_STAGING_DB}" ALLOW_CONNECTIONS true')
+
+            self._state.rollback()
+            active = self._state.get_active() or {}
+            return SwitchResult(
+                success=True,
+                message=(
+                    f"Rollback concluído — '{_ACTIVE_DB}' voltou à carga anterior; "
+                    f"a carga desfeita está em '{_STAGING_DB}'"
+                ),
+                source_month=active.get("source_month"),
+                unavailable_seconds=unavailable,
+                terminated=drain.terminated,
+            )
+        except Exception as e:
+            return SwitchResult(success=False, message=f"Erro durante o rollback: {e}")
+        finally:
+            await admin.close()
+
+    async def expire_old(self) -> str | None:
+        """Dropa o ativo anterior se a janela de rollback acabou; devolve o motivo."""
+        admin = await self._admin_conn()
+        try:
+            if not await self._db_exists(admin, _OLD_DB):
+                self._state.clear_previous()
+                return None
+            reason = expiry_reason(self._state.get_previous())
+            if reason:
+                await self._drop_db(admin, _OLD_DB)
+                self._state.clear_previous()
+            return reason
+        finally:
+            await admin.close()
+
     async def cleanup_old(self) -> None:
         admin = await self._admin_conn()
         try:
@@ -94,5 +257,6 @@ class BlueGreenSwitcher:
                 print(f"[blue-green] '{_OLD_DB}' dropado com sucesso")
             else:
                 print(f"[blue-green] '{_OLD_DB}' não existe — nada a fazer")
+            self._state.clear_previous()
         finally:
             await admin.close()
@@ -1,7 +1,26 @@
-import asyncpg
+import asyncio
+import json
 from dataclasses import dataclass, field
 
+import asyncpg
+
 from src.blue_green.constants import EXPECTED_INDEXES, EXPECTED_TABLES
+from src.etl.finalize import FINALIZE_MARKER
+from src.indexes.deferred import DEFERRED_KEY
+from src.validation.ledger import reconcile
+from src.validation.profile import (
+    PROFILE,
+    compare_counts,
+    compare_profiles,
+    confirm_profile,
+    profile_table,
+)
+from src.validation.table_stats import table_stats
+
+# Conexões por banco: as verificações da staging rodam em paralelo; o ativo,
+# em produção, só cede duas para as contagens e amostras
+_STAGING_POOL_SIZE = 4
+_ACTIVE_POOL_SIZE = 2
 
 
 @dataclass
@@ -10,6 +29,22 @@ class ValidationResult:
     missing_tables: list = field(default_factory=list)
     empty_tables: list = field(default_factory=list)
     missing_indexes: list = field(default_factory=list)
+    # Índices com build interrompido (indisvalid/indisready falsos)
+    invalid_indexes: list = field(default_factory=list)
+    # Informativo: índices que o ETL deixou para depois do switch e ainda
+    # não existem (disponibilidade progressiva)
+    deferred_indexes: list = field(default_factory=list)
+    # Finalização do ETL (VACUUM FREEZE/ANALYZE) ainda não concluída
+    not_finalized: bool = False
+    # Divergências entre o livro de carga (etl_lotes) e o catálogo
+    ledger_issues: list = field(default_factory=list)
+    # Informativo: tabela → linhas com campo descartado no tratamento
+    rejected_rows: dict = field(default_factory=dict)
+    # Contagens e perfil de conteúdo (amostra) fora dos limites frente ao ativo
+    row_deltas: list = field(default_factory=list)
+    profile_issues: list = field(default_factory=list)
+    # Banco/schema ativo usado na comparação (None: não havia ativo)
+    compared_with: str | None = None
 
     @property
     def summary(self) -> str:
@@ -22,53 +57,179 @@ class ValidationResult:
             issues.append(f"Tabelas vazias: {', '.join(self.empty_tables)}")
         if self.missing_indexes:
             issues.append(f"Índices ausentes: {', '.join(self.missing_indexes)}")
+        if self.invalid_indexes:
+            issues.append(f"Índices inválidos: {', '.join(self.invalid_indexes)}")
+        if self.not_finalized:
+            issues.append("Finalização (VACUUM/ANALYZE) pendente")
+        if self.ledger_issues:
+            issues.append(f"Carga incompleta: {'; '.join(str(i) for i in self.ledger_issues)}")
+        if self.row_deltas:
+            issues.append(f"Contagens fora do limite: {'; '.join(self.row_deltas)}")
+        if self.profile_issues:
+            issues.append(f"Perfil da amostra: {'; '.join(self.profile_issues)}")
         return "INVALID — " + "; ".join(issues)
 
 
+async def _on(pool, fn, *args):
+    async with pool.acquire() as conn:
+        return await fn(conn, *args)
+
+
+async def _confirm(pool, active, staging_profile, active_profile):
+    async with pool.acquire() as staging_conn, active.acquire() as active_conn:
+        return await confirm_profile(staging_conn, active_conn, staging_profile, active_profile)
+
+
+async def _index_state(conn):
+    """
+    (ausentes, inválidos, adiados) entre os índices esperados no schema
+    atual. Adiados — gravados pelo ETL com --defer-indexes — não contam como
+    ausentes: são criados no banco já ativo.
+    """
+    deferred = set()
+    if await conn.fetchval("SELECT to_regclass('etl_metadados') IS NOT NULL"):
+        raw = await conn.fetchval("SELECT valor FROM etl_metadados WHERE chave = $1", DEFERRED_KEY)
+        deferred = set(json.loads(raw)) if raw else set()
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, i.indisvalid AND i.indisready AS valid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY($1::text[])
+          AND c.relnamespace = current_schema()::regnamespace
+        """,
+        EXPECTED_INDEXES,
+    )
+    found = {r["relname"]: r["valid"] for r in rows}
+    absent = [name for name in EXPECTED_INDEXES if name not in found]
+    missing = [name for name in absent if name not in deferred]
+    # Um CREATE INDEX CONCURRENTLY interrompido deixa o índice no catálogo,
+    # mas o planner nunca o usa
+    invalid = [name for name in EXPECTED_INDEXES if found.get(name) is False]
+    return missing, invalid, [name for name in absent if name in deferred]
+
+
+async def _finalized(conn):
+    # Sem o marcador o banco não tem estatísticas nem mapa de visibilidade —
+    # as primeiras consultas em produção pegariam planos ruins
+    return await conn.fetchval(
+        """
+        SELECT EXISTS(SELECT 1 FROM etl_metadados WHERE chave = $1)
+        FROM (SELECT to_regclass('etl_metadados') AS t) m WHERE m.t IS NOT NULL
+        """,
+        FINALIZE_MARKER,
+    )
+
+
 class BlueGreenValidator:
     def __init__(self, db_config: dict):
         self._config = db_config
 
-    async def validate(self, db_name: str = "receita_federal_staging") -> ValidationResult:
+    async def _pool(self, db_name, schema, size):
+        # Layout por schemas: staging e ativo são schemas do mesmo banco
+        return await asyncpg.create_pool(
+            **self._config,
+            database=db_name,
+            min_size=1,
+            max_size=size,
+            timeout=30,
+            server_settings={"search_path": schema} if schema else None,
+        )
+
+    async def validate(
+        self,
+        db_name: str = "receita_federal_staging",
+        schema: str | None = None,
+        active_db: str = "receita_federal",
+        active_schema: str | None = None,
+    ) -> ValidationResult:
         try:
-            conn = await asyncpg.connect(**self._config, database=db_name, timeout=30)
+            pool = await self._pool(db_name, schema, _STAGING_POOL_SIZE)
         except Exception as e:
             return ValidationResult(
                 is_valid=False,
                 missing_tables=EXPECTED_TABLES[:],
                 missing_indexes=EXPECTED_INDEXES[:],
+                not_finalized=True,
             )
 
+        # Primeira carga (ou ativo fora do ar): valida sem comparar
+        active = None
+        if (active_db, active_schema) != (db_name, schema):
+            try:
+                active = await self._pool(active_db, active_schema, _ACTIVE_POOL_SIZE)
+            except Exception:
+                active = None
+
         try:
-            missing_tables = []
-            empty_tables = []
-            for table in EXPECTED_TABLES:
-                exists = await conn.fetchval(
-                    "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = $1)",
-                    table,
-                )
-                if not exists:
-                    missing_tables.append(table)
-                    continue
-                count = await conn.fetchval(f"SELECT COUNT(*) FROM {table}")
-                if count == 0:
-                    empty_tables.append(table)
-
-            missing_indexes = []
-            for index in EXPECTED_INDEXES:
-                exists = await conn.fetchval(
-                    "SELECT EXISTS(SELECT 1 FROM pg_indexes WHERE indexname = $1)",
-                    index,
+            # Catálogo primeiro (milissegundos): estatísticas em vez de
+            # COUNT(*), "vazia" confirmada com EXISTS
+            stats, (missing_indexes, invalid_indexes, deferred), finalized, active_stats = (
+                await asyncio.gather(
+                    _on(pool, table_stats, EXPECTED_TABLES),
+                    _on(pool, _index_state),
+                    _on(pool, _finalized),
+                    _on(active, table_stats, EXPECTED_TABLES) if active else asyncio.sleep(0),
                 )
-                if not exists:
-                    missing_indexes.append(index)
+            )
+            missing_tables = [t for t, st in stats.items() if not st.exists]
+            empty_tables = [t for t, st in stats.items() if st.exists and not st.has_rows]
+            if active_stats and not any(s.exists for s in active_stats.values()):
+                active_stats = None
+
+            # Depois, em paralelo: livro de carga x catálogo e o perfil por
+            # amostra das tabelas de fato nos dois bancos
+            profiled = [t for t in PROFILE if stats[t].has_rows]
+            compared = [
+                t for t in profiled if active_stats and active_stats[t].has_rows
+            ]
+            ledger, *profiles = await asyncio.gather(
+                _on(pool, reconcile, stats),
+                *(_on(pool, profile_table, t) for t in profiled),
+                *(_on(active, profile_table, t) for t in compared),
+            )
+            staging_profiles = dict(zip(profiled, profiles[: len(profiled)]))
+            active_profiles = dict(zip(compared, profiles[len(profiled):]))
 
-            is_valid = not missing_tables and not empty_tables and not missing_indexes
+            profile_issues = []
+            for table, p in staging_profiles.items():
+                profile_issues += compare_profiles(p, active_profiles.get(table))
+            # Diferenças que só as amostras mostram são conferidas nas tabelas
+            for issues in await asyncio.gather(
+                *(_confirm(pool, active, staging_profiles[t], active_profiles[t]) for t in compared)
+            ):
+                profile_issues += issues
+            row_deltas = compare_counts(stats, active_stats) if active_stats else []
+
+            is_valid = (
+                not missing_tables
+                and not empty_tables
+                and not missing_indexes
+                and not invalid_indexes
+                and finalized
+                and not ledger.issues
+                and not row_deltas
+                and not profile_issues
+            )
             return ValidationResult(
-                is_valid=is_valid,
+                is_valid=bool(is_valid),
                 missing_tables=missing_tables,
                 empty_tables=empty_tables,
                 missing_indexes=missing_indexes,
+                invalid_indexes=invalid_indexes,
+                deferred_indexes=deferred,
+                not_finalized=not finalized,
+                ledger_issues=ledger.issues,
+                rejected_rows=ledger.rejected,
+                row_deltas=row_deltas,
+                profile_issues=profile_issues,
+                compared_with=(
+                    (f"{active_db}.{active_schema}" if active_schema else active_db)
+                    if active_stats
+                    else None
+                ),
             )
         finally:
-            await conn.close()
+            await pool.close()
+            if active:
+                await active.close()
@@ -0,0 +1,188 @@
+"""
+Aquecimento do cache do banco recém-promovido.
+
+Depois do switch, o ativo novo tem shared_buffers e cache do SO frios: até as
+páginas quentes voltarem à memória, o p99 da API sobe por dezenas de minutos.
+O switcher tira, antes da troca, uma foto do cache do ativo que vai sair
+(`pg_buffercache`: quais blocos de cada tabela estão em memória e quão usados)
+e, logo depois da troca e antes de reportar o switch, carrega no ativo novo com
+`pg_prewarm`, nesta ordem, até `WARMUP_MAX_GB`:
+
+1. as tabelas de referência (cnae, município, natureza...), inteiras;
+2. os B-tree de CNPJ do catálogo (capacidade `consulta_cnpj`), inteiros;
+3. as faixas de blocos das tabelas de fato mais quentes na foto — a carga é
+   feita na mesma ordem todo mês, então as posições se correspondem.
+
+O orçamento também é limitado a 3/4 de shared_buffers, para não expulsar o que
+acabou de ser carregado. Sem as extensões (ou sem permissão para criá-las) o
+passo correspondente é pulado; o aquecimento nunca reprova um switch.
+"""
+
+import os
+import time
+from dataclasses import dataclass, field
+
+import asyncpg
+
+from src.blue_green.constants import EXPECTED_TABLES, FACT_TABLE_KEYS
+from src.indexes.catalog import catalog_indexes
+
+# Teto do aquecimento; 0 desliga
+WARMUP_MAX_GB = float(os.getenv("WARMUP_MAX_GB", 4))
+
+_BLOCK_SIZE = 8192
+# Granularidade das faixas quentes: 128 blocos = 1 MB
+_CHUNK_BLOCKS = 128
+
+REFERENCE_TABLES = [t for t in EXPECTED_TABLES if t not in FACT_TABLE_KEYS]
+CNPJ_INDEXES = [spec.name for spec in catalog_indexes() if spec.capability == "consulta_cnpj"]
+
+
+@dataclass
+class HotRange:
+    relname: str
+    first: int
+    last: int
+    # Soma do usagecount dos blocos da faixa na foto
+    score: int
+
+
+@dataclass
+class WarmupReport:
+    seconds: float = 0.0
+    blocks: int = 0
+    relations: list = field(default_factory=list)
+    hot_ranges: int = 0
+    # Motivo de não ter aquecido (extensão ausente, desligado...)
+    skipped: str | None = None
+
+    @property
+    def gb(self) -> float:
+        return self.blocks * _BLOCK_SIZE / 1024**3
+
+
+async def _connect(db_config, database, schema):
+    return await asyncpg.connect(
+        **db_config,
+        database=database,
+        timeout=30,
+        server_settings={"search_path": f'"{schema}", public'} if schema else None,
+    )
+
+
+async def cache_snapshot(conn) -> list:
+    """Faixas das tabelas de fato em shared_buffers, da mais quente à mais fria."""
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_buffercache SCHEMA public")
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, b.relblocknumber / $2 AS chunk, sum(b.usagecount) AS score
+        FROM public.pg_buffercache b
+        JOIN pg_class c ON b.relfilenode = pg_relation_filenode(c.oid)
+        WHERE b.reldatabase = (SELECT oid FROM pg_database WHERE datname = current_database())
+          AND b.relforknumber = 0
+          AND c.relnamespace = current_schema()::regnamespace
+          AND c.relname = ANY($1::text[])
+        GROUP BY 1, 2
+        ORDER BY 3 DESC
+        """,
+        list(FACT_TABLE_KEYS),
+        _CHUNK_BLOCKS,
+    )
+    return [
+        HotRange(
+            r["relname"],
+            r["chunk"] * _CHUNK_BLOCKS,
+            (r["chunk"] + 1) * _CHUNK_BLOCKS - 1,
+            r["score"],
+        )
+        for r in rows
+    ]
+
+
+async def snapshot_active(db_config, database, schema=None) -> list:
+    """Foto do cache do ativo antes da troca; vazia se não der para tirá-la."""
+    try:
+        conn = await _connect(db_config, database, schema)
+    except (OSError, asyncpg.PostgresError):
+        return []
+    try:
+        return await cache_snapshot(conn)
+    except asyncpg.PostgresError:
+        return []
+    finally:
+        await conn.close()
+
+
+async def warm_up(conn, snapshot, max_gb=WARMUP_MAX_GB) -> WarmupReport:
+    report = WarmupReport()
+    if max_gb <= 0:
+        report.skipped = "desligado (WARMUP_MAX_GB=0)"
+        return report
+    try:
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_prewarm SCHEMA public")
+    except asyncpg.PostgresError as e:
+        report.skipped = f"pg_prewarm indisponível: {e}"
+        return report
+
+    start = time.time()
+    # shared_buffers vem em blocos de 8 kB
+    shared = int(await conn.fetchval("SELECT setting FROM pg_settings WHERE name = 'shared_buffers'"))
+    budget = min(int(max_gb * 1024**3 / _BLOCK_SIZE), shared * 3 // 4)
+
+    sizes = {
+        r["relname"]: r["blocks"]
+        for r in await conn.fetch(
+            """
+            SELECT c.relname, pg_relation_size(c.oid) / $2 AS blocks
+            FROM pg_class c
+            WHERE c.relnamespace = current_schema()::regnamespace
+              AND c.relname = ANY($1::text[])
+            """,
+            REFERENCE_TABLES + CNPJ_INDEXES + list(FACT_TABLE_KEYS),
+            _BLOCK_SIZE,
+        )
+    }
+
+    async def prewarm(relname, first, last):
+        loaded = await conn.fetchval(
+            "SELECT public.pg_prewarm($1::text::regclass, 'buffer', 'main', $2, $3)",
+            relname,
+            first,
+            last,
+            timeout=None,
+        )
+        report.blocks += loaded
+
+    for relname in REFERENCE_TABLES + CNPJ_INDEXES:
+        blocks = min(sizes.get(relname, 0), budget - report.blocks)
+        if blocks <= 0:
+            continue
+        await prewarm(relname, 0, blocks - 1)
+        report.relations.append(relname)
+
+    for hot in snapshot:
+        remaining = budget - report.blocks
+        if remaining <= 0:
+            break
+        last = min(hot.last, sizes.get(hot.relname, 0) - 1, hot.first + remaining - 1)
+        if last < hot.first:
+            continue
+        await prewarm(hot.relname, hot.first, last)
+        report.hot_ranges += 1
+
+    report.seconds = time.time() - start
+    return report
+
+
+async def warm_active(db_config, database, schema=None, snapshot=None) -> WarmupReport:
+    """Aquece o ativo recém-promovido; falhas viram `skipped`, nunca exceção."""
+    try:
+        conn = await _connect(db_config, database, schema)
+    except (OSError, asyncpg.PostgresError) as e:
+        return WarmupReport(skipped=f"sem conexão com '{database}': {e}")
+    try:
+        return await warm_up(conn, snapshot or [])
+    except asyncpg.PostgresError as e:
+        return WarmupReport(skipped=f"interrompido: {e}")
+    finally:
+        await conn.close()
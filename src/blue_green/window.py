@@ -0,0 +1,43 @@
+"""
+Janela de manutenção do switch.
+
+`SWITCH_WINDOW` (ou `run_prod.py --switch-window`) no formato `HH:MM-HH:MM`,
+no horário local da máquina; a janela pode atravessar a meia-noite
+(`23:00-02:00`). Vazia: o switch pode acontecer a qualquer hora.
+"""
+
+import os
+from datetime import datetime, time, timedelta
+
+SWITCH_WINDOW = os.getenv("SWITCH_WINDOW", "").strip()
+
+
+def parse_window(value: str) -> tuple[time, time] | None:
+    """'HH:MM-HH:MM' → (início, fim); vazio → None. ValueError se malformada."""
+    if not value:
+        return None
+    try:
+        start, end = (time.fromisoformat(part.strip()) for part in value.split("-"))
+    except ValueError:
+        raise ValueError(f"Janela inválida: {value!r} — use HH:MM-HH:MM (ex.: 02:00-05:00)")
+    return start, end
+
+
+def in_window(window, now: datetime) -> bool:
+    if window is None:
+        return True
+    start, end = window
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def seconds_until_window(window, now: datetime) -> float:
+    """Segundos até a janela abrir (0 dentro dela ou sem janela)."""
+    if in_window(window, now):
+        return 0.0
+    opens = datetime.combine(now.date(), window[0], now.tzinfo)
+    if opens <= now:
+        opens += timedelta(days=1)
+    return (opens - now).total_seconds()
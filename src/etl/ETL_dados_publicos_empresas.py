@@ -2,19 +2,21 @@
 import argparse
 import asyncio
 import concurrent.futures
+import contextlib
 import datetime
 import gc
+import io
 import json
 import logging
 import os
 import pathlib
 import re
+import signal
 import sys
 import time
 import zipfile
 
 import asyncpg
-import bs4 as bs
 import httpx
 import polars as pl
 from dotenv import load_dotenv
@@ -32,19 +34,81 @@ from rich.progress import (
 from rich.table import Table
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+# Raiz do projeto no sys.path — permite importar os módulos de apoio
+# (src.etl.*, src.blue_green.*) quando o script roda direto via `uv run`
+_PROJECT_ROOT = pathlib.Path(__file__).resolve().parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.blue_green.constants import FACT_TABLE_KEYS  # noqa: E402
+from src.blue_green.schema_switch import ensure_staging_schema  # noqa: E402
+from src.etl.batches import (  # noqa: E402
+    PROGRESS_DDL,
+    clear_segments,
+    committed_segments,
+    iter_segments,
+    record_segment,
+)
+from src.etl.bulk_mode import (  # noqa: E402
+    RECOVERY_COMMAND,
+    connect_state,
+    enable_bulk_mode,
+    read_bulk_state,
+    restore_bulk_mode,
+)
+from src.etl.dag import DONE, RUNNING, TaskGraph  # noqa: E402
+from src.etl.encoding import (  # noqa: E402
+    create_encode_pool,
+    decode_frame,
+    encode_copy_payload,
+    encode_segment,
+    parse_date_columns,
+)
+from src.etl.finalize import (  # noqa: E402
+    clear_finalize_marker,
+    finalize_table,
+    mark_finalized,
+)
+from src.etl.index_builds import IndexBuildScheduler  # noqa: E402
+from src.etl.pipeline import EtlConfig, EtlResult  # noqa: E402
+from src.etl.release_watch import (  # noqa: E402
+    SHARE_TOKEN,
+    WEBDAV_BASE_URL,
+    latest_month,
+)
+from src.etl.incremental import (  # noqa: E402
+    METADATA_DDL,
+    ROW_HASH_COLUMN,
+    IncrementalLoad,
+    check_incremental_base,
+    row_hash_version,
+    write_metadata,
+)
+from src.etl.tuning import build_profile  # noqa: E402
+from src.indexes.catalog import CORE, index_definitions  # noqa: E402
+from src.indexes.deferred import DEFERRED_KEY  # noqa: E402
+from src.validation.table_stats import INCREMENTAL_KEY  # noqa: E402
+
 # Configuração de logging e console
 console = Console()
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        RichHandler(console=console, rich_tracebacks=True),
-        logging.FileHandler("etl_log.log", encoding="utf-8"),
-    ],
-)
 logger = logging.getLogger(__name__)
 
 
+def setup_logging():
+    """Console (rich) e etl_log.log — no início da execução, não no import."""
+    root = logging.getLogger()
+    if any(isinstance(h, RichHandler) for h in root.handlers):
+        return
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[
+            RichHandler(console=console, rich_tracebacks=True),
+            logging.FileHandler("etl_log.log", encoding="utf-8"),
+        ],
+    )
+
+
 def check_diff(url, file_name):
     """
     Verifica se o arquivo no servidor existe no disco e se ele tem o mesmo
@@ -125,28 +189,86 @@ def remove_file_safe(path):
         logger.warning(f"Não foi possível remover {path}: {e}")
 
 
+# Display de progresso ativo. O Rich só permite um por vez, e as tarefas do
+# grafo rodam em paralelo — todas acrescentam suas barras a este mesmo display
+_active_progress = None
+
+
+@contextlib.contextmanager
+def progress_display():
+    """
+    Devolve o display de progresso em uso ou abre um novo. Quem chama deve
+    remover as próprias barras (remove_task) ao terminar.
+    """
+    global _active_progress
+    if _active_progress is not None:
+        yield _active_progress
+        return
+    with Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TimeElapsedColumn(),
+        TimeRemainingColumn(),
+        console=console,
+    ) as progress:
+        _active_progress = progress
+        try:
+            yield progress
+        finally:
+            _active_progress = None
+
+
 CHECKPOINT_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "checkpoint.json")
 
 
-def save_checkpoint(stage, file_index=None, batch_index=None):
+def save_checkpoint(tasks):
     """
-    Salva checkpoint do progresso atual
+    Salva checkpoint do progresso atual: o estado de cada tarefa do grafo do
+    ETL ({"load:socios": "running", "load:empresa": "done", ...}). O progresso
+    dentro de uma carga fica em `etl_lotes`, no próprio banco.
     """
     checkpoint = {
-        "stage": stage,
-        "file_index": file_index,
-        "batch_index": batch_index,
+        "tasks": tasks,
         "timestamp": datetime.datetime.now().isoformat(),
     }
 
     try:
         with open(CHECKPOINT_FILE, "w") as f:
             json.dump(checkpoint, f, indent=2)
-        logger.info(f"Checkpoint salvo: {stage} - arquivo {file_index}")
+        running = [name for name, value in tasks.items() if value == RUNNING]
+        logger.info(f"Checkpoint salvo: em andamento {', '.join(running) or '-'}")
     except Exception as e:
         logger.error(f"Erro ao salvar checkpoint: {e}")
 
 
+# Estágios do checkpoint antigo (antes do grafo de tarefas), em ordem
+_LEGACY_STAGES = ["empresa", "estabelecimento", "socios", "simples", "outros"]
+
+
+def _tasks_from_legacy_stage(stage):
+    """
+    Converte um checkpoint no formato antigo ({"stage": "socios_completed"})
+    para o estado de tarefas — permite retomar uma execução interrompida antes
+    da atualização.
+    """
+    name, completed = stage, False
+    if stage.endswith("_completed"):
+        name, completed = stage[: -len("_completed")], True
+    if name not in _LEGACY_STAGES:
+        # "creating_indexes": todas as cargas concluídas
+        return {f"load:{s}": DONE for s in _LEGACY_STAGES}
+    index = _LEGACY_STAGES.index(name)
+    tasks = {}
+    for position, s in enumerate(_LEGACY_STAGES):
+        if position < index or (position == index and completed):
+            tasks[f"load:{s}"] = DONE
+        elif position == index and s != "outros":
+            tasks[f"load:{s}"] = RUNNING
+    return tasks
+
+
 def load_checkpoint():
     """
     Carrega checkpoint salvo
@@ -155,9 +277,9 @@ def load_checkpoint():
         if os.path.exists(CHECKPOINT_FILE):
             with open(CHECKPOINT_FILE, "r") as f:
                 checkpoint = json.load(f)
-            logger.info(
-                f"Checkpoint carregado: {checkpoint['stage']} - arquivo {checkpoint.get('file_index', 0)}"
-            )
+            if "tasks" not in checkpoint and checkpoint.get("stage"):
+                checkpoint["tasks"] = _tasks_from_legacy_stage(checkpoint["stage"])
+            logger.info(f"Checkpoint carregado: {checkpoint.get('tasks')}")
             return checkpoint
     except Exception as e:
         logger.error(f"Erro ao carregar checkpoint: {e}")
@@ -180,38 +302,13 @@ def clear_checkpoint():
 async def to_sql_async(dataframe, pool, table_name, batch_size=50000):
     """
     Insere dados de forma assíncrona usando o protocolo COPY do Postgres
-    (asyncpg.copy_records_to_table) — muito mais rápido que INSERT em lote
-    para as tabelas de fato (estabelecimento, empresa, socios, simples).
+    (asyncpg.copy_records_to_table) — muito mais rápido que INSERT em lote.
+    Usado pelas tabelas de referência; as de fato passam por copy_segment(),
+    que grava cada lote junto com o registro em `etl_lotes`.
     """
     total = dataframe.height
     columns = dataframe.columns
-
-    # Definir colunas de data para cada tabela
-    date_columns = {
-        "estabelecimento": [
-            "data_situacao_cadastral",
-            "data_inicio_atividade",
-            "data_situacao_especial",
-        ],
-        "socios": ["data_entrada_sociedade"],
-        "simples": [
-            "data_opcao_simples",
-            "data_exclusao_simples",
-            "data_opcao_mei",
-            "data_exclusao_mei",
-        ],
-    }
-
-    df = dataframe
-    date_cols_present = [c for c in date_columns.get(table_name, []) if c in df.columns]
-    if date_cols_present:
-        # "", "0" e "00000000" não casam com %Y%m%d e viram NULL com strict=False
-        df = df.with_columns(
-            [
-                pl.col(c).str.strptime(pl.Date, format="%Y%m%d", strict=False)
-                for c in date_cols_present
-            ]
-        )
+    df = parse_date_columns(dataframe, table_name)
 
     async def copy_batch(offset, length):
         # Fatiar e materializar em tuplas Python só na hora de copiar ESTE batch
@@ -251,31 +348,189 @@ async def to_sql_async(dataframe, pool, table_name, batch_size=50000):
     sys.stdout.write("\n")
 
 
+# Estado da carga incremental por tabela de fato (--incremental). Vazio numa
+# carga completa — copy_segment() então grava o lote inteiro.
+incremental_loads = {}
+
+# Perfil de tuning da execução (src/etl/tuning.py) — calculado na primeira
+# chamada de get_tuning(), com os overrides do .env já carregados
+_tuning = None
+
+
+def get_tuning():
+    global _tuning
+    if _tuning is None:
+        _tuning = build_profile()
+        logger.info(
+            "Perfil de tuning: "
+            + ", ".join(f"{name}={value} ({source})" for name, value, source in _tuning.rows())
+        )
+    return _tuning
+
+
+async def delete_keys(conn, table_name, keys_df):
+    """
+    Apaga do banco as linhas cujas chaves estão em `keys_df` (carga
+    incremental). As chaves sobem por COPY para uma tabela temporária e o
+    DELETE é feito por join — usa os índices de cnpj já existentes no destino.
+    Deve rodar dentro de uma transação (a tabela temporária é ON COMMIT DROP).
+    """
+    keys = keys_df.columns
+    col_defs = ", ".join(
+        f"{c} {'BIGINT' if c == ROW_HASH_COLUMN else 'TEXT'}" for c in keys
+    )
+    match = " AND ".join(f"t.{c} = d.{c}" for c in keys)
+    await conn.execute(f"CREATE TEMP TABLE _delta_chaves ({col_defs}) ON COMMIT DROP")
+    await conn.copy_records_to_table(
+        "_delta_chaves", records=keys_df.rows(), columns=keys
+    )
+    await conn.execute("ANALYZE _delta_chaves")
+    await conn.execute(
+        f"DELETE FROM {table_name} t USING _delta_chaves d WHERE {match}",
+        timeout=3600,
+    )
+
+
+async def copy_segment(pool, table_name, file_name, offset, size, encoded, file_size=None):
+    """
+    Grava um lote (segmento do arquivo, já codificado por encode_segment) e o
+    registra em `etl_lotes` numa única transação: ou o lote inteiro está no
+    banco e marcado como feito, ou nada dele está. Na carga incremental grava
+    só as linhas novas/alteradas, apagando antes a versão antiga das
+    alteradas — também na mesma transação. Lotes sem linhas também são
+    registrados, para o livro de conciliação cobrir o arquivo inteiro.
+    """
+    payload = encoded.payload
+    copied = encoded.rows
+    replaced = None
+    inc = incremental_loads.get(table_name)
+    if inc is not None and encoded.rows:
+
+        def diff():
+            changed, replaced = inc.diff(decode_frame(encoded.frame))
+            payload = encode_copy_payload(changed) if changed.height else b""
+            return payload, changed.height, replaced
+
+        # Comparação e recodificação em thread: o Polars solta o GIL, e o
+        # event loop segue atendendo os COPY dos outros lotes
+        payload, copied, replaced = await asyncio.to_thread(diff)
+
+    async with pool.acquire() as conn:
+        start = time.time()
+        async with conn.transaction():
+            if replaced is not None and replaced.height:
+                await delete_keys(conn, table_name, replaced)
+            if payload:
+                await conn.copy_to_table(
+                    table_name,
+                    source=io.BytesIO(payload),
+                    columns=encoded.columns,
+                    format="csv",
+                    timeout=3600,
+                )
+            await record_segment(
+                conn,
+                table_name,
+                file_name,
+                offset,
+                size,
+                encoded.rows,
+                copied=copied,
+                rejected=encoded.rejected,
+                file_size=file_size,
+                encode_seconds=encoded.seconds,
+                copy_seconds=time.time() - start,
+            )
+
+
+# Pool de processos que tratam e codificam os lotes (create_encode_pool) e
+# seu número de processos. Criado na primeira carga, encerrado no fim de main()
+_encode_pool = None
+_encode_workers = 0
+
+
+def get_encode_pool():
+    global _encode_pool, _encode_workers
+    if _encode_pool is None:
+        _encode_workers = get_tuning().encode_workers
+        _encode_pool = create_encode_pool(_encode_workers)
+        logger.info(f"Pool de codificação: {_encode_workers} processos")
+    return _encode_pool, _encode_workers
+
+
+def shutdown_encode_pool():
+    global _encode_pool
+    if _encode_pool is not None:
+        _encode_pool.shutdown(cancel_futures=True)
+        _encode_pool = None
+
+
+async def begin_incremental_table(pool, table_name):
+    """Carrega os hashes da base antes de processar os arquivos da tabela."""
+    if not args.incremental:
+        return
+    inc = IncrementalLoad(table_name, FACT_TABLE_KEYS[table_name])
+    total = await inc.load_base(pool, extracted_files)
+    incremental_loads[table_name] = inc
+    logger.info(f"[incremental] {table_name}: {total:,} hashes carregados da base")
+
+
+def mark_incremental_incomplete(table_name, reason):
+    inc = incremental_loads.get(table_name)
+    if inc is not None:
+        inc.mark_incomplete(reason)
+
+
+async def finish_incremental_table(pool, table_name):
+    """Aplica as remoções (chaves que sumiram dos arquivos) e libera a base."""
+    inc = incremental_loads.get(table_name)
+    if inc is None:
+        return
+    if inc.incomplete_reason:
+        logger.warning(
+            f"[incremental] {table_name}: remoções NÃO aplicadas — {inc.incomplete_reason}"
+        )
+    removed = inc.removed_keys()
+    if removed.height:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await delete_keys(conn, table_name, removed)
+    inc.base = None
+    logger.info(
+        f"[incremental] {table_name}: {inc.inserted:,} novas, "
+        f"{inc.updated:,} alteradas, {inc.removed:,} removidas"
+    )
+
+
 def getEnv(env, default=None):
     return os.getenv(env, default)
 
 
-# Carregar variáveis de ambiente automaticamente
-current_path = pathlib.Path().resolve()
-
-# Procurar .env primeiro no diretório raiz do projeto (pai do src)
-parent_path = current_path.parent
-dotenv_path = os.path.join(parent_path, ".env")
+def load_env():
+    """
+    Carrega o .env da linha de comando. Quem usa o ETL como biblioteca
+    (src/etl/pipeline.py) carrega o próprio .env antes.
+    """
+    current_path = pathlib.Path().resolve()
 
-# Se não encontrar no diretório pai, verificar no diretório atual
-if not os.path.isfile(dotenv_path):
-    dotenv_path = os.path.join(current_path, ".env")
+    # Procurar .env primeiro no diretório raiz do projeto (pai do src)
+    parent_path = current_path.parent
+    dotenv_path = os.path.join(parent_path, ".env")
 
-    # Se não encontrar em lugar nenhum, usar o do diretório pai (raiz do projeto)
+    # Se não encontrar no diretório pai, verificar no diretório atual
     if not os.path.isfile(dotenv_path):
-        dotenv_path = os.path.join(parent_path, ".env")
-        print(
-            "Arquivo .env não encontrado. Verifique se existe um arquivo .env no diretório raiz do projeto."
-        )
-        print(f"Procurando em: {dotenv_path}")
+        dotenv_path = os.path.join(current_path, ".env")
 
-print(f"Carregando configurações de: {dotenv_path}")
-load_dotenv(dotenv_path=dotenv_path)
+        # Se não encontrar em lugar nenhum, usar o do diretório pai (raiz do projeto)
+        if not os.path.isfile(dotenv_path):
+            dotenv_path = os.path.join(parent_path, ".env")
+            print(
+                "Arquivo .env não encontrado. Verifique se existe um arquivo .env no diretório raiz do projeto."
+            )
+            print(f"Procurando em: {dotenv_path}")
+
+    print(f"Carregando configurações de: {dotenv_path}")
+    load_dotenv(dotenv_path=dotenv_path)
 
 
 def parse_arguments():
@@ -314,6 +569,17 @@ Exemplos de uso:
         help="Banco de dados destino para a carga (padrão: receita_federal_staging)",
     )
 
+    parser.add_argument(
+        "--db-schema",
+        default=None,
+        dest="db_schema",
+        help=(
+            "Schema destino dentro de --db-target — layout blue-green por "
+            "schemas (ex.: --db-target receita_federal --db-schema cnpj_staging). "
+            "Sem ele, a carga vai para o schema padrão do banco"
+        ),
+    )
+
     parser.add_argument(
         "--skip-download",
         action="store_true",
@@ -325,11 +591,50 @@ Exemplos de uso:
         ),
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Carga incremental: compara o hash de cada linha com o row_hash já "
+            "gravado no banco destino e aplica só as linhas novas, alteradas e "
+            "removidas. O destino precisa conter a carga anterior — se não "
+            "existir, é clonado de --incremental-base."
+        ),
+    )
 
+    parser.add_argument(
+        "--incremental-base",
+        default="receita_federal",
+        dest="incremental_base",
+        help=(
+            "Banco usado como modelo (CREATE DATABASE ... TEMPLATE) quando o "
+            "destino da carga incremental ainda não existe (padrão: receita_federal)"
+        ),
+    )
 
-SHARE_TOKEN = "YggdBLfdninEJX9"
-WEBDAV_BASE_URL = f"https://arquivos.receitafederal.gov.br/public.php/webdav"
+    parser.add_argument(
+        "--no-bulk-mode",
+        action="store_true",
+        dest="no_bulk_mode",
+        help=(
+            "Não aplica o modo de carga em massa (synchronous_commit=off, "
+            "max_wal_size maior, autovacuum e triggers de auditoria desligados "
+            "nas tabelas de fato) durante a fase 3"
+        ),
+    )
+
+    parser.add_argument(
+        "--defer-indexes",
+        action="store_true",
+        dest="defer_indexes",
+        help=(
+            "Disponibilidade progressiva: cria só os índices CORE do catálogo e "
+            "registra os demais (GIN trigram) para serem criados depois do "
+            "switch, no banco já ativo (src/indexes/deferred.py)"
+        ),
+    )
+
+    return parser.parse_args()
 
 
 def webdav_list(path="/"):
@@ -386,18 +691,10 @@ def get_latest_available_date():
     )
 
     try:
-        entries = webdav_list("/")
-        matches = [e for e in entries if re.match(r"^\d{4}-\d{2}$", e)]
-
-        if not matches:
+        latest = latest_month(webdav_list("/"))
+        if latest is None:
             raise ValueError("Nenhuma versão encontrada na página da Receita Federal")
-
-        matches.sort(reverse=True)
-        latest = matches[0]
-
-        year, month = latest.split("-")
-        year = int(year)
-        month = int(month)
+        year, month = latest
 
         console.print(
             f"[green]✅ Versão mais recente encontrada: {month:02d}-{year}[/green]"
@@ -442,7 +739,7 @@ def parse_date_string(date_str):
 
     except ValueError as e:
         console.print(f"[red]❌ Erro no formato da data: {e}[/red]")
-        sys.exit(1)
+        raise
 
 
 # Solicitar ano e mês do usuário
@@ -509,43 +806,20 @@ def get_year_month(args=None):
     return get_year_month(args=None)
 
 
-# Parsear argumentos de linha de comando
-args = parse_arguments()
-
-# Obter ano e mês do usuário (via argumentos ou interativo)
-ano, mes = get_year_month(args)
-mes_formatado = f"{mes:02d}"  # Formatar mês com 2 dígitos
-
-print(f"\n✅ Configurado para baixar dados de: {ano}-{mes_formatado}")
-print("=" * 50)
+# Configuração da execução — preenchida por init_run(). Nada disso roda no
+# import: os processos do pool de codificação (spawn) reimportam este script,
+# e o run_prod.py o importa como biblioteca (src/etl/pipeline.py)
+args = None
+ano = None
+mes = None
+mes_formatado = None
+output_files = None
+extracted_files = None
+Files = []
 
 # URL base do compartilhamento Nextcloud da Receita Federal
 SHARE_BASE_URL = f"https://arquivos.receitafederal.gov.br/index.php/s/{SHARE_TOKEN}"
 
-# Read details from ".env" file:
-output_files = None
-extracted_files = None
-try:
-    output_files = getEnv("OUTPUT_FILES_PATH")
-    makedirs(output_files)
-
-    extracted_files = getEnv("EXTRACTED_FILES_PATH")
-    makedirs(extracted_files)
-
-    print(
-        "Diretórios definidos: \n"
-        + "output_files: "
-        + str(output_files)
-        + "\n"
-        + "extracted_files: "
-        + str(extracted_files)
-    )
-except:
-    pass
-    logger.error(
-        'Erro na definição dos diretórios, verifique o arquivo ".env" ou o local informado do seu arquivo de configuração.'
-    )
-
 
 # Fazer request com httpx com tratamento de erros robusto
 def get_html_with_retry(url, max_retries=3):
@@ -581,32 +855,81 @@ def get_html_with_retry(url, max_retries=3):
             raise
 
 
-if args.skip_download:
-    # --skip-download: não faz nenhuma requisição à Receita Federal —
-    # os arquivos já baixados/extraídos em disco são usados como estão
-    Files = []
-    print(
-        "[--skip-download] Pulando listagem remota e download — "
-        "usando arquivos já extraídos em disco."
-    )
-else:
+def init_run(config: EtlConfig = None):
+    """
+    Lê a configuração (`config` ou os argumentos da linha de comando), ano/mês
+    e diretórios e lista os arquivos do mês no WebDAV. Chamada uma vez por
+    execução, só no processo principal, antes de main().
+    """
+    global args, ano, mes, mes_formatado, output_files, extracted_files, Files
+    global _index_scheduler
+
+    args = config or EtlConfig(**vars(parse_arguments()))
+    if args.db_schema and args.incremental:
+        # A carga incremental parte de um clone do banco ativo
+        # (CREATE DATABASE ... TEMPLATE), que não existe para um schema
+        print("\n❌ --incremental não é suportado com --db-schema — rode uma carga completa")
+        raise ValueError("--incremental não é suportado com --db-schema")
+    # Estado de uma execução anterior no mesmo processo
+    incremental_loads.clear()
+    _index_scheduler = None
+
+    # Obter ano e mês do usuário (via argumentos ou interativo)
+    ano, mes = get_year_month(args)
+    mes_formatado = f"{mes:02d}"  # Formatar mês com 2 dígitos
+
+    print(f"\n✅ Configurado para baixar dados de: {ano}-{mes_formatado}")
+    print("=" * 50)
+
+    # Read details from ".env" file:
     try:
-        all_entries = webdav_list(f"/{ano}-{mes_formatado}")
-        Files = [e for e in all_entries if e.lower().endswith(".zip")]
-    except Exception as e:
-        logger.error(f"Erro fatal ao listar arquivos via WebDAV: {e}")
-        print(f"\n❌ Erro ao listar arquivos da Receita Federal via WebDAV.")
-        print(f"Diretório tentado: /{ano}-{mes_formatado}")
-        print(f"Erro: {e}")
-        print("\n🔍 Verificações:")
-        print("1. Confirme se o ano/mês estão corretos")
-        print("2. Verifique sua conexão com a internet")
-        print("3. Tente novamente em alguns minutos")
-        sys.exit(1)
+        output_files = getEnv("OUTPUT_FILES_PATH")
+        makedirs(output_files)
+
+        extracted_files = getEnv("EXTRACTED_FILES_PATH")
+        makedirs(extracted_files)
+
+        print(
+            "Diretórios definidos: \n"
+            + "output_files: "
+            + str(output_files)
+            + "\n"
+            + "extracted_files: "
+            + str(extracted_files)
+        )
+    except:
+        pass
+        logger.error(
+            'Erro na definição dos diretórios, verifique o arquivo ".env" ou o local informado do seu arquivo de configuração.'
+        )
+
+    if args.skip_download:
+        # --skip-download: não faz nenhuma requisição à Receita Federal —
+        # os arquivos já baixados/extraídos em disco são usados como estão
+        Files = []
+        print(
+            "[--skip-download] Pulando listagem remota e download — "
+            "usando arquivos já extraídos em disco."
+        )
+    else:
+        try:
+            all_entries = webdav_list(f"/{ano}-{mes_formatado}")
+            Files = [e for e in all_entries if e.lower().endswith(".zip")]
+        except Exception as e:
+            logger.error(f"Erro fatal ao listar arquivos via WebDAV: {e}")
+            print(f"\n❌ Erro ao listar arquivos da Receita Federal via WebDAV.")
+            print(f"Diretório tentado: /{ano}-{mes_formatado}")
+            print(f"Erro: {e}")
+            print("\n🔍 Verificações:")
+            print("1. Confirme se o ano/mês estão corretos")
+            print("2. Verifique sua conexão com a internet")
+            print("3. Tente novamente em alguns minutos")
+            raise RuntimeError(f"Listagem WebDAV de {ano}-{mes_formatado} falhou: {e}") from e
+
+        print("Arquivos que serão baixados:")
+        for l in Files:
+            print(l)
 
-    print("Arquivos que serão baixados:")
-    for l in Files:
-        print(l)
 
 # Listas de arquivos por tipo — populadas em categorize_extracted_files(),
 # chamada dentro de main() DEPOIS da extração (ver nota abaixo sobre o bug corrigido)
@@ -802,9 +1125,11 @@ async def extract_all_files():
     print("Extração concluída!")
 
 
-async def create_database_if_not_exists(db_name: str = None):
+async def create_database_if_not_exists(db_name: str = None, template: str = None):
     """
-    Cria o banco de dados se não existir
+    Cria o banco de dados se não existir. Com `template`, o banco nasce como
+    cópia de outro (CREATE DATABASE ... TEMPLATE) — usado pela carga
+    incremental para partir da carga anterior.
     """
     user = getEnv("DB_USER")
     passw = getEnv("DB_PASSWORD")
@@ -855,17 +1180,21 @@ async def create_database_if_not_exists(db_name: str = None):
 
         if not exists:
             console.print(f"[yellow]Criando banco de dados: {database}[/yellow]")
-            # Bancos de staging (transitórios) podem ir para um tablespace em disco
-            # separado (ex.: volume), mantendo o banco principal no disco principal.
-            # Definido via STAGING_TABLESPACE; aplicado apenas a bancos "*_staging".
-            tablespace = os.getenv("STAGING_TABLESPACE", "").strip()
-            ts_clause = ""
-            if tablespace and database.endswith("_staging"):
-                ts_clause = f' TABLESPACE "{tablespace}"'
-                console.print(
-                    f"[dim]  → tablespace '{tablespace}' (disco separado)[/dim]"
+            # O banco nasce no tablespace padrão mesmo para a staging: os dados
+            # vão para STAGING_TABLESPACE pelas conexões da carga (create_db_pool),
+            # e a relocação antes do switch não deixa nada para trás no volume
+            template_clause = f' TEMPLATE "{template}"' if template else ""
+            try:
+                await conn.execute(
+                    f'CREATE DATABASE "{database}"{template_clause}'
                 )
-            await conn.execute(f'CREATE DATABASE "{database}"{ts_clause}')
+            except asyncpg.exceptions.ObjectInUseError as e:
+                # CREATE DATABASE ... TEMPLATE exige que ninguém esteja conectado
+                # ao modelo — em produção o banco ativo quase sempre está em uso
+                raise RuntimeError(
+                    f"Não foi possível clonar '{template}' em '{database}': {e}. "
+                    "Clone numa janela sem conexões (createdb -T) ou rode uma carga completa."
+                ) from e
             console.print(
                 f"[green]✅ Banco de dados '{database}' criado com sucesso![/green]"
             )
@@ -879,9 +1208,16 @@ async def create_database_if_not_exists(db_name: str = None):
         raise
 
 
-async def create_db_pool(db_name: str = None):
+async def create_db_pool(db_name: str = None, schema: str = None):
     """
-    Cria pool de conexões assíncronas com o PostgreSQL
+    Cria pool de conexões assíncronas com o PostgreSQL. Com `schema`, as
+    conexões trabalham nele (search_path) — tabelas sem schema explícito são
+    criadas e lidas ali; `public` fica no caminho só pelas extensões.
+
+    Na staging (banco "*_staging" ou `schema`), STAGING_TABLESPACE vira o
+    default_tablespace das conexões: tabelas e índices da carga vão para o
+    disco separado (ex.: volume), e `run_prod.py --relocate-to-main` os traz
+    de volta relação por relação antes do switch (src/blue_green/relocate.py).
     """
     user = getEnv("DB_USER")
     passw = getEnv("DB_PASSWORD")
@@ -889,6 +1225,7 @@ async def create_db_pool(db_name: str = None):
     port = getEnv("DB_PORT")
     database = db_name or getEnv("DB_NAME")
     ssl_mode = getEnv("DB_SSL_MODE", "disable")
+    tuning = get_tuning()
 
     # Converter string SSL mode para valor booleano/None esperado pelo asyncpg
     ssl_config = None
@@ -899,6 +1236,12 @@ async def create_db_pool(db_name: str = None):
     else:
         ssl_config = "prefer"  # padrão do asyncpg
 
+    tablespace = os.getenv("STAGING_TABLESPACE", "").strip()
+    if not (schema or database.endswith("_staging")):
+        tablespace = ""
+    if tablespace:
+        console.print(f"[dim]  → tablespace '{tablespace}' (disco separado)[/dim]")
+
     return await asyncpg.create_pool(
         user=user,
         password=passw,
@@ -907,9 +1250,17 @@ async def create_db_pool(db_name: str = None):
         port=port,
         ssl=ssl_config,
         min_size=5,
-        max_size=10,
+        # COPY da carga + builds de índice + finalizações, monitor e consultas
+        # avulsas — ver TASK_BUDGET
+        max_size=tuning.copy_concurrency + tuning.index_builds + 4,
         command_timeout=300,
-        server_settings={"client_encoding": "utf8", "timezone": "UTC"},
+        server_settings={
+            "client_encoding": "utf8",
+            "timezone": "UTC",
+            **({"search_path": f'"{schema}", public'} if schema else {}),
+            **({"default_tablespace": tablespace} if tablespace else {}),
+            **tuning.load_settings(),
+        },
     )
 
 
@@ -922,7 +1273,8 @@ TABLE_DDL = {
             qualificacao_responsavel INTEGER,
             capital_social NUMERIC(15,2),
             porte_empresa INTEGER,
-            ente_federativo_responsavel TEXT
+            ente_federativo_responsavel TEXT,
+            row_hash BIGINT
         );
     """,
     "estabelecimento": """
@@ -956,7 +1308,8 @@ TABLE_DDL = {
             fax TEXT,
             correio_eletronico TEXT,
             situacao_especial TEXT,
-            data_situacao_especial DATE
+            data_situacao_especial DATE,
+            row_hash BIGINT
         );
     """,
     "socios": """
@@ -971,7 +1324,8 @@ TABLE_DDL = {
             representante_legal TEXT,
             nome_representante TEXT,
             qualificacao_representante_legal INTEGER,
-            faixa_etaria INTEGER
+            faixa_etaria INTEGER,
+            row_hash BIGINT
         );
     """,
     "simples": """
@@ -982,7 +1336,8 @@ TABLE_DDL = {
             data_exclusao_simples DATE,
             opcao_mei TEXT,
             data_opcao_mei DATE,
-            data_exclusao_mei DATE
+            data_exclusao_mei DATE,
+            row_hash BIGINT
         );
     """,
     "cnae": """
@@ -1024,53 +1379,28 @@ TABLE_DDL = {
 }
 
 
+REFERENCE_TABLES = ["cnae", "motivo", "municipio", "natureza", "pais", "qualificacao"]
+
+
 def tables_to_preserve(checkpoint):
     """
-    Retorna o conjunto de tabelas que já têm dado carregado (total ou
-    parcialmente, no caso de estabelecimento em retomada por arquivo) segundo
-    o checkpoint, e que portanto NÃO devem ser dropadas/recriadas em
-    setup_tables(). Espelha os mesmos estágios usados para pular reprocessamento
-    em main() — só preserva o que já foi efetivamente concluído.
+    Retorna o conjunto de tabelas que já têm dado carregado segundo o
+    checkpoint — inteiras (carga concluída) ou em parte (tabela de fato em
+    carga, com os lotes gravados registrados em `etl_lotes`) — e que portanto
+    NÃO devem ser dropadas/recriadas em setup_tables().
     """
     if not checkpoint:
         return set()
 
-    stage = checkpoint.get("stage")
-    preserve = set()
-
-    past_empresa = (
-        "empresa_completed",
-        "estabelecimento",
-        "estabelecimento_completed",
-        "socios_completed",
-        "simples_completed",
-        "outros_completed",
-        "creating_indexes",
-    )
-    past_estabelecimento = (
-        "estabelecimento_completed",
-        "socios_completed",
-        "simples_completed",
-        "outros_completed",
-        "creating_indexes",
-    )
-    past_socios = ("socios_completed", "simples_completed", "outros_completed", "creating_indexes")
-    past_simples = ("simples_completed", "outros_completed", "creating_indexes")
-    past_outros = ("outros_completed", "creating_indexes")
-
-    if stage in past_empresa:
-        preserve.add("empresa")
-    # "estabelecimento" como stage significa retomada por arquivo — a tabela
-    # já tem dado parcial (arquivos 0..file_index-1) e não deve ser dropada
-    if stage == "estabelecimento" or stage in past_estabelecimento:
-        preserve.add("estabelecimento")
-    if stage in past_socios:
-        preserve.add("socios")
-    if stage in past_simples:
-        preserve.add("simples")
-    if stage in past_outros:
-        preserve.update({"cnae", "motivo", "municipio", "natureza", "pais", "qualificacao"})
-
+    tasks = checkpoint.get("tasks", {})
+    preserve = {
+        table
+        for table in FACT_TABLE_KEYS
+        if tasks.get(f"load:{table}") in (RUNNING, DONE)
+    }
+    # Tabelas de referência são recarregadas inteiras — só preservadas prontas
+    if tasks.get("load:outros") == DONE:
+        preserve.update(REFERENCE_TABLES)
     return preserve
 
 
@@ -1088,437 +1418,239 @@ async def setup_tables(pool, preserve_tables=None):
                 logger.info(
                     f"Tabela '{table_name}' preservada (checkpoint indica dado já carregado)"
                 )
+                await conn.execute(
+                    ddl.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1)
+                )
                 continue
             await conn.execute(f'DROP TABLE IF EXISTS "{table_name}";')
             await conn.execute(ddl)
 
-        print("Tabelas configuradas com sucesso!")
-
+        await conn.execute(METADATA_DDL)
+        await conn.execute(PROGRESS_DDL)
+        # Na carga incremental o destino é clone de um banco já finalizado:
+        # até o fim desta carga ele não pode ir para produção
+        await clear_finalize_marker(conn)
+        # Antes do grafo: as tarefas de índice podem rodar em paralelo
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
 
-async def process_empresa_files(pool):
-    """
-    Processa arquivos de empresa de forma assíncrona
-    """
-    empresa_insert_start = time.time()
-    print("""
-#######################
-## Arquivos de EMPRESA:
-#######################
-""")
-
-    empresa_columns = [
-        "cnpj_basico",
-        "razao_social",
-        "natureza_juridica",
-        "qualificacao_responsavel",
-        "capital_social",
-        "porte_empresa",
-        "ente_federativo_responsavel",
-    ]
-
-    for e in range(0, len(arquivos_empresa)):
-        print("Trabalhando no arquivo: " + arquivos_empresa[e] + " [...]")
-
-        extracted_file_path = os.path.join(extracted_files, arquivos_empresa[e])
-        utf8_path = None
-
-        try:
-            utf8_path = transcode_to_utf8(extracted_file_path)
-            empresa = pl.read_csv(
-                utf8_path,
-                separator=";",
-                has_header=False,
-                new_columns=empresa_columns,
-                schema_overrides=[pl.Utf8] * len(empresa_columns),
-                encoding="utf8",
-            )
-        except pl.exceptions.NoDataError:
-            print(f"Arquivo {arquivos_empresa[e]} está vazio. Pulando...")
-            continue
-        except Exception as ex:
-            logger.error(f"Erro ao ler arquivo {arquivos_empresa[e]}: {str(ex)}")
-            continue
-        finally:
-            if utf8_path and os.path.exists(utf8_path):
-                os.remove(utf8_path)
-
-        # Colunas numéricas — inválido/vazio vira NULL (strict=False), não exceção
-        empresa = empresa.with_columns(
-            [
-                pl.col("natureza_juridica").cast(pl.Int32, strict=False),
-                pl.col("qualificacao_responsavel").cast(pl.Int32, strict=False),
-                pl.col("porte_empresa").cast(pl.Int32, strict=False),
-                pl.col("capital_social")
-                .str.replace(",", ".", literal=True)
-                .cast(pl.Float64, strict=False),
-            ]
-        )
+        print("Tabelas configuradas com sucesso!")
 
-        # Gravar dados no banco usando função assíncrona
-        await to_sql_async(empresa, pool, "empresa")
-        logger.info(
-            f"Arquivo {arquivos_empresa[e]} inserido com sucesso no banco de dados!"
-        )
 
-        # Já carregado no banco — libera espaço em disco
-        remove_file_safe(extracted_file_path)
+FACT_TABLE_LABELS = {
+    "empresa": "EMPRESA",
+    "estabelecimento": "ESTABELECIMENTO",
+    "socios": "SOCIOS",
+    "simples": "SIMPLES NACIONAL",
+}
 
-        # Liberar memória explicitamente
-        del empresa
-        gc.collect()
 
-    print("Arquivos de empresa finalizados!")
-    empresa_insert_end = time.time()
-    empresa_Tempo_insert = round((empresa_insert_end - empresa_insert_start))
-    print(
-        "Tempo de execução do processo de empresa (em segundos): "
-        + str(empresa_Tempo_insert)
-    )
+def _overlaps(done, offset, size):
+    return any(start < offset + size and offset < start + length for start, length in done.items())
 
 
-async def process_estabelecimento_files(pool):
+async def load_fact_file(pool, table_name, file_name, done, progress):
     """
-    Processa arquivos de estabelecimento de forma assíncrona
+    Carrega um arquivo em lotes, pulando os já registrados em `done`
+    ({byte_inicio: bytes}). O processo principal só corta o arquivo; cada lote
+    é tratado e codificado no pool de processos e depois gravado, com até
+    `copy_concurrency` (perfil de tuning) COPY ao mesmo tempo. O próximo lote só é despachado
+    quando uma vaga abre, o que limita a memória. Retorna True se todos os
+    lotes do arquivo estão no banco.
     """
-    estabelecimento_insert_start = time.time()
-    logger.info("Iniciando processamento dos arquivos de ESTABELECIMENTO")
-    console.print("\n[bold green]###############################[/bold green]")
-    console.print("[bold green]## Arquivos de ESTABELECIMENTO:[/bold green]")
-    console.print("[bold green]###############################[/bold green]\n")
-
-    logger.info(f"Tem {len(arquivos_estabelecimento)} arquivos de estabelecimento!")
-
-    # Verificar checkpoint
-    checkpoint = load_checkpoint()
-    start_index = 0
-
-    if checkpoint and checkpoint["stage"] == "estabelecimento":
-        start_index = checkpoint.get("file_index", 0)
-        console.print(
-            f"[yellow]Retomando do arquivo {start_index + 1}/{len(arquivos_estabelecimento)}[/yellow]"
-        )
-
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        MofNCompleteColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeElapsedColumn(),
-        TimeRemainingColumn(),
-        console=console,
-    ) as progress:
-        files_task = progress.add_task(
-            "Processando arquivos ESTABELECIMENTO", total=len(arquivos_estabelecimento)
-        )
-        progress.update(files_task, completed=start_index)
-
-        estabelecimento_columns = [
-            "cnpj_basico",
-            "cnpj_ordem",
-            "cnpj_dv",
-            "identificador_matriz_filial",
-            "nome_fantasia",
-            "situacao_cadastral",
-            "data_situacao_cadastral",
-            "motivo_situacao_cadastral",
-            "nome_cidade_exterior",
-            "pais",
-            "data_inicio_atividade",
-            "cnae_fiscal_principal",
-            "cnae_fiscal_secundaria",
-            "tipo_logradouro",
-            "logradouro",
-            "numero",
-            "complemento",
-            "bairro",
-            "cep",
-            "uf",
-            "municipio",
-            "ddd_1",
-            "telefone_1",
-            "ddd_2",
-            "telefone_2",
-            "ddd_fax",
-            "fax",
-            "correio_eletronico",
-            "situacao_especial",
-            "data_situacao_especial",
-        ]
-        estabelecimento_int32_cols = [
-            "identificador_matriz_filial",
-            "situacao_cadastral",
-            "motivo_situacao_cadastral",
-            "pais",
-            "cnae_fiscal_principal",
-            "municipio",
-        ]
-
-        for e in range(start_index, len(arquivos_estabelecimento)):
-            logger.info(f"Trabalhando no arquivo: {arquivos_estabelecimento[e]}")
-
-            extracted_file_path = os.path.join(
-                extracted_files, arquivos_estabelecimento[e]
-            )
-
-            parts_task = progress.add_task(
-                f"Processando {arquivos_estabelecimento[e]}", total=None
-            )
-            NROWS = 2000000
-            part = 0
-            utf8_path = None
+    path = os.path.join(extracted_files, file_name)
+    file_size = os.path.getsize(path)
+    parts_task = progress.add_task(f"Processando {file_name}", total=None)
+    loop = asyncio.get_running_loop()
+    executor, workers = get_encode_pool()
+    # Lotes em andamento (codificando + gravando) e COPY simultâneos
+    copy_concurrency = get_tuning().copy_concurrency
+    in_flight = asyncio.Semaphore(workers + copy_concurrency)
+    copy_slots = asyncio.Semaphore(copy_concurrency)
+    keep_frame = table_name in incremental_loads
+    tasks = []
+    failures = 0
+    skipped = 0
+
+    async def segment_task(offset, size):
+        nonlocal failures
+        try:
             try:
-                utf8_path = transcode_to_utf8(extracted_file_path)
-                lf = pl.scan_csv(
-                    utf8_path,
-                    separator=";",
-                    has_header=False,
-                    new_columns=estabelecimento_columns,
-                    schema_overrides=[pl.Utf8] * len(estabelecimento_columns),
-                    encoding="utf8",
+                encoded = await loop.run_in_executor(
+                    executor, encode_segment, path, offset, size, table_name, keep_frame
                 )
-                for estabelecimento in lf.collect_batches(chunk_size=NROWS):
-                    if estabelecimento.height == 0:
-                        continue
-
-                    # Colunas numéricas — inválido/vazio vira NULL (strict=False)
-                    estabelecimento = estabelecimento.with_columns(
-                        [
-                            pl.col(c).cast(pl.Int32, strict=False)
-                            for c in estabelecimento_int32_cols
-                        ]
-                    )
-
-                    await to_sql_async(estabelecimento, pool, "estabelecimento")
-                    logger.info(
-                        f"Parte {part + 1} do arquivo {arquivos_estabelecimento[e]} inserida com sucesso!"
+            except Exception as ex:
+                failures += 1
+                logger.error(f"Erro ao ler lote {offset} de {file_name}: {str(ex)}")
+                return
+            async with copy_slots:
+                try:
+                    await copy_segment(
+                        pool, table_name, file_name, offset, size, encoded, file_size
                     )
-                    progress.update(parts_task, advance=1)
+                except Exception as ex:
+                    failures += 1
+                    logger.error(f"Erro ao gravar lote {offset} de {file_name}: {str(ex)}")
+        finally:
+            in_flight.release()
+            progress.update(parts_task, advance=1)
 
-                    part += 1
-                    del estabelecimento
-                    gc.collect()
-            except pl.exceptions.NoDataError:
-                logger.info(
-                    f"Fim do arquivo {arquivos_estabelecimento[e]} na parte {part}"
-                )
-            except Exception as ex:
-                logger.error(
-                    f"Erro ao ler arquivo {arquivos_estabelecimento[e]} na parte {part}: {str(ex)}"
+    try:
+        for offset, data in iter_segments(path):
+            size = len(data)
+            del data
+            if done.get(offset) == size:
+                skipped += 1
+                progress.update(parts_task, advance=1)
+                continue
+            if _overlaps(done, offset, size):
+                # Os lotes gravados não batem com o corte atual (SEGMENT_BYTES
+                # mudou?) — regravar duplicaria linhas
+                raise RuntimeError(
+                    f"Lotes gravados de {file_name} não batem com o corte atual do "
+                    f"arquivo (byte {offset}) — recarregue a tabela {table_name} do zero"
                 )
-            finally:
-                if utf8_path and os.path.exists(utf8_path):
-                    os.remove(utf8_path)
-
-            logger.info(
-                f"Arquivo {arquivos_estabelecimento[e]} inserido com sucesso no banco de dados!"
-            )
-            progress.update(files_task, advance=1)
-            progress.remove_task(parts_task)
-
-            # Salvar checkpoint após cada arquivo processado
-            save_checkpoint("estabelecimento", e + 1)
 
-            # Já carregado no banco — libera espaço em disco
-            remove_file_safe(extracted_file_path)
+            await in_flight.acquire()
+            tasks.append(asyncio.create_task(segment_task(offset, size)))
+    finally:
+        await asyncio.gather(*tasks)
+        progress.remove_task(parts_task)
 
-    logger.info("Arquivos de estabelecimento finalizados!")
-    estabelecimento_insert_end = time.time()
-    estabelecimento_Tempo_insert = round(
-        (estabelecimento_insert_end - estabelecimento_insert_start)
-    )
-    logger.info(
-        f"Tempo de execução do processo de estabelecimento (em segundos): {estabelecimento_Tempo_insert}"
-    )
+    if skipped:
+        logger.info(f"{file_name}: {skipped} lotes já gravados numa execução anterior — pulados")
+        mark_incremental_incomplete(
+            table_name, f"retomada — lotes de {file_name} gravados antes não foram relidos"
+        )
+    return failures == 0
 
 
-async def process_socios_files(pool):
+async def process_fact_files(pool, table_name, arquivos, resume=False):
     """
-    Processa arquivos de sócios de forma assíncrona
+    Processa os arquivos de uma tabela de fato em lotes retomáveis. Com
+    `resume`, os lotes registrados em `etl_lotes` por uma execução anterior
+    interrompida são pulados; sem ele, o registro da tabela é zerado e tudo é
+    carregado de novo.
     """
-    socios_insert_start = time.time()
-    print("""
-######################
-## Arquivos de SOCIOS:
-######################
-""")
-
-    socios_columns = [
-        "cnpj_basico",
-        "identificador_socio",
-        "nome_socio",
-        "cnpj_cpf_socio",
-        "qualificacao_socio",
-        "data_entrada_sociedade",
-        "pais",
-        "representante_legal",
-        "nome_representante",
-        "qualificacao_representante_legal",
-        "faixa_etaria",
-    ]
+    insert_start = time.time()
+    label = FACT_TABLE_LABELS[table_name]
+    logger.info(f"Iniciando processamento dos arquivos de {label}")
+    console.print(f"\n[bold green]## Arquivos de {label}:[/bold green]\n")
+    logger.info(f"Tem {len(arquivos)} arquivos de {table_name}!")
 
-    for e in range(0, len(arquivos_socios)):
-        print("Trabalhando no arquivo: " + arquivos_socios[e] + " [...]")
+    async with pool.acquire() as conn:
+        if resume:
+            committed = await committed_segments(conn, table_name)
+            if committed:
+                total = sum(len(v) for v in committed.values())
+                console.print(
+                    f"[yellow]Retomando {table_name}: {total} lotes já gravados serão pulados[/yellow]"
+                )
+        else:
+            await clear_segments(conn, table_name)
+            committed = {}
+        # Arquivos esperados — a conciliação acusa um que não chegou ao livro
+        await write_metadata(conn, f"arquivos:{table_name}", json.dumps(sorted(arquivos)))
 
-        extracted_file_path = os.path.join(extracted_files, arquivos_socios[e])
-        utf8_path = None
+    await begin_incremental_table(pool, table_name)
 
-        try:
-            utf8_path = transcode_to_utf8(extracted_file_path)
-            socios = pl.read_csv(
-                utf8_path,
-                separator=";",
-                has_header=False,
-                new_columns=socios_columns,
-                schema_overrides=[pl.Utf8] * len(socios_columns),
-                encoding="utf8",
-            )
-        except pl.exceptions.NoDataError:
-            print(f"Arquivo {arquivos_socios[e]} está vazio. Pulando...")
-            continue
-        except Exception as ex:
-            logger.error(f"Erro ao ler arquivo {arquivos_socios[e]}: {str(ex)}")
-            continue
-        finally:
-            if utf8_path and os.path.exists(utf8_path):
-                os.remove(utf8_path)
-
-        # Colunas numéricas — inválido/vazio vira NULL (strict=False), não exceção
-        socios = socios.with_columns(
-            [
-                pl.col("identificador_socio").cast(pl.Int32, strict=False),
-                pl.col("qualificacao_socio").cast(pl.Int32, strict=False),
-                pl.col("pais").cast(pl.Int32, strict=False),
-                pl.col("qualificacao_representante_legal").cast(pl.Int32, strict=False),
-                pl.col("faixa_etaria").cast(pl.Int32, strict=False),
-            ]
+    failed = []
+    with progress_display() as progress:
+        files_task = progress.add_task(
+            f"Processando arquivos {label}", total=len(arquivos)
         )
-
-        # Gravar dados no banco usando função assíncrona
-        await to_sql_async(socios, pool, "socios")
-        logger.info(
-            f"Arquivo {arquivos_socios[e]} inserido com sucesso no banco de dados!"
+        for file_name in arquivos:
+            logger.info(f"Trabalhando no arquivo: {file_name}")
+            ok = await load_fact_file(
+                pool, table_name, file_name, committed.get(file_name, {}), progress
+            )
+            progress.update(files_task, advance=1)
+            if ok:
+                logger.info(f"Arquivo {file_name} inserido com sucesso no banco de dados!")
+                # Já carregado no banco — libera espaço em disco
+                remove_file_safe(os.path.join(extracted_files, file_name))
+            else:
+                failed.append(file_name)
+            gc.collect()
+        progress.remove_task(files_task)
+
+    if failed:
+        # Os lotes que falharam não foram registrados: rodar de novo retoma
+        # exatamente deles, sem regravar o resto
+        mark_incremental_incomplete(table_name, f"falha ao carregar {', '.join(failed)}")
+        raise RuntimeError(
+            f"Lotes de {table_name} não gravados ({', '.join(failed)}) — "
+            "rode o ETL novamente para retomar os lotes pendentes"
         )
 
-        # Já carregado no banco — libera espaço em disco
-        remove_file_safe(extracted_file_path)
+    await finish_incremental_table(pool, table_name)
+    await log_ledger_totals(pool, table_name)
 
-        del socios
-        gc.collect()
-
-    print("Arquivos de socios finalizados!")
-    socios_insert_end = time.time()
-    socios_Tempo_insert = round((socios_insert_end - socios_insert_start))
-    print(
-        "Tempo de execução do processo de sócios (em segundos): "
-        + str(socios_Tempo_insert)
+    insert_time = round(time.time() - insert_start)
+    logger.info(f"Arquivos de {table_name} finalizados!")
+    logger.info(
+        f"Tempo de execução do processo de {table_name} (em segundos): {insert_time}"
     )
 
 
-async def process_simples_files(pool):
-    """
-    Processa arquivos do Simples Nacional de forma assíncrona
-    """
-    simples_insert_start = time.time()
-    logger.info("Iniciando processamento dos arquivos do SIMPLES NACIONAL")
-    console.print("\n[bold blue]################################[/bold blue]")
-    console.print("[bold blue]## Arquivos do SIMPLES NACIONAL:[/bold blue]")
-    console.print("[bold blue]################################[/bold blue]\n")
-
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        MofNCompleteColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeElapsedColumn(),
-        TimeRemainingColumn(),
-        console=console,
-    ) as progress:
-        files_task = progress.add_task(
-            "Processando arquivos SIMPLES", total=len(arquivos_simples)
+async def record_reference_file(pool, table_name, file_path, rows, start):
+    """Lança um arquivo de tabela de referência no livro de conciliação."""
+    size = os.path.getsize(file_path)
+    async with pool.acquire() as conn:
+        await record_segment(
+            conn,
+            table_name,
+            os.path.basename(file_path),
+            0,
+            size,
+            rows,
+            file_size=size,
+            copy_seconds=time.time() - start,
         )
 
-        simples_columns = [
-            "cnpj_basico",
-            "opcao_pelo_simples",
-            "data_opcao_simples",
-            "data_exclusao_simples",
-            "opcao_mei",
-            "data_opcao_mei",
-            "data_exclusao_mei",
-        ]
-
-        for e in range(0, len(arquivos_simples)):
-            logger.info(f"Trabalhando no arquivo: {arquivos_simples[e]}")
-
-            extracted_file_path = os.path.join(extracted_files, arquivos_simples[e])
-
-            tamanho_das_partes = 1000000  # Registros por carga
-
-            parts_task = progress.add_task(
-                f"Processando {arquivos_simples[e]}", total=None
-            )
-
-            part = 0
-            utf8_path = None
-            try:
-                utf8_path = transcode_to_utf8(extracted_file_path)
-                lf = pl.scan_csv(
-                    utf8_path,
-                    separator=";",
-                    has_header=False,
-                    new_columns=simples_columns,
-                    schema_overrides=[pl.Utf8] * len(simples_columns),
-                    encoding="utf8",
-                )
-                for simples in lf.collect_batches(chunk_size=tamanho_das_partes):
-                    if simples.height == 0:
-                        continue
-
-                    # Gravar dados no banco usando função assíncrona
-                    await to_sql_async(simples, pool, "simples")
-
-                    part += 1
-                    logger.info(
-                        f"Parte {part} do arquivo {arquivos_simples[e]} inserida com sucesso no banco de dados!"
-                    )
-                    progress.update(parts_task, advance=1)
-                    del simples
-                    gc.collect()
-            except pl.exceptions.NoDataError:
-                logger.info(
-                    f"Fim do arquivo {arquivos_simples[e]} alcançado na parte {part}"
-                )
-            except Exception as ex:
-                logger.error(
-                    f"Erro ao ler arquivo {arquivos_simples[e]} na parte {part}: {str(ex)}"
-                )
-            finally:
-                if utf8_path and os.path.exists(utf8_path):
-                    os.remove(utf8_path)
-
-            logger.info(
-                f"Arquivo {arquivos_simples[e]} inserido com sucesso no banco de dados!"
-            )
-            progress.update(files_task, advance=1)
-            progress.remove_task(parts_task)
-
-            # Já carregado no banco — libera espaço em disco
-            remove_file_safe(extracted_file_path)
 
-    logger.info("Arquivos do Simples Nacional finalizados!")
-    simples_insert_end = time.time()
-    simples_Tempo_insert = round((simples_insert_end - simples_insert_start))
+async def log_ledger_totals(pool, table_name):
+    async with pool.acquire() as conn:
+        r = await conn.fetchrow(
+            """
+            SELECT COUNT(*) AS lotes, SUM(linhas) AS lidas,
+                   SUM(linhas_copiadas) AS copiadas, SUM(rejeitadas) AS rejeitadas
+            FROM etl_lotes WHERE tabela = $1
+            """,
+            table_name,
+        )
     logger.info(
-        f"Tempo de execução do processo do Simples Nacional (em segundos): {simples_Tempo_insert}"
+        f"Conciliação {table_name}: {r['lotes']} lotes, {r['lidas'] or 0:,} linhas lidas, "
+        f"{r['copiadas'] or 0:,} gravadas, {r['rejeitadas'] or 0:,} com campo descartado"
     )
 
 
+async def ledger_counts(pool):
+    """Tabela → linhas lidas, gravadas e rejeitadas, somadas do etl_lotes."""
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT tabela, SUM(linhas) AS lidas, SUM(linhas_copiadas) AS gravadas,
+                   SUM(rejeitadas) AS rejeitadas
+            FROM etl_lotes GROUP BY tabela ORDER BY tabela
+            """
+        )
+    return {
+        r["tabela"]: {k: int(r[k] or 0) for k in ("lidas", "gravadas", "rejeitadas")}
+        for r in rows
+    }
+
+
 async def process_outros_arquivos(pool):
     """
     Processa os demais arquivos (CNAE, Motivo, Municipio, etc.)
     """
     print("Processando arquivos auxiliares (CNAE, Motivo, Municipio, etc.)")
 
+    # As tabelas de referência são sempre recarregadas por inteiro
+    async with pool.acquire() as conn:
+        for table_name in REFERENCE_TABLES:
+            await clear_segments(conn, table_name)
+
     def _read_codigo_descricao(extracted_file_path):
         utf8_path = transcode_to_utf8(extracted_file_path)
         try:
@@ -1538,6 +1670,7 @@ async def process_outros_arquivos(pool):
     if arquivos_cnae:
         for e in range(0, len(arquivos_cnae)):
             extracted_file_path = os.path.join(extracted_files, arquivos_cnae[e])
+            start = time.time()
             try:
                 cnae = _read_codigo_descricao(extracted_file_path)
             except pl.exceptions.NoDataError:
@@ -1547,6 +1680,7 @@ async def process_outros_arquivos(pool):
                 logger.error(f"Erro ao ler arquivo CNAE {arquivos_cnae[e]}: {str(e)}")
                 continue
             await to_sql_async(cnae, pool, "cnae")
+            await record_reference_file(pool, "cnae", extracted_file_path, cnae.height, start)
             logger.info(f"Arquivo CNAE {arquivos_cnae[e]} inserido!")
             remove_file_safe(extracted_file_path)
             del cnae
@@ -1563,6 +1697,7 @@ async def process_outros_arquivos(pool):
         if arquivo_tipo:
             for e in range(0, len(arquivo_tipo)):
                 extracted_file_path = os.path.join(extracted_files, arquivo_tipo[e])
+                start = time.time()
                 try:
                     df = _read_codigo_descricao(extracted_file_path)
                 except pl.exceptions.NoDataError:
@@ -1576,171 +1711,218 @@ async def process_outros_arquivos(pool):
                     )
                     continue
                 await to_sql_async(df, pool, nome_tabela)
+                await record_reference_file(
+                    pool, nome_tabela, extracted_file_path, df.height, start
+                )
                 logger.info(f"Arquivo {nome_tabela} {arquivo_tipo[e]} inserido!")
                 remove_file_safe(extracted_file_path)
                 del df
                 gc.collect()
 
 
-async def create_indexes(pool):
+# Índices criados pelo ETL — definidos em src/indexes/catalog.py
+INDEXES = index_definitions()
+
+
+# Agendador compartilhado pelas tarefas de índice do grafo — o orçamento de
+# memória/workers vale para todos os builds em andamento, de qualquer tabela
+_index_scheduler = None
+
+
+async def get_index_scheduler(pool):
+    """
+    Cria o agendador na primeira chamada, com os orçamentos do perfil de
+    tuning. Workers paralelos acima do max_parallel_workers do servidor seriam
+    ignorados pelo Postgres — o orçamento é limitado a ele.
+    """
+    global _index_scheduler
+    if _index_scheduler is None:
+        tuning = get_tuning()
+        async with pool.acquire() as conn:
+            server_workers = int(await conn.fetchval("SHOW max_parallel_workers"))
+        _index_scheduler = IndexBuildScheduler(
+            pool,
+            concurrency=tuning.index_builds,
+            mem_budget=tuning.maintenance_work_mem,
+            worker_budget=min(tuning.parallel_maintenance_workers, server_workers),
+        )
+    return _index_scheduler
+
+
+async def create_indexes(pool, tables=None):
     """
-    Cria índices nas tabelas de forma assíncrona com timeout maior
+    Cria índices nas tabelas, vários em paralelo (ver src/etl/index_builds.py).
+    Com `tables`, só os índices dessas tabelas — o grafo do ETL cria os de
+    cada tabela assim que a carga dela termina.
     """
+    indexes = [i for i in INDEXES if tables is None or i["table"] in tables]
+    if args.defer_indexes:
+        indexes = [i for i in indexes if i["tier"] == CORE]
     console.print(
-        "\n[bold yellow]🔨 [FASE 4] Criando índices para otimização de consultas...[/bold yellow]"
+        "\n[bold yellow]🔨 [FASE 4] Criando índices "
+        f"({', '.join(tables) if tables else 'todas as tabelas'})...[/bold yellow]"
     )
 
-    # Lista completa de índices baseada no script create_indexes.py
-    indexes = [
-        {
-            "name": "empresa_cnpj",
-            "table": "empresa",
-            "columns": "cnpj_basico",
-            "sql": "CREATE INDEX IF NOT EXISTS empresa_cnpj ON empresa(cnpj_basico);",
-        },
-        {
-            "name": "estabelecimento_cnpj",
-            "table": "estabelecimento",
-            "columns": "cnpj_basico",
-            "sql": "CREATE INDEX IF NOT EXISTS estabelecimento_cnpj ON estabelecimento(cnpj_basico);",
-        },
-        {
-            "name": "estabelecimento_cnpj_completo",
-            "table": "estabelecimento",
-            "columns": "cnpj_basico, cnpj_ordem, cnpj_dv",
-            "sql": "CREATE INDEX IF NOT EXISTS estabelecimento_cnpj_completo ON estabelecimento(cnpj_basico, cnpj_ordem, cnpj_dv);",
-        },
-        {
-            "name": "socios_cnpj",
-            "table": "socios",
-            "columns": "cnpj_basico",
-            "sql": "CREATE INDEX IF NOT EXISTS socios_cnpj ON socios(cnpj_basico);",
-        },
-        {
-            "name": "simples_cnpj",
-            "table": "simples",
-            "columns": "cnpj_basico",
-            "sql": "CREATE INDEX IF NOT EXISTS simples_cnpj ON simples(cnpj_basico);",
-        },
-        {
-            "name": "estabelecimento_situacao",
-            "table": "estabelecimento",
-            "columns": "situacao_cadastral",
-            "sql": "CREATE INDEX IF NOT EXISTS estabelecimento_situacao ON estabelecimento(situacao_cadastral);",
-        },
-        {
-            "name": "estabelecimento_municipio",
-            "table": "estabelecimento",
-            "columns": "municipio",
-            "sql": "CREATE INDEX IF NOT EXISTS estabelecimento_municipio ON estabelecimento(municipio);",
-        },
-        {
-            "name": "empresa_razao_social_trgm",
-            "table": "empresa",
-            "columns": "razao_social (GIN trgm)",
-            "sql": "CREATE INDEX IF NOT EXISTS empresa_razao_social_trgm ON empresa USING GIN (razao_social gin_trgm_ops);",
-        },
-        {
-            "name": "estabelecimento_nome_fantasia_trgm",
-            "table": "estabelecimento",
-            "columns": "nome_fantasia (GIN trgm)",
-            "sql": "CREATE INDEX IF NOT EXISTS estabelecimento_nome_fantasia_trgm ON estabelecimento USING GIN (nome_fantasia gin_trgm_ops);",
-        },
-    ]
+    scheduler = await get_index_scheduler(pool)
+    with progress_display() as progress:
+        builds = await scheduler.build(indexes, progress=progress)
 
-    created_count = 0
-    failed_count = 0
-    skipped_count = 0
+    created_count = sum(b.status == "created" for b in builds)
+    skipped_count = sum(b.status in ("exists", "skipped") for b in builds)
+    failed_count = sum(b.status == "failed" for b in builds)
 
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        MofNCompleteColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeElapsedColumn(),
-        TimeRemainingColumn(),
-        console=console,
-    ) as progress:
-        index_task = progress.add_task("Criando índices", total=len(indexes))
+    console.print(f"\n[green]✅ Criação de índices concluída![/green]")
+    console.print(f"[green]  • Índices criados: {created_count}[/green]")
+    console.print(f"[blue]  • Índices já existentes: {skipped_count}[/blue]")
+    if failed_count > 0:
+        console.print(f"[red]  • Índices com erro: {failed_count}[/red]")
+        # Sem a exceção a tarefa index:<tabela> ficaria DONE no checkpoint e a
+        # retomada nunca refaria o índice que falhou
+        failed = [b.name for b in builds if b.status == "failed"]
+        raise RuntimeError(f"Falha ao criar índices: {', '.join(failed)}")
 
-        async with pool.acquire() as conn:
-            await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
 
-        async with pool.acquire() as conn:
-            # Configurar timeout maior para criação de índices
-            await conn.execute("SET statement_timeout = '3600000';")  # 1 hora
-            await conn.execute("SET lock_timeout = '3600000';")
+async def recover_bulk_mode():
+    """
+    Uma execução anterior morreu com o modo de carga em massa ativo: restaura
+    as configurações gravadas antes de começar. O banco do estado pode não
+    ser o destino desta execução, então a conexão é aberta nele (e no schema).
+    """
+    state = read_bulk_state()
+    if state is None:
+        return
+    console.print(
+        "[yellow]Modo carga em massa ficou ativo numa execução anterior — "
+        f"restaurando configurações de '{state['database']}'...[/yellow]"
+    )
+    conn = await connect_state(
+        state,
+        user=getEnv("DB_USER"),
+        password=getEnv("DB_PASSWORD"),
+        host=getEnv("DB_HOST"),
+        port=getEnv("DB_PORT"),
+    )
+    try:
+        ok = await restore_bulk_mode(conn)
+    finally:
+        await conn.close()
+    if not ok:
+        raise RuntimeError(
+            f"Não foi possível restaurar o modo carga em massa — rode: {RECOVERY_COMMAND}"
+        )
 
-            for index_info in indexes:
-                try:
-                    # Verificar se a tabela existe
-                    table_exists = await conn.fetchval(
-                        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = $1)",
-                        index_info["table"],
-                    )
 
-                    if not table_exists:
-                        logger.warning(
-                            f"Tabela {index_info['table']} não encontrada, pulando índice {index_info['name']}"
-                        )
-                        skipped_count += 1
-                        progress.update(index_task, advance=1)
-                        continue
-
-                    # Verificar se o índice já existe
-                    index_exists = await conn.fetchval(
-                        "SELECT EXISTS(SELECT 1 FROM pg_indexes WHERE indexname = $1)",
-                        index_info["name"],
-                    )
+async def finalize_tables(pool, tables):
+    """VACUUM (FREEZE, ANALYZE) e estatísticas das tabelas recém-carregadas."""
+    async with pool.acquire() as conn:
+        for table_name in tables:
+            await finalize_table(conn, table_name)
 
-                    if index_exists:
-                        logger.info(f"Índice {index_info['name']} já existe")
-                        skipped_count += 1
-                        progress.update(index_task, advance=1)
-                        continue
 
-                    # Obter tamanho da tabela
-                    table_size = await conn.fetchval(
-                        f"SELECT COUNT(*) FROM {index_info['table']}"
-                    )
+# Quantas tarefas de cada recurso o grafo roda ao mesmo tempo. Uma carga já
+# ocupa copy_concurrency conexões; as tarefas de índice só enfileiram builds
+# no agendador, que é quem limita os builds simultâneos. A finalização de
+# tabelas diferentes roda em paralelo
+TASK_BUDGET = {"load": 1, "index": 4, "finalize": 2}
 
-                    logger.info(
-                        f"Criando índice {index_info['name']} na tabela {index_info['table']} ({table_size:,} registros)"
-                    )
 
-                    start_time = time.time()
-                    # timeout explícito: o pool tem command_timeout=300s (create_db_pool),
-                    # que sobrepõe o "SET statement_timeout" acima — sem isso, índices GIN
-                    # trgm em tabelas grandes (ex: empresa_razao_social_trgm, 69M+ linhas)
-                    # estouram o timeout do lado do cliente antes de terminar no servidor
-                    await conn.execute(index_info["sql"], timeout=3600)
-                    elapsed_time = time.time() - start_time
+def build_task_graph(pool, checkpoint):
+    """
+    Monta o grafo do ETL: para cada tabela de fato, carga → índices →
+    finalização (VACUUM FREEZE/ANALYZE, depois dos índices para que o VACUUM
+    já preencha o mapa de visibilidade usado pelos index-only scans); as
+    tabelas de referência só têm carga e finalização. Cargas disputam o mesmo
+    recurso e seguem a ordem declarada; os índices de uma tabela começam assim
+    que a carga dela termina, em paralelo com a carga da próxima.
+    """
+    graph = TaskGraph(
+        TASK_BUDGET,
+        status=(checkpoint or {}).get("tasks"),
+        on_change=save_checkpoint,
+    )
+    fact_files = {
+        "empresa": arquivos_empresa,
+        "estabelecimento": arquivos_estabelecimento,
+        "socios": arquivos_socios,
+        "simples": arquivos_simples,
+    }
+    for table_name, arquivos in fact_files.items():
+        graph.add(
+            f"load:{table_name}",
+            lambda resume, t=table_name, a=arquivos: process_fact_files(pool, t, a, resume),
+            resource="load",
+        )
+        graph.add(
+            f"index:{table_name}",
+            lambda resume, t=table_name: create_indexes(pool, [t]),
+            deps=[f"load:{table_name}"],
+            resource="index",
+        )
+        graph.add(
+            f"finalize:{table_name}",
+            lambda resume, t=table_name: finalize_tables(pool, [t]),
+            deps=[f"index:{table_name}"],
+            resource="finalize",
+        )
+
+    graph.add("load:outros", lambda resume: process_outros_arquivos(pool), resource="load")
+    graph.add(
+        "finalize:outros",
+        lambda resume: finalize_tables(pool, REFERENCE_TABLES),
+        deps=["load:outros"],
+        resource="finalize",
+    )
+    graph.add(
+        "loads_completed",
+        lambda resume: after_loads(graph),
+        deps=[name for name in graph.tasks if name.startswith("load:")],
+    )
+    return graph
 
-                    logger.info(
-                        f"Índice {index_info['name']} criado com sucesso em {elapsed_time:.1f}s"
-                    )
-                    created_count += 1
 
-                except Exception as e:
-                    logger.error(f"Erro ao criar índice {index_info['name']}: {e}")
-                    failed_count += 1
+async def after_loads(graph):
+    """
+    Todas as cargas terminaram — os índices das tabelas carregadas primeiro
+    já podem estar prontos. Libera os ZIPs e mostra o que ainda falta.
+    """
+    # Os ZIPs não servem mais nesta execução (não ajudam numa reexecução
+    # futura, já que o dataset da Receita Federal muda todo mês)
+    console.print(
+        "\n[bold yellow]🧹 Limpando arquivos ZIP já processados...[/bold yellow]"
+    )
+    for _name in os.listdir(output_files):
+        if _name.lower().endswith(".zip"):
+            remove_file_safe(os.path.join(output_files, _name))
 
-                progress.update(index_task, advance=1)
+    pending = [name for name in graph.outstanding() if name != "loads_completed"]
+    if pending:
+        console.print(
+            f"[blue]Cargas concluídas — aguardando: {', '.join(pending)}[/blue]"
+        )
 
-    console.print(f"\n[green]✅ Criação de índices concluída![/green]")
-    console.print(f"[green]  • Índices criados: {created_count}[/green]")
-    console.print(f"[blue]  • Índices já existentes: {skipped_count}[/blue]")
-    if failed_count > 0:
-        console.print(f"[red]  • Índices com erro: {failed_count}[/red]")
+
+def print_task_timeline(graph, start_time):
+    """Quando cada tarefa rodou — mostra a sobreposição de cargas e índices."""
+    if not graph.timings:
+        return
+    timeline = Table(title="🕸️ Tarefas")
+    timeline.add_column("Tarefa", style="cyan")
+    timeline.add_column("Início", justify="right")
+    timeline.add_column("Duração", justify="right", style="magenta")
+    for name, (started, ended) in sorted(graph.timings.items(), key=lambda t: t[1][0]):
+        timeline.add_row(
+            name,
+            f"+{started - start_time:.0f}s",
+            f"{(ended or time.time()) - started:.1f}s",
+        )
+    console.print(timeline)
 
 
-async def main():
+async def main() -> EtlResult:
     """
-    Função principal que executa todo o processo de ETL de forma assíncrona
+    Função principal que executa todo o processo de ETL de forma assíncrona.
+    Devolve os tempos por fase/tarefa e as contagens da carga.
     """
-    _project_root = str(pathlib.Path(__file__).resolve().parent.parent.parent)
-    if _project_root not in sys.path:
-        sys.path.insert(0, _project_root)
     from src.blue_green.state import StateManager
 
     console.print("\n[bold magenta]" + "=" * 50 + "[/bold magenta]")
@@ -1752,7 +1934,25 @@ async def main():
     db_target = args.db_target
     state = StateManager()
 
-    console.print(f"[blue]Destino do banco: {db_target}[/blue]")
+    # SIGTERM cancela main() como o Ctrl+C — os blocos finally (restauração
+    # do modo carga em massa, fechamento dos pools) rodam nos dois casos
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        return await _run(state, db_target)
+    finally:
+        # Usado como biblioteca, o processo segue depois do ETL
+        loop.remove_signal_handler(signal.SIGTERM)
+
+
+async def _run(state, db_target) -> EtlResult:
+
+    db_schema = args.db_schema
+
+    console.print(
+        f"[blue]Destino do banco: {db_target}"
+        f"{f' (schema {db_schema})' if db_schema else ''}[/blue]"
+    )
 
     start_time = time.time()
     logger.info("Processo ETL iniciado")
@@ -1816,19 +2016,43 @@ async def main():
         )
         logger.info("Iniciando processamento e inserção no banco")
 
-        # Criar banco de dados se não existir
-        await create_database_if_not_exists(db_name=db_target)
+        # Criar banco de dados se não existir — na carga incremental o destino
+        # nasce como clone do banco base (a carga anterior)
+        await create_database_if_not_exists(
+            db_name=db_target,
+            template=args.incremental_base if args.incremental else None,
+        )
 
         # Criar pool de conexões
-        pool = await create_db_pool(db_name=db_target)
+        pool = await create_db_pool(db_name=db_target, schema=db_schema)
 
         try:
+            if db_schema:
+                async with pool.acquire() as conn:
+                    await ensure_staging_schema(conn, db_schema)
+
             # Checkpoint precisa ser lido ANTES de configurar as tabelas: se uma
             # execução anterior já carregou algumas tabelas com sucesso, elas
             # não devem ser dropadas/recriadas aqui (setup_tables preserva o
             # que já está pronto)
             checkpoint = load_checkpoint()
             preserve = tables_to_preserve(checkpoint)
+
+            if args.incremental:
+                problems = await check_incremental_base(pool, FACT_TABLE_KEYS)
+                if problems:
+                    raise RuntimeError(
+                        "Banco destino não suporta carga incremental: "
+                        + "; ".join(problems)
+                        + " — rode uma carga completa (sem --incremental)"
+                    )
+                console.print(
+                    "[blue]Modo incremental: aplicando apenas o delta sobre "
+                    f"'{db_target}'[/blue]"
+                )
+                # Tabelas de fato são atualizadas no lugar; as de referência
+                # (pequenas) continuam sendo recarregadas por inteiro
+                preserve |= set(FACT_TABLE_KEYS)
             if preserve:
                 console.print(
                     f"[yellow]Retomando checkpoint — preservando tabelas já carregadas: "
@@ -1838,76 +2062,76 @@ async def main():
             # Configurar tabelas
             await setup_tables(pool, preserve_tables=preserve)
 
-            # Verificar qual etapa retomar
-            if not checkpoint or checkpoint["stage"] == "empresa":
-                await process_empresa_files(pool)
-                save_checkpoint("empresa_completed")
-
-            if not checkpoint or checkpoint["stage"] in [
-                "empresa",
-                "empresa_completed",
-                "estabelecimento",
-            ]:
-                await process_estabelecimento_files(pool)
-                save_checkpoint("estabelecimento_completed")
-
-            if not checkpoint or checkpoint["stage"] in [
-                "empresa",
-                "empresa_completed",
-                "estabelecimento",
-                "estabelecimento_completed",
-                "socios",
-            ]:
-                await process_socios_files(pool)
-                save_checkpoint("socios_completed")
-
-            if not checkpoint or checkpoint["stage"] in [
-                "empresa",
-                "empresa_completed",
-                "estabelecimento",
-                "estabelecimento_completed",
-                "socios",
-                "socios_completed",
-                "simples",
-            ]:
-                await process_simples_files(pool)
-                save_checkpoint("simples_completed")
-
-            if not checkpoint or checkpoint["stage"] in [
-                "empresa",
-                "empresa_completed",
-                "estabelecimento",
-                "estabelecimento_completed",
-                "socios",
-                "socios_completed",
-                "simples",
-                "simples_completed",
-            ]:
-                await process_outros_arquivos(pool)
-                save_checkpoint("outros_completed")
-
-            # Todos os dados já foram carregados no banco — os ZIPs baixados não
-            # servem mais nesta execução (não ajudam numa reexecução futura, já
-            # que o dataset da Receita Federal muda todo mês)
-            console.print(
-                "\n[bold yellow]🧹 Limpando arquivos ZIP já processados...[/bold yellow]"
-            )
-            for _name in os.listdir(output_files):
-                if _name.lower().endswith(".zip"):
-                    remove_file_safe(os.path.join(output_files, _name))
+            await recover_bulk_mode()
+            bulk_mode = not args.no_bulk_mode
+            if bulk_mode:
+                async with pool.acquire() as conn:
+                    await enable_bulk_mode(
+                        conn,
+                        db_target,
+                        list(FACT_TABLE_KEYS),
+                        max_wal_size=getEnv("BULK_MAX_WAL_SIZE") or "16GB",
+                    )
 
-            # Criar índices automaticamente
-            save_checkpoint("creating_indexes")
-            await create_indexes(pool)
+            # Carga, índices e finalização rodam como grafo de tarefas; tarefas
+            # concluídas numa execução anterior são puladas, e a carga que
+            # ficou pela metade é retomada lote a lote
+            graph = build_task_graph(pool, checkpoint)
+            try:
+                with progress_display():
+                    await graph.run()
+            finally:
+                # Sucesso, erro ou interrupção (Ctrl+C/SIGTERM cancelam main)
+                if bulk_mode:
+                    try:
+                        async with pool.acquire() as conn:
+                            ok = await restore_bulk_mode(conn)
+                    except Exception as e:
+                        logger.error(f"Erro ao restaurar modo carga em massa: {e}")
+                        ok = False
+                    if not ok:
+                        console.print(
+                            "[bold red]Modo carga em massa NÃO foi desfeito — rode: "
+                            f"{RECOVERY_COMMAND}[/bold red]"
+                        )
+
+            # Registra o algoritmo dos row_hash gravados — a próxima carga
+            # incremental só confia nos hashes se a versão for a mesma
+            async with pool.acquire() as conn:
+                await write_metadata(conn, "row_hash_versao", row_hash_version())
+                # Perfil usado nesta carga, para comparar execuções
+                await write_metadata(
+                    conn, "perfil_tuning", json.dumps(get_tuning().as_dict())
+                )
+                # Índices deixados para depois do switch — o validador não os
+                # cobra da staging
+                await write_metadata(
+                    conn,
+                    DEFERRED_KEY,
+                    json.dumps(
+                        [i["name"] for i in INDEXES if i["tier"] != CORE]
+                        if args.defer_indexes
+                        else []
+                    ),
+                )
+                # No livro, estas tabelas só têm o delta: a contagem da
+                # validação vem do catálogo
+                await write_metadata(
+                    conn, INCREMENTAL_KEY, json.dumps(sorted(incremental_loads))
+                )
+                # Todas as tarefas de finalização concluídas — libera o switch
+                await mark_finalized(conn)
 
             state.update_staging_processed()
+            rows = await ledger_counts(pool)
 
             # Limpar checkpoint após conclusão bem-sucedida
             clear_checkpoint()
 
         finally:
-            # Fechar pool de conexões
+            # Fechar pool de conexões e o pool de processos de codificação
             await pool.close()
+            shutdown_encode_pool()
 
         total_time = time.time() - start_time
         minutes = int(total_time // 60)
@@ -1931,11 +2155,54 @@ async def main():
         table.add_row("Total", f"{total_time:.1f}s", style="bold")
         console.print(table)
 
+        print_task_timeline(graph, start_time)
+
+        tuning_table = Table(title="⚙️ Perfil de tuning")
+        tuning_table.add_column("Configuração", style="cyan")
+        tuning_table.add_column("Valor", style="magenta")
+        tuning_table.add_column("Origem")
+        for name, value, source in get_tuning().rows():
+            tuning_table.add_row(name, value, source)
+        console.print(tuning_table)
+
+        if incremental_loads:
+            delta = Table(title="🔁 Delta incremental")
+            delta.add_column("Tabela", style="cyan")
+            delta.add_column("Novas", justify="right")
+            delta.add_column("Alteradas", justify="right")
+            delta.add_column("Removidas", justify="right")
+            for name, inc in incremental_loads.items():
+                delta.add_row(
+                    name, f"{inc.inserted:,}", f"{inc.updated:,}", f"{inc.removed:,}"
+                )
+            console.print(delta)
+
         logger.info(f"Processo ETL concluído em {total_time:.1f}s")
         console.print(
             "\n[bold blue]🎉 Processo 100% finalizado! Você já pode usar seus dados no BD![/bold blue]"
         )
 
+        return EtlResult(
+            source_month=f"{mes:02d}-{ano}",
+            database=db_target,
+            schema=db_schema,
+            seconds={
+                "download": download_time,
+                "extracao": extract_time,
+                "processamento": total_time - download_time - extract_time,
+                "total": total_time,
+            },
+            tasks={
+                name: (started - start_time, (ended or time.time()) - started)
+                for name, (started, ended) in graph.timings.items()
+            },
+            rows=rows,
+            incremental={
+                name: {"novas": inc.inserted, "alteradas": inc.updated, "removidas": inc.removed}
+                for name, inc in incremental_loads.items()
+            },
+        )
+
     except Exception as e:
         logger.error(f"Erro no processo ETL: {e}", exc_info=True)
         console.print(f"\n[bold red]✗ ERRO NO PROCESSO ETL: {e}[/bold red]")
@@ -1943,4 +2210,10 @@ async def main():
 
 
 if __name__ == "__main__":
+    load_env()
+    setup_logging()
+    try:
+        init_run()
+    except (ValueError, RuntimeError):
+        sys.exit(1)
     asyncio.run(main())
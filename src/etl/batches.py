@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Carga das tabelas de fato em lotes retomáveis.
+
+Cada arquivo CSV é lido em segmentos de ~SEGMENT_BYTES, sempre cortados num
+fim de linha. Um segmento é um lote: vai para o banco num único COPY e, na
+MESMA transação, é registrado em `etl_lotes` (tabela, arquivo, byte inicial).
+Se o ETL cair no meio, o lote em andamento é desfeito por inteiro pelo
+Postgres e os já registrados são pulados na retomada — sem duplicar linhas.
+
+O corte dos segmentos depende só do conteúdo do arquivo e de SEGMENT_BYTES,
+então uma reexecução encontra exatamente os mesmos lotes. Não altere
+SEGMENT_BYTES com uma carga pela metade.
+
+`etl_lotes` é também o livro de conciliação da carga: por lote, linhas lidas
+do arquivo, linhas gravadas pelo COPY (na carga incremental, só o delta),
+linhas com campo descartado no tratamento, bytes (do lote e do arquivo) e
+tempos. As tabelas de referência entram com um lote por arquivo. O
+validador blue-green confronta esse registro com as estatísticas do
+catálogo (src/validation/ledger.py).
+"""
+
+import io
+
+import polars as pl
+
+SEGMENT_BYTES = 16 * 1024 * 1024
+
+PROGRESS_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_lotes (
+        tabela TEXT NOT NULL,
+        arquivo TEXT NOT NULL,
+        byte_inicio BIGINT NOT NULL,
+        bytes BIGINT NOT NULL,
+        linhas BIGINT NOT NULL,
+        gravado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (tabela, arquivo, byte_inicio)
+    );
+    -- Colunas do livro de conciliação; ALTER para bancos de cargas anteriores
+    -- (o destino incremental é clone do ativo)
+    ALTER TABLE etl_lotes
+        ADD COLUMN IF NOT EXISTS linhas_copiadas BIGINT,
+        ADD COLUMN IF NOT EXISTS rejeitadas BIGINT NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS bytes_arquivo BIGINT,
+        ADD COLUMN IF NOT EXISTS segundos_tratamento REAL,
+        ADD COLUMN IF NOT EXISTS segundos_copia REAL;
+"""
+
+
+def _last_row_boundary(buf):
+    """
+    Posição logo após o último fim de linha de `buf`. Nos CSVs da Receita todo
+    campo vem entre aspas, então uma linha termina em `"\\n` (ou `"\\r\\n`)
+    seguido do `"` da próxima — um '\\n' dentro de um campo não casa com isso.
+    Arquivos sem aspas caem no último '\\n'.
+    """
+    pos = buf.rfind(b'\n"')
+    while pos > 0:
+        before = buf[pos - 1 : pos]
+        if before == b'"' or (before == b"\r" and buf[pos - 2 : pos - 1] == b'"'):
+            return pos + 1
+        pos = buf.rfind(b'\n"', 0, pos)
+    if b'"' not in buf:
+        return buf.rfind(b"\n") + 1
+    return 0
+
+
+def iter_segments(path, segment_bytes=SEGMENT_BYTES):
+    """
+    Percorre o arquivo devolvendo `(byte_inicio, dados)` para cada segmento.
+    Os dados saem crus (latin-1) — o parse fica por conta de `parse_segment`.
+    """
+    offset = 0
+    pending = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(segment_bytes)
+            if not chunk:
+                break
+            pending += chunk
+            if len(pending) < segment_bytes:
+                continue
+            cut = _last_row_boundary(pending)
+            if not cut:
+                # Linha maior que o segmento — continua acumulando
+                continue
+            yield offset, pending[:cut]
+            offset += cut
+            pending = pending[cut:]
+    if pending:
+        yield offset, pending
+
+
+def parse_segment(data, columns):
+    """
+    Lê um segmento como DataFrame só de texto. Os arquivos da Receita são
+    latin-1 e o parser do Polars só aceita UTF-8 — como o segmento já está em
+    memória, a conversão é feita aqui mesmo, sem arquivo intermediário.
+    """
+    return pl.read_csv(
+        io.BytesIO(data.decode("latin-1").encode("utf-8")),
+        separator=";",
+        has_header=False,
+        new_columns=columns,
+        schema_overrides=[pl.Utf8] * len(columns),
+        encoding="utf8",
+    )
+
+
+async def committed_segments(conn, table):
+    """Lotes já gravados da tabela: {arquivo: {byte_inicio: bytes}}."""
+    rows = await conn.fetch(
+        "SELECT arquivo, byte_inicio, bytes FROM etl_lotes WHERE tabela = $1", table
+    )
+    committed = {}
+    for r in rows:
+        committed.setdefault(r["arquivo"], {})[r["byte_inicio"]] = r["bytes"]
+    return committed
+
+
+async def clear_segments(conn, table):
+    await conn.execute("DELETE FROM etl_lotes WHERE tabela = $1", table)
+
+
+async def record_segment(
+    conn,
+    table,
+    file_name,
+    offset,
+    size,
+    rows,
+    copied=None,
+    rejected=0,
+    file_size=None,
+    encode_seconds=None,
+    copy_seconds=None,
+):
+    """
+    Registra o lote — chamar dentro da transação do COPY correspondente.
+    `rows` são as linhas lidas do arquivo; `copied`, as gravadas (padrão:
+    todas).
+    """
+    await conn.execute(
+        """
+        INSERT INTO etl_lotes (
+            tabela, arquivo, byte_inicio, bytes, linhas, linhas_copiadas,
+            rejeitadas, bytes_arquivo, segundos_tratamento, segundos_copia
+        )
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+        """,
+        table,
+        file_name,
+        offset,
+        size,
+        rows,
+        rows if copied is None else copied,
+        rejected,
+        file_size,
+        encode_seconds,
+        copy_seconds,
+    )
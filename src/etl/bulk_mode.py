@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modo de carga em massa: configurações temporárias do servidor e das tabelas
+de fato durante a fase 3 do ETL.
+
+- `synchronous_commit = off` e `max_wal_size` maior (ALTER SYSTEM + reload):
+  o COPY deixa de esperar o flush do WAL a cada commit e os checkpoints
+  ficam mais espaçados;
+- autovacuum desligado nas tabelas de fato do banco em carga;
+- triggers de `audit_trigger_function` (src/sql/database_setup.sql)
+  desabilitados nessas tabelas — na carga incremental cada DELETE/COPY
+  geraria uma linha em `auditoria`.
+
+Os valores anteriores são gravados em BULK_STATE_FILE ANTES de qualquer
+alteração, e `restore_bulk_mode` os devolve. O ETL restaura no fim (sucesso,
+erro ou interrupção); se o processo morrer, a próxima execução restaura ao
+iniciar, ou manualmente:
+
+    uv run src/etl/bulk_mode.py --restore
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+import asyncpg
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+logger = logging.getLogger(__name__)
+
+BULK_STATE_FILE = _PROJECT_ROOT / "bulk_mode_state.json"
+
+RECOVERY_COMMAND = "uv run src/etl/bulk_mode.py --restore"
+
+
+def _quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def read_bulk_state(state_file=BULK_STATE_FILE):
+    path = Path(state_file)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def _write_state(state, state_file):
+    path = Path(state_file)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    tmp.replace(path)
+
+
+async def _previous_server_settings(conn, names):
+    """
+    Valores de `names` hoje em postgresql.auto.conf (ALTER SYSTEM). Ausente =
+    o valor vem do postgresql.conf/padrão e a restauração é um RESET.
+    """
+    rows = await conn.fetch(
+        """
+        SELECT name, setting FROM pg_file_settings
+        WHERE name = ANY($1::text[]) AND sourcefile LIKE '%postgresql.auto.conf'
+        ORDER BY seqno
+        """,
+        list(names),
+    )
+    previous = {name: None for name in names}
+    for r in rows:
+        previous[r["name"]] = r["setting"]
+    return previous
+
+
+async def enable_bulk_mode(conn, database, tables, max_wal_size="16GB", state_file=BULK_STATE_FILE):
+    """
+    Aplica o modo de carga em massa no banco `database` (conexão `conn`).
+    Falta de permissão para ALTER SYSTEM não impede o resto — o que não pôde
+    ser aplicado simplesmente não entra no estado.
+    """
+    state = {
+        "database": database,
+        # Layout por schemas: as tabelas são as do schema da carga
+        "schema": await conn.fetchval("SELECT current_schema()"),
+        "started_at": datetime.datetime.now().isoformat(),
+        "server": {},
+        "autovacuum": {},
+        "triggers": [],
+    }
+
+    server = {"synchronous_commit": "off", "max_wal_size": max_wal_size}
+    try:
+        state["server"] = await _previous_server_settings(conn, server)
+    except asyncpg.PostgresError as e:
+        logger.warning(f"Modo carga em massa: sem acesso a pg_file_settings ({e}) — servidor inalterado")
+        server = {}
+
+    for r in await conn.fetch(
+        """
+        SELECT c.relname,
+               (SELECT option_value FROM pg_options_to_table(c.reloptions)
+                WHERE option_name = 'autovacuum_enabled') AS previous
+        FROM pg_class c
+        WHERE c.relname = ANY($1::text[]) AND c.relkind = 'r'
+          AND c.relnamespace = current_schema()::regnamespace
+        """,
+        list(tables),
+    ):
+        state["autovacuum"][r["relname"]] = r["previous"]
+
+    for r in await conn.fetch(
+        """
+        SELECT c.relname AS table_name, t.tgname AS trigger_name
+        FROM pg_trigger t
+        JOIN pg_class c ON c.oid = t.tgrelid
+        JOIN pg_proc p ON p.oid = t.tgfoid
+        WHERE p.proname = 'audit_trigger_function'
+          AND NOT t.tgisinternal AND t.tgenabled <> 'D'
+          AND c.relname = ANY($1::text[])
+          AND c.relnamespace = current_schema()::regnamespace
+        """,
+        list(tables),
+    ):
+        state["triggers"].append([r["table_name"], r["trigger_name"]])
+
+    # Estado em disco antes de mexer em qualquer coisa: se o processo morrer
+    # no meio, a restauração sabe o que desfazer
+    _write_state(state, state_file)
+
+    applied = []
+    for name, value in server.items():
+        try:
+            await conn.execute(f"ALTER SYSTEM SET {name} = '{value}'")
+            applied.append(f"{name}={value}")
+        except asyncpg.PostgresError as e:
+            logger.warning(f"Modo carga em massa: ALTER SYSTEM SET {name} falhou ({e})")
+            state["server"].pop(name, None)
+    if applied:
+        await conn.execute("SELECT pg_reload_conf()")
+
+    for table in state["autovacuum"]:
+        await conn.execute(
+            f"ALTER TABLE {_quote_ident(table)} SET (autovacuum_enabled = false)"
+        )
+    for table, trigger in state["triggers"]:
+        await conn.execute(
+            f"ALTER TABLE {_quote_ident(table)} DISABLE TRIGGER {_quote_ident(trigger)}"
+        )
+
+    _write_state(state, state_file)
+    logger.info(
+        "Modo carga em massa ativo: "
+        f"{', '.join(applied) or 'servidor inalterado'}; autovacuum off em "
+        f"{len(state['autovacuum'])} tabelas; {len(state['triggers'])} triggers de auditoria desabilitados"
+    )
+    return state
+
+
+async def restore_bulk_mode(conn, state_file=BULK_STATE_FILE):
+    """
+    Devolve os valores gravados por enable_bulk_mode. `conn` deve estar no
+    banco registrado no estado. Cada passo é independente: uma falha é
+    registrada e os demais seguem; o arquivo de estado só é removido se tudo
+    foi restaurado. Retorna True quando não sobrou nada a restaurar.
+    """
+    state = read_bulk_state(state_file)
+    if state is None:
+        return True
+
+    ok = True
+    for name, previous in state.get("server", {}).items():
+        try:
+            if previous is None:
+                await conn.execute(f"ALTER SYSTEM RESET {name}")
+            else:
+                await conn.execute(f"ALTER SYSTEM SET {name} = '{previous}'")
+        except asyncpg.PostgresError as e:
+            ok = False
+            logger.error(f"Falha ao restaurar {name}: {e}")
+    if state.get("server"):
+        await conn.execute("SELECT pg_reload_conf()")
+
+    for table, previous in state.get("autovacuum", {}).items():
+        try:
+            if previous is None:
+                await conn.execute(
+                    f"ALTER TABLE IF EXISTS {_quote_ident(table)} RESET (autovacuum_enabled)"
+                )
+            else:
+                await conn.execute(
+                    f"ALTER TABLE IF EXISTS {_quote_ident(table)} "
+                    f"SET (autovacuum_enabled = {previous})"
+                )
+        except asyncpg.PostgresError as e:
+            ok = False
+            logger.error(f"Falha ao restaurar autovacuum de {table}: {e}")
+
+    for table, trigger in state.get("triggers", []):
+        try:
+            await conn.execute(
+                f"ALTER TABLE IF EXISTS {_quote_ident(table)} ENABLE TRIGGER {_quote_ident(trigger)}"
+            )
+        except asyncpg.PostgresError as e:
+            ok = False
+            logger.error(f"Falha ao reabilitar trigger {trigger} de {table}: {e}")
+
+    if ok:
+        Path(state_file).unlink(missing_ok=True)
+        logger.info("Modo carga em massa desfeito — configurações anteriores restauradas")
+    else:
+        logger.error(
+            f"Restauração incompleta — estado mantido em {state_file}. "
+            f"Corrija e rode: {RECOVERY_COMMAND}"
+        )
+    return ok
+
+
+async def connect_state(state, **db_config):
+    """
+    Conexão no banco e schema gravados em `state`. No layout por schemas o
+    search_path do banco aponta para o ativo — sem fixar o da staging, os
+    ALTER TABLE sem schema da restauração cairiam nas tabelas em produção.
+    """
+    return await asyncpg.connect(
+        **db_config,
+        database=state["database"],
+        server_settings={"search_path": state["schema"]} if state.get("schema") else None,
+    )
+
+
+async def _restore_from_cli():
+    state = read_bulk_state()
+    if state is None:
+        print("Nada a restaurar: modo carga em massa não está ativo.")
+        return 0
+    conn = await connect_state(
+        state,
+        host=os.getenv("DB_HOST", "localhost"),
+        port=int(os.getenv("DB_PORT", 5432)),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", ""),
+    )
+    try:
+        ok = await restore_bulk_mode(conn)
+    finally:
+        await conn.close()
+    print("✅ Configurações restauradas." if ok else "❌ Restauração incompleta — veja o log.")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Modo de carga em massa do ETL (configurações temporárias do servidor)"
+    )
+    parser.add_argument(
+        "--restore",
+        action="store_true",
+        help=f"Restaura as configurações gravadas em {BULK_STATE_FILE.name}",
+    )
+    args = parser.parse_args()
+    if not args.restore:
+        parser.print_help()
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv(_PROJECT_ROOT / ".env")
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    sys.exit(asyncio.run(_restore_from_cli()))
+
+
+if __name__ == "__main__":
+    main()
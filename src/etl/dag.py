@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Agendador das fases do ETL como grafo de tarefas (DAG).
+
+Cada tarefa declara de quais outras depende e qual recurso consome ("load",
+"index", ...). O orçamento limita quantas tarefas de cada recurso rodam ao
+mesmo tempo; fora isso, tudo que já tem as dependências prontas roda junto —
+ex.: a carga de simples enquanto os índices de estabelecimento são criados.
+
+O estado de cada tarefa ("running"/"done") é repassado a `on_change` a cada
+transição, para ser salvo no checkpoint. Numa reexecução, tarefas "done" são
+puladas e as que ficaram "running" rodam com `resume=True`.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+DONE = "done"
+
+
+@dataclass
+class Task:
+    name: str
+    # Corrotina chamada como run(resume)
+    run: object
+    deps: list = field(default_factory=list)
+    # Recurso do orçamento; None = sem limite
+    resource: str = None
+
+
+class TaskGraph:
+    def __init__(self, budget, status=None, on_change=None):
+        self.budget = budget
+        self.tasks = {}
+        self.status = dict(status or {})
+        self._on_change = on_change
+        # Início/fim (time.time()) de cada tarefa executada nesta rodada
+        self.timings = {}
+
+    def add(self, name, run, deps=(), resource=None):
+        """
+        Declara uma tarefa. As dependências precisam ter sido declaradas antes
+        — o que garante, por construção, que o grafo não tem ciclos.
+        """
+        missing = [d for d in deps if d not in self.tasks]
+        if missing:
+            raise ValueError(f"Tarefa '{name}' depende de tarefas não declaradas: {missing}")
+        if resource is not None and resource not in self.budget:
+            raise ValueError(f"Recurso '{resource}' da tarefa '{name}' fora do orçamento")
+        self.tasks[name] = Task(name, run, list(deps), resource)
+
+    def outstanding(self):
+        """Tarefas declaradas que ainda não terminaram."""
+        return [name for name in self.tasks if self.status.get(name) != DONE]
+
+    def _set(self, name, value):
+        self.status[name] = value
+        if self._on_change:
+            self._on_change(dict(self.status))
+
+    async def run(self):
+        """
+        Executa as tarefas pendentes respeitando dependências e orçamento. Uma
+        falha não interrompe as tarefas independentes (o que terminar fica
+        marcado para a próxima execução); as dependentes da que falhou não
+        rodam. No fim, levanta RuntimeError se alguma tarefa falhou.
+        """
+        limits = {r: asyncio.Semaphore(n) for r, n in self.budget.items()}
+        finished = {name: asyncio.Event() for name in self.tasks}
+        failed = {}
+
+        async def run_task(task):
+            for dep in task.deps:
+                await finished[dep].wait()
+            blocked = [d for d in task.deps if d in failed]
+            if blocked:
+                failed[task.name] = f"dependência falhou ({', '.join(blocked)})"
+                finished[task.name].set()
+                return
+
+            limit = limits.get(task.resource)
+            try:
+                if limit:
+                    await limit.acquire()
+                try:
+                    resume = self.status.get(task.name) == RUNNING
+                    self._set(task.name, RUNNING)
+                    self.timings[task.name] = [time.time(), None]
+                    try:
+                        await task.run(resume)
+                    finally:
+                        self.timings[task.name][1] = time.time()
+                    self._set(task.name, DONE)
+                finally:
+                    if limit:
+                        limit.release()
+            except Exception as e:
+                logger.error(f"Tarefa {task.name} falhou: {e}", exc_info=True)
+                failed[task.name] = str(e)
+            finally:
+                finished[task.name].set()
+
+        pending = []
+        for name, task in self.tasks.items():
+            if self.status.get(name) == DONE:
+                logger.info(f"Tarefa {name} já concluída — pulando")
+                finished[name].set()
+            else:
+                pending.append(run_task(task))
+
+        # Ordem de declaração = prioridade na fila de cada recurso
+        await asyncio.gather(*pending)
+
+        if failed:
+            raise RuntimeError(
+                "Tarefas com erro: "
+                + "; ".join(f"{name}: {reason}" for name, reason in failed.items())
+            )
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Parse e codificação dos lotes das tabelas de fato em processos separados.
+
+Mesmo com o parse do Polars em Rust, materializar as linhas como tuplas
+Python (`.rows()`) e codificá-las no asyncpg roda numa única thread — com
+vários COPY simultâneos o ETL ainda usava ~1 núcleo. Aqui cada lote é lido,
+tratado (row_hash, casts, datas) e convertido em CSV pronto para o COPY por
+um processo do pool; o processo principal só corta o arquivo em lotes e
+envia os bytes ao Postgres.
+
+Este módulo é importado pelos processos do pool: não pode ter efeitos
+colaterais no import.
+"""
+
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import polars as pl
+
+from src.etl.batches import parse_segment
+from src.etl.incremental import add_row_hash
+
+FACT_TABLE_COLUMNS = {
+    "empresa": [
+        "cnpj_basico",
+        "razao_social",
+        "natureza_juridica",
+        "qualificacao_responsavel",
+        "capital_social",
+        "porte_empresa",
+        "ente_federativo_responsavel",
+    ],
+    "estabelecimento": [
+        "cnpj_basico",
+        "cnpj_ordem",
+        "cnpj_dv",
+        "identificador_matriz_filial",
+        "nome_fantasia",
+        "situacao_cadastral",
+        "data_situacao_cadastral",
+        "motivo_situacao_cadastral",
+        "nome_cidade_exterior",
+        "pais",
+        "data_inicio_atividade",
+        "cnae_fiscal_principal",
+        "cnae_fiscal_secundaria",
+        "tipo_logradouro",
+        "logradouro",
+        "numero",
+        "complemento",
+        "bairro",
+        "cep",
+        "uf",
+        "municipio",
+        "ddd_1",
+        "telefone_1",
+        "ddd_2",
+        "telefone_2",
+        "ddd_fax",
+        "fax",
+        "correio_eletronico",
+        "situacao_especial",
+        "data_situacao_especial",
+    ],
+    "socios": [
+        "cnpj_basico",
+        "identificador_socio",
+        "nome_socio",
+        "cnpj_cpf_socio",
+        "qualificacao_socio",
+        "data_entrada_sociedade",
+        "pais",
+        "representante_legal",
+        "nome_representante",
+        "qualificacao_representante_legal",
+        "faixa_etaria",
+    ],
+    "simples": [
+        "cnpj_basico",
+        "opcao_pelo_simples",
+        "data_opcao_simples",
+        "data_exclusao_simples",
+        "opcao_mei",
+        "data_opcao_mei",
+        "data_exclusao_mei",
+    ],
+}
+
+# Colunas numéricas — inválido/vazio vira NULL (strict=False), não exceção
+INT32_COLUMNS = {
+    "empresa": ["natureza_juridica", "qualificacao_responsavel", "porte_empresa"],
+    "estabelecimento": [
+        "identificador_matriz_filial",
+        "situacao_cadastral",
+        "motivo_situacao_cadastral",
+        "pais",
+        "cnae_fiscal_principal",
+        "municipio",
+    ],
+    "socios": [
+        "identificador_socio",
+        "qualificacao_socio",
+        "pais",
+        "qualificacao_representante_legal",
+        "faixa_etaria",
+    ],
+}
+
+# Colunas de data (AAAAMMDD no CSV) de cada tabela
+DATE_COLUMNS = {
+    "estabelecimento": [
+        "data_situacao_cadastral",
+        "data_inicio_atividade",
+        "data_situacao_especial",
+    ],
+    "socios": ["data_entrada_sociedade"],
+    "simples": [
+        "data_opcao_simples",
+        "data_exclusao_simples",
+        "data_opcao_mei",
+        "data_exclusao_mei",
+    ],
+}
+
+
+def parse_date_columns(df, table_name):
+    date_cols_present = [c for c in DATE_COLUMNS.get(table_name, []) if c in df.columns]
+    if not date_cols_present:
+        return df
+    # "", "0" e "00000000" não casam com %Y%m%d e viram NULL com strict=False
+    return df.with_columns(
+        [
+            pl.col(c).str.strptime(pl.Date, format="%Y%m%d", strict=False)
+            for c in date_cols_present
+        ]
+    )
+
+
+def prepare_fact_segment(df, table_name):
+    """
+    Trata um lote recém-lido: row_hash sobre o texto bruto (antes dos casts),
+    colunas numéricas e datas.
+    """
+    df = add_row_hash(df)
+    casts = [pl.col(c).cast(pl.Int32, strict=False) for c in INT32_COLUMNS.get(table_name, [])]
+    if table_name == "empresa":
+        casts.append(
+            pl.col("capital_social")
+            .str.replace(",", ".", literal=True)
+            .cast(pl.Float64, strict=False)
+        )
+    if casts:
+        df = df.with_columns(casts)
+    return parse_date_columns(df, table_name)
+
+
+def count_rejected(raw, df, table_name):
+    """
+    Linhas com algum campo numérico/data que veio preenchido no arquivo mas
+    virou NULL no tratamento (valor inválido). Vazio e zeros ("0",
+    "00000000") são a forma da Receita de dizer "sem valor" — não contam.
+    """
+    columns = INT32_COLUMNS.get(table_name, []) + DATE_COLUMNS.get(table_name, [])
+    if table_name == "empresa":
+        columns = columns + ["capital_social"]
+    if not columns:
+        return 0
+    lost = [
+        raw[c].is_not_null()
+        & ~raw[c].str.strip_chars().str.contains(r"^0*$")
+        & df[c].is_null()
+        for c in columns
+    ]
+    return int(pl.DataFrame(lost).select(pl.any_horizontal(pl.all())).to_series().sum())
+
+
+@dataclass
+class EncodedSegment:
+    rows: int
+    columns: list
+    # Linhas com campo descartado no tratamento (count_rejected)
+    rejected: int = 0
+    # Tempo de leitura + tratamento + codificação no processo do pool
+    seconds: float = 0.0
+    # CSV (sem cabeçalho) pronto para COPY ... FORMAT csv
+    payload: bytes = None
+    # DataFrame tratado em Arrow IPC — só na carga incremental, que precisa
+    # comparar as linhas com a base antes de decidir o que gravar
+    frame: bytes = None
+
+
+def encode_copy_payload(df):
+    """
+    CSV no formato que o COPY entende: NULL sai como campo vazio sem aspas e
+    string vazia como "" — exatamente a convenção padrão do COPY em CSV.
+    """
+    buf = io.BytesIO()
+    df.write_csv(buf, include_header=False)
+    return buf.getvalue()
+
+
+def encode_segment(path, offset, size, table_name, keep_frame=False):
+    """
+    Roda num processo do pool: lê o segmento [offset, offset + size) do
+    arquivo, trata e devolve o lote codificado. Recebe só a posição — os bytes
+    vêm do cache de páginas do SO, sem passar pelo pipe entre processos.
+    """
+    start = time.time()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(size)
+    columns = FACT_TABLE_COLUMNS[table_name]
+    try:
+        raw = parse_segment(data, columns)
+    except pl.exceptions.NoDataError:
+        return EncodedSegment(rows=0, columns=columns, payload=b"")
+    df = prepare_fact_segment(raw, table_name)
+    encoded = EncodedSegment(
+        rows=df.height, columns=df.columns, rejected=count_rejected(raw, df, table_name)
+    )
+    del raw
+
+    if keep_frame:
+        buf = io.BytesIO()
+        df.write_ipc(buf)
+        encoded.frame = buf.getvalue()
+    else:
+        encoded.payload = encode_copy_payload(df)
+    encoded.seconds = time.time() - start
+    return encoded
+
+
+def decode_frame(frame):
+    return pl.read_ipc(io.BytesIO(frame))
+
+
+def create_encode_pool(workers):
+    """
+    Pool de processos para encode_segment. Usa "spawn": o Polars mantém um
+    pool de threads próprio e não é seguro em processos criados por fork.
+    Cada processo recebe uma fatia dos núcleos para as threads do Polars —
+    sem isso, N processos × N threads disputariam a CPU.
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # Lido pelo Polars no import: vale para os processos criados daqui em
+    # diante, não para o processo atual (que já importou o Polars)
+    os.environ["POLARS_MAX_THREADS"] = str(threads)
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Finalização do banco carregado, antes do switch blue-green.
+
+Logo depois da carga o banco não tem estatísticas para o planner nem mapa de
+visibilidade — as primeiras consultas em produção pegam planos ruins e não
+conseguem usar index-only scan. A finalização de cada tabela:
+
+- aumenta o alvo de estatísticas das colunas com distribuição muito desigual
+  (poucos valores concentram a maior parte das linhas: `uf`, `municipio`,
+  CNAE, situação cadastral) — o ANALYZE padrão amostra pouco para elas;
+- fixa `fillfactor = 100`: o snapshot é só leitura, espaço livre nas páginas
+  seria desperdício;
+- roda `VACUUM (FREEZE, ANALYZE)`: congela as linhas (o autovacuum não
+  precisará reescrever as tabelas depois), preenche o mapa de visibilidade e
+  coleta as estatísticas.
+
+Quando todas as tabelas terminam, o ETL grava FINALIZE_MARKER em
+`etl_metadados`; o BlueGreenValidator recusa o switch sem ele.
+"""
+
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Chave em etl_metadados gravada ao fim da finalização
+FINALIZE_MARKER = "finalizado_em"
+
+# Colunas com distribuição desigual e o alvo de estatísticas delas (padrão do
+# Postgres: 100)
+SKEWED_COLUMNS = {
+    "estabelecimento": ["uf", "municipio", "cnae_fiscal_principal", "situacao_cadastral"],
+}
+STATISTICS_TARGET = 1000
+
+# VACUUM FREEZE reescreve todas as páginas das tabelas de 60M+ linhas; o pool
+# tem command_timeout=300s
+FINALIZE_TIMEOUT = 4 * 3600
+
+
+async def finalize_table(conn, table_name, timeout=FINALIZE_TIMEOUT):
+    start = time.time()
+    await conn.execute(f"ALTER TABLE {table_name} SET (fillfactor = 100)")
+    for column in SKEWED_COLUMNS.get(table_name, []):
+        await conn.execute(
+            f"ALTER TABLE {table_name} ALTER COLUMN {column} "
+            f"SET STATISTICS {STATISTICS_TARGET}"
+        )
+    # VACUUM não roda dentro de transação — a conexão do pool está fora de uma
+    await conn.execute(f"VACUUM (FREEZE, ANALYZE) {table_name}", timeout=timeout)
+    logger.info(
+        f"VACUUM (FREEZE, ANALYZE) {table_name} concluído em {time.time() - start:.1f}s"
+    )
+
+
+async def clear_finalize_marker(conn):
+    """Banco volta a ficar não finalizado (nova carga em andamento)."""
+    await conn.execute("DELETE FROM etl_metadados WHERE chave = $1", FINALIZE_MARKER)
+
+
+async def mark_finalized(conn):
+    await conn.execute(
+        """
+        INSERT INTO etl_metadados (chave, valor) VALUES ($1, $2)
+        ON CONFLICT (chave) DO UPDATE SET valor = EXCLUDED.valor
+        """,
+        FINALIZE_MARKER,
+        datetime.datetime.now().isoformat(),
+    )
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Criação de índices em paralelo, em várias conexões do pool.
+
+Os índices GIN trigram levam horas em tabelas de 60M+ linhas; criá-los um
+depois do outro numa única conexão deixa a máquina ociosa. O agendador abaixo
+roda até `concurrency` builds ao mesmo tempo e divide entre eles um orçamento
+total de `maintenance_work_mem` e de workers paralelos — cada build recebe
+uma fatia fixa, então a soma nunca passa do orçamento. Os builds mais longos
+(estimados pelo tamanho da tabela e tipo do índice) entram primeiro, e o
+progresso de cada um vem de `pg_stat_progress_create_index`.
+
+Um único agendador pode atender várias chamadas de `build()` ao mesmo tempo
+(ex.: índices de tabelas diferentes pedidos pelo grafo do ETL) — a fila de
+prioridade e o orçamento são compartilhados.
+"""
+
+import asyncio
+import heapq
+import logging
+import re
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+_MEMORY_UNITS = {"kb": 1024, "mb": 1024**2, "gb": 1024**3, "tb": 1024**4}
+
+
+def parse_memory(value):
+    """Converte '2GB', '512MB', '65536kB' (ou bytes) para bytes."""
+    match = re.fullmatch(r"\s*(\d+)\s*([kKmMgGtT][bB])?\s*", str(value))
+    if not match:
+        raise ValueError(f"Valor de memória inválido: {value!r}")
+    number, unit = match.groups()
+    return int(number) * (_MEMORY_UNITS[unit.lower()] if unit else 1)
+
+
+@dataclass
+class IndexBuild:
+    name: str
+    table: str
+    sql: str
+    # Custo estimado — só serve para ordenar (maior primeiro)
+    cost: float = 0.0
+    # pending → created | exists | skipped | failed
+    status: str = "pending"
+    elapsed: float = 0.0
+    error: str = None
+
+
+class _PrioritySlots:
+    """Semáforo em que, havendo fila, a vaga liberada vai para o maior custo."""
+
+    def __init__(self, slots):
+        self._free = slots
+        self._waiters = []
+        self._seq = 0
+
+    async def acquire(self, priority):
+        if self._free and not self._waiters:
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, self._seq, future))
+        self._seq += 1
+        await future
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # A vaga passa direto para quem esperava
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+def _estimate_cost(index, table_bytes):
+    sql = index["sql"].upper()
+    if "USING GIN" in sql:
+        # GIN trigram gera várias entradas por linha — de longe os mais lentos
+        return table_bytes * 4
+    extra_columns = index.get("columns", "").count(",")
+    return table_bytes * (1 + 0.25 * extra_columns)
+
+
+class IndexBuildScheduler:
+    def __init__(
+        self,
+        pool,
+        concurrency=3,
+        mem_budget=2 * 1024**3,
+        worker_budget=0,
+        timeout=3600,
+        poll_interval=5,
+    ):
+        self._pool = pool
+        self.concurrency = max(1, concurrency)
+        # Fatia do orçamento de cada build
+        self.mem_per_build = max(64 * 1024**2, mem_budget // self.concurrency)
+        self.workers_per_build = max(0, worker_budget // self.concurrency)
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._slots = _PrioritySlots(self.concurrency)
+        # pid do backend → (build, id da barra de progresso)
+        self._active = {}
+        self._monitor_task = None
+        self._progress = None
+
+    async def _prepare(self, indexes):
+        """Separa o que já existe/não tem tabela e estima o custo do resto."""
+        tables = sorted({i["table"] for i in indexes})
+        async with self._pool.acquire() as conn:
+            sizes = dict(
+                await conn.fetch(
+                    """
+                    SELECT relname, pg_relation_size(oid) FROM pg_class
+                    WHERE relname = ANY($1::text[]) AND relkind = 'r'
+                      AND relnamespace = current_schema()::regnamespace
+                    """,
+                    tables,
+                )
+            )
+            existing = {
+                r["indexname"]
+                for r in await conn.fetch(
+                    """
+                    SELECT indexname FROM pg_indexes
+                    WHERE indexname = ANY($1::text[]) AND schemaname = current_schema()
+                    """,
+                    [i["name"] for i in indexes],
+                )
+            }
+
+        builds = []
+        for index in indexes:
+            build = IndexBuild(index["name"], index["table"], index["sql"])
+            if index["table"] not in sizes:
+                logger.warning(
+                    f"Tabela {build.table} não encontrada, pulando índice {build.name}"
+                )
+                build.status = "skipped"
+            elif build.name in existing:
+                logger.info(f"Índice {build.name} já existe")
+                build.status = "exists"
+            else:
+                build.cost = _estimate_cost(index, sizes[index["table"]])
+            builds.append(build)
+        return builds
+
+    async def build(self, indexes, progress=None):
+        """
+        Cria os índices (dicts com name/table/sql/columns) e devolve a lista de
+        IndexBuild com o resultado de cada um. Falhas não interrompem os
+        demais builds — ficam em `status`/`error`.
+        """
+        if progress is not None:
+            self._progress = progress
+        builds = await self._prepare(indexes)
+        pending = sorted(
+            (b for b in builds if b.status == "pending"), key=lambda b: -b.cost
+        )
+        await asyncio.gather(*(self._run(b) for b in pending))
+        return builds
+
+    async def _run(self, build):
+        await self._slots.acquire(build.cost)
+        try:
+            async with self._pool.acquire() as conn:
+                pid = conn.get_server_pid()
+                progress = self._progress
+                task_id = (
+                    progress.add_task(f"{build.name}: aguardando", total=100)
+                    if progress is not None
+                    else None
+                )
+                self._active[pid] = (build, task_id)
+                self._ensure_monitor()
+                logger.info(
+                    f"Criando índice {build.name} na tabela {build.table} "
+                    f"(maintenance_work_mem={self.mem_per_build // 1024**2}MB, "
+                    f"workers={self.workers_per_build})"
+                )
+                start = time.time()
+                try:
+                    # SET LOCAL: a configuração some no fim da transação e a
+                    # conexão volta limpa para o pool
+                    async with conn.transaction():
+                        await conn.execute(
+                            f"SET LOCAL maintenance_work_mem = '{self.mem_per_build // 1024}kB'"
+                        )
+                        await conn.execute(
+                            "SET LOCAL max_parallel_maintenance_workers = "
+                            f"{self.workers_per_build}"
+                        )
+                        await conn.execute(
+                            f"SET LOCAL statement_timeout = '{self._timeout * 1000}'"
+                        )
+                        await conn.execute(
+                            f"SET LOCAL lock_timeout = '{self._timeout * 1000}'"
+                        )
+                        # timeout explícito: o pool tem command_timeout=300s, que
+                        # derrubaria do lado do cliente os builds longos
+                        await conn.execute(build.sql, timeout=self._timeout)
+                    build.status = "created"
+                    build.elapsed = time.time() - start
+                    logger.info(
+                        f"Índice {build.name} criado com sucesso em {build.elapsed:.1f}s"
+                    )
+                except Exception as e:
+                    build.status = "failed"
+                    build.error = str(e)
+                    build.elapsed = time.time() - start
+                    logger.error(f"Erro ao criar índice {build.name}: {e}")
+                finally:
+                    self._active.pop(pid, None)
+                    if task_id is not None:
+                        progress.remove_task(task_id)
+        finally:
+            self._slots.release()
+
+    def _ensure_monitor(self):
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def _monitor(self):
+        """
+        Acompanha os builds em andamento via pg_stat_progress_create_index.
+        Termina sozinho quando não há mais builds ativos.
+        """
+        phases = {}
+        try:
+            async with self._pool.acquire() as conn:
+                while self._active:
+                    rows = await conn.fetch(
+                        """
+                        SELECT pid, phase, blocks_total, blocks_done,
+                               tuples_total, tuples_done
+                        FROM pg_stat_progress_create_index
+                        WHERE pid = ANY($1::int[])
+                        """,
+                        list(self._active),
+                    )
+                    for r in rows:
+                        entry = self._active.get(r["pid"])
+                        if entry is None:
+                            continue
+                        build, task_id = entry
+                        # Fases de varredura andam por blocos; as de carga da
+                        # árvore, por tuplas
+                        if r["tuples_total"]:
+                            pct = 100 * r["tuples_done"] / r["tuples_total"]
+                        elif r["blocks_total"]:
+                            pct = 100 * r["blocks_done"] / r["blocks_total"]
+                        else:
+                            pct = 0
+                        if task_id is not None and self._progress is not None:
+                            self._progress.update(
+                                task_id,
+                                description=f"{build.name}: {r['phase']}",
+                                completed=pct,
+                            )
+                        if phases.get(build.name) != r["phase"]:
+                            phases[build.name] = r["phase"]
+                            logger.info(f"Índice {build.name}: {r['phase']}")
+                    await asyncio.sleep(self._poll_interval)
+        except Exception as e:
+            # Só acompanhamento — uma falha aqui não afeta os builds
+            logger.warning(f"Monitor de criação de índices interrompido: {e}")
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+ETL como biblioteca: `await run(EtlConfig(...))` executa a carga no processo
+de quem chama e devolve um `EtlResult` com tempos por fase e por tarefa e as
+contagens do livro de carga.
+
+O script `ETL_dados_publicos_empresas.py` continua sendo a linha de comando;
+importá-lo não lê argumentos, não pergunta ano/mês, não acessa a rede nem cria
+diretórios — tudo isso acontece em `init_run`, chamada por `run` ou pelo
+`__main__` do script. O módulo do ETL (Polars, httpx...) só é importado
+dentro de `run`, então importar este arquivo é barato.
+
+    from src.etl.pipeline import EtlConfig, run
+    result = await run(EtlConfig(date="06-2026", db_target="receita_federal_staging"))
+"""
+
+from dataclasses import dataclass, field
+
+
+@dataclass
+class EtlConfig:
+    """Mesmos campos (e padrões) dos argumentos da linha de comando do ETL."""
+
+    # MM-AAAA; sem ela, `last` precisa ser True — `run` não pergunta nada
+    date: str | None = None
+    last: bool = False
+    db_target: str = "receita_federal_staging"
+    db_schema: str | None = None
+    skip_download: bool = False
+    incremental: bool = False
+    incremental_base: str = "receita_federal"
+    no_bulk_mode: bool = False
+    defer_indexes: bool = False
+
+
+@dataclass
+class EtlResult:
+    # MM-AAAA dos dados carregados
+    source_month: str
+    database: str
+    schema: str | None = None
+    # Fase → segundos: download, extracao, processamento, total
+    seconds: dict = field(default_factory=dict)
+    # Tarefa do grafo → (início em segundos desde o começo, duração)
+    tasks: dict = field(default_factory=dict)
+    # Tabela → {"lidas", "gravadas", "rejeitadas"} (etl_lotes)
+    rows: dict = field(default_factory=dict)
+    # Tabela de fato → {"novas", "alteradas", "removidas"} (--incremental)
+    incremental: dict = field(default_factory=dict)
+
+
+async def run(config: EtlConfig) -> EtlResult:
+    """Executa o ETL com `config`; as exceções da carga chegam a quem chamou."""
+    if not (config.date or config.last):
+        raise ValueError("Informe date (MM-AAAA) ou last=True")
+
+    from src.etl import ETL_dados_publicos_empresas as etl
+
+    etl.setup_logging()
+    etl.init_run(config)
+    return await etl.main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Detecção barata de um mês novo publicado pela Receita Federal.
+
+A Receita publica os dados num compartilhamento Nextcloud, lido via WebDAV
+(`PROPFIND`). O `ReleaseWatcher` pede primeiro só o ETag da raiz
+(`Depth: 0`, uma resposta de poucas centenas de bytes): enquanto ele não muda,
+não apareceu mês novo e nada mais é consultado. Quando muda, lista a raiz e
+compara o mês mais recente com o `source_month` do ativo.
+
+Um mês novo só conta como publicado quando o diretório tem os arquivos de
+todas as tabelas (`EXPECTED_PREFIXES`) e a listagem — nome, tamanho e ETag de
+cada arquivo — fica igual por `SCHEDULER_SETTLE_MINUTES`: a Receita sobe os
+arquivos ao longo de horas, e baixar no meio disso carregaria um mês pela
+metade.
+
+Sem dependências pesadas (só httpx): usado pelo modo daemon do run_prod.py,
+que consulta a cada poucos minutos.
+"""
+
+import base64
+import os
+import re
+import ssl
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+import httpx
+
+SHARE_TOKEN = "YggdBLfdninEJX9"
+WEBDAV_BASE_URL = "https://arquivos.receitafederal.gov.br/public.php/webdav"
+
+# Quanto tempo a listagem do mês novo precisa ficar parada
+SETTLE_MINUTES = float(os.getenv("SCHEDULER_SETTLE_MINUTES", 60))
+
+# Um arquivo (ou mais, numerados) por tabela
+EXPECTED_PREFIXES = (
+    "Empresas",
+    "Estabelecimentos",
+    "Socios",
+    "Simples",
+    "Cnaes",
+    "Motivos",
+    "Municipios",
+    "Naturezas",
+    "Paises",
+    "Qualificacoes",
+)
+
+_MONTH_DIR = re.compile(r"^(\d{4})-(\d{2})$")
+_NS = {"d": "DAV:"}
+
+
+@dataclass(frozen=True)
+class RemoteEntry:
+    name: str
+    etag: str | None = None
+    size: int | None = None
+
+
+@dataclass
+class Release:
+    year: int
+    month: int
+    # Arquivos .zip do mês
+    files: list = field(default_factory=list)
+
+    @property
+    def source_month(self) -> str:
+        """MM-AAAA, como em blue_green_state.json e nos argumentos do ETL."""
+        return f"{self.month:02d}-{self.year}"
+
+
+def propfind(path="/", depth=1, timeout=30.0) -> list:
+    """Entradas de `path` com ETag e tamanho; com depth=0, só a própria."""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    credentials = base64.b64encode(f"{SHARE_TOKEN}:".encode()).decode()
+
+    with httpx.Client(
+        headers={
+            "Authorization": f"Basic {credentials}",
+            "Depth": str(depth),
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+        },
+        timeout=timeout,
+        verify=ssl_context,
+        follow_redirects=True,
+    ) as client:
+        response = client.request(
+            "PROPFIND",
+            WEBDAV_BASE_URL + path,
+            content=(
+                '<?xml version="1.0"?><d:propfind xmlns:d="DAV:"><d:prop>'
+                "<d:getetag/><d:getcontentlength/></d:prop></d:propfind>"
+            ),
+        )
+        response.raise_for_status()
+
+    entries = []
+    for resp in ET.fromstring(response.content).findall("d:response", _NS):
+        href = resp.find("d:href", _NS)
+        if href is None:
+            continue
+        name = href.text.rstrip("/").split("/")[-1]
+        if depth and (not name or name == path.strip("/") or name == SHARE_TOKEN):
+            continue
+        etag = resp.find(".//d:getetag", _NS)
+        size = resp.find(".//d:getcontentlength", _NS)
+        entries.append(
+            RemoteEntry(
+                name,
+                etag.text if etag is not None else None,
+                int(size.text) if size is not None and size.text else None,
+            )
+        )
+    return entries
+
+
+def latest_month(names) -> tuple[int, int] | None:
+    """(ano, mês) do diretório AAAA-MM mais recente entre `names`."""
+    months = [(int(m[1]), int(m[2])) for m in map(_MONTH_DIR.match, names) if m]
+    return max(months) if months else None
+
+
+def parse_source_month(value) -> tuple[int, int] | None:
+    """'MM-AAAA' → (ano, mês)."""
+    try:
+        month, year = value.split("-")
+        return int(year), int(month)
+    except (AttributeError, ValueError):
+        return None
+
+
+def missing_tables(files) -> list:
+    """Prefixos de `EXPECTED_PREFIXES` sem nenhum .zip em `files`."""
+    upper = [name.upper() for name in files]
+    return [p for p in EXPECTED_PREFIXES if not any(n.startswith(p.upper()) for n in upper)]
+
+
+class ReleaseWatcher:
+    """Estado entre consultas: ETag da raiz e a listagem do mês candidato."""
+
+    def __init__(self, settle_minutes: float = SETTLE_MINUTES):
+        self._settle = settle_minutes * 60
+        self._root_etag = None
+        self._latest = None
+        self._listing = None
+        self._stable_since = None
+        # Motivo de o mês mais recente ainda não contar como publicado
+        self.waiting: str | None = None
+
+    def latest(self) -> tuple[int, int] | None:
+        (root,) = propfind("/", depth=0)
+        if root.etag is None or root.etag != self._root_etag:
+            self._latest = latest_month(e.name for e in propfind("/"))
+            self._root_etag = root.etag
+        return self._latest
+
+    def check(self, active_month: str | None) -> Release | None:
+        """Mês mais novo que `active_month` (MM-AAAA) já todo publicado, ou None."""
+        self.waiting = None
+        latest = self.latest()
+        active = parse_source_month(active_month)
+        if latest is None or (active and latest <= active):
+            return None
+
+        year, month = latest
+        entries = propfind(f"/{year}-{month:02d}")
+        files = sorted(e.name for e in entries if e.name.lower().endswith(".zip"))
+        missing = missing_tables(files)
+        if missing:
+            self._listing = None
+            self.waiting = f"{month:02d}-{year}: faltam {', '.join(missing)}"
+            return None
+
+        listing = (latest, tuple(sorted((e.name, e.size, e.etag) for e in entries)))
+        if listing != self._listing:
+            self._listing = listing
+            self._stable_since = time.monotonic()
+        remaining = self._settle - (time.monotonic() - self._stable_since)
+        if remaining > 0:
+            self.waiting = (
+                f"{month:02d}-{year}: {len(files)} arquivos, aguardando a listagem "
+                f"ficar parada por mais {remaining / 60:.0f} min"
+            )
+            return None
+        return Release(year, month, files)
@@ -12,10 +12,20 @@ import asyncpg
 import os
 import sys
 import time
+from pathlib import Path
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 
+# Raiz do projeto no sys.path — permite importar o catálogo de índices
+# (src.indexes.catalog) quando o script roda direto via `uv run`
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.indexes.catalog import index_definitions  # noqa: E402
+from src.validation.table_stats import format_rows, table_stats  # noqa: E402
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -50,51 +60,8 @@ EXPECTED_TABLES = [
     'qualificacao'
 ]
 
-# Índices que precisam ser criados
-INDEXES_TO_CREATE = [
-    {
-        'name': 'empresa_cnpj',
-        'table': 'empresa',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS empresa_cnpj ON empresa(cnpj_basico);'
-    },
-    {
-        'name': 'estabelecimento_cnpj',
-        'table': 'estabelecimento',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_cnpj ON estabelecimento(cnpj_basico);'
-    },
-    {
-        'name': 'estabelecimento_cnpj_completo',
-        'table': 'estabelecimento',
-        'columns': 'cnpj_basico, cnpj_ordem, cnpj_dv',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_cnpj_completo ON estabelecimento(cnpj_basico, cnpj_ordem, cnpj_dv);'
-    },
-    {
-        'name': 'socios_cnpj',
-        'table': 'socios',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS socios_cnpj ON socios(cnpj_basico);'
-    },
-    {
-        'name': 'simples_cnpj',
-        'table': 'simples',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS simples_cnpj ON simples(cnpj_basico);'
-    },
-    {
-        'name': 'estabelecimento_situacao',
-        'table': 'estabelecimento',
-        'columns': 'situacao_cadastral',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_situacao ON estabelecimento(situacao_cadastral);'
-    },
-    {
-        'name': 'estabelecimento_municipio',
-        'table': 'estabelecimento',
-        'columns': 'municipio',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_municipio ON estabelecimento(municipio);'
-    }
-]
+# Índices que precisam ser criados (src/indexes/catalog.py)
+INDEXES_TO_CREATE = index_definitions()
 
 
 async def create_db_pool():
@@ -115,23 +82,15 @@ async def verify_data_integrity(pool):
         missing_tables = []
         empty_tables = []
         
-        for table_name in EXPECTED_TABLES:
-            # Verificar se a tabela existe
-            exists = await conn.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = $1)",
-                table_name
-            )
-            
-            if not exists:
+        # Contagens do catálogo/ETL — sem COUNT(*) nas tabelas grandes
+        stats = await table_stats(conn, EXPECTED_TABLES)
+        for table_name, table_info in stats.items():
+            if not table_info.exists:
                 missing_tables.append(table_name)
-                continue
-            
-            # Verificar se a tabela tem dados
-            count = await conn.fetchval(f"SELECT COUNT(*) FROM {table_name}")
-            if count == 0:
+            elif not table_info.has_rows:
                 empty_tables.append(table_name)
             else:
-                console.print(f"[green]✅ {table_name}: {count:,} registros[/green]")
+                console.print(f"[green]✅ {table_name}: {format_rows(table_info)} registros[/green]")
         
         if missing_tables:
             console.print(f"[red]❌ Tabelas faltando: {', '.join(missing_tables)}[/red]")
@@ -178,6 +137,10 @@ async def create_missing_indexes(pool, missing_indexes):
         return True
     
     console.print(f"\n[bold blue]🔨 Criando {len(missing_indexes)} índices faltantes...[/bold blue]")
+
+    # Índices GIN trigram do catálogo
+    async with pool.acquire() as conn:
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
     
     success_count = 0
     failed_count = 0
@@ -187,10 +150,10 @@ async def create_missing_indexes(pool, missing_indexes):
             try:
                 start_time = time.time()
                 
-                # Obter tamanho da tabela
-                table_size = await conn.fetchval(f"SELECT COUNT(*) FROM {index_info['table']}")
+                # Obter tamanho da tabela (só para log)
+                table_info = (await table_stats(conn, [index_info['table']]))[index_info['table']]
                 
-                console.print(f"[cyan]🔨 [{i}/{len(missing_indexes)}] Criando {index_info['name']} ({table_size:,} registros)...[/cyan]")
+                console.print(f"[cyan]🔨 [{i}/{len(missing_indexes)}] Criando {index_info['name']} ({format_rows(table_info)} registros)...[/cyan]")
                 
                 await conn.execute(index_info['sql'])
                 
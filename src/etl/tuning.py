@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Perfil de tuning das sessões do ETL (carga e criação de índices).
+
+Os valores são calculados a partir da RAM e dos núcleos da máquina que roda o
+ETL — que, neste projeto, é a mesma do Postgres — e cada um pode ser fixado
+por variável de ambiente (.env). O perfil efetivo, com a origem de cada
+valor, entra no resumo da execução e em `etl_metadados`, para comparar
+execuções com configurações diferentes.
+
+`ETL_RESOURCE_SHARE` (0–1, padrão 1) reduz os valores calculados a essa
+fração da máquina — o modo daemon do run_prod.py carrega com o banco ativo
+atendendo consultas na mesma máquina. Valores fixados no .env não mudam.
+"""
+
+import os
+from dataclasses import asdict, dataclass, field
+
+from src.etl.index_builds import parse_memory
+
+_MB = 1024**2
+_GB = 1024**3
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def host_memory():
+    """RAM física da máquina em bytes (0 se não for possível descobrir)."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def format_memory(value):
+    if value >= _GB and value % _GB == 0:
+        return f"{value // _GB}GB"
+    return f"{value // _MB}MB"
+
+
+@dataclass
+class TuningProfile:
+    cores: int
+    ram: int
+    # Processos que tratam/codificam os lotes (src/etl/encoding.py)
+    encode_workers: int
+    # COPY simultâneos por carga
+    copy_concurrency: int
+    # work_mem das sessões de carga (DELETE por join da carga incremental)
+    work_mem: int
+    # Builds de índice simultâneos e orçamentos TOTAIS divididos entre eles
+    index_builds: int
+    maintenance_work_mem: int
+    parallel_maintenance_workers: int
+    # Fração da máquina usada no cálculo (ETL_RESOURCE_SHARE)
+    share: float = 1.0
+    # Origem de cada valor: "auto" (calculado) ou "env" (variável de ambiente)
+    sources: dict = field(default_factory=dict)
+
+    def load_settings(self):
+        """Configurações das sessões de carga (server_settings do pool)."""
+        return {
+            "work_mem": f"{self.work_mem // 1024}kB",
+            # ANALYZE/DELETE da carga usam a fatia de um build, não o total
+            "maintenance_work_mem": f"{self.maintenance_work_mem // self.index_builds // 1024}kB",
+        }
+
+    def rows(self):
+        """(configuração, valor, origem) para o resumo da execução."""
+        memory = {"work_mem", "maintenance_work_mem"}
+        if self.share < 1:
+            yield "share", f"{self.share:.0%}", "env"
+        for name in (
+            "encode_workers",
+            "copy_concurrency",
+            "work_mem",
+            "index_builds",
+            "maintenance_work_mem",
+            "parallel_maintenance_workers",
+        ):
+            value = getattr(self, name)
+            shown = format_memory(value) if name in memory else str(value)
+            yield name, shown, self.sources.get(name, "auto")
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def build_profile(env=None):
+    """
+    Calcula o perfil para esta máquina. Variáveis de ambiente sobrepõem o
+    cálculo: MAX_WORKERS, COPY_CONCURRENCY, WORK_MEM, INDEX_BUILD_CONCURRENCY,
+    MAINTENANCE_WORK_MEM e MAX_PARALLEL_MAINTENANCE_WORKERS.
+    """
+    env = os.environ if env is None else env
+    share = _clamp(float(env.get("ETL_RESOURCE_SHARE") or 1), 0.05, 1.0)
+    # Com share < 1 o cálculo enxerga uma máquina proporcionalmente menor
+    cores = max(1, int((os.cpu_count() or 1) * share))
+    ram = int((host_memory() or 8 * _GB) * share)
+    sources = {}
+
+    def pick(name, var, auto, parse=int):
+        raw = env.get(var)
+        if raw:
+            sources[name] = "env"
+            return parse(raw)
+        sources[name] = "auto"
+        return auto
+
+    encode_workers = pick("encode_workers", "MAX_WORKERS", cores)
+    copy_concurrency = pick(
+        "copy_concurrency", "COPY_CONCURRENCY", _clamp(cores // 2, 4, 16)
+    )
+    index_builds = pick(
+        "index_builds", "INDEX_BUILD_CONCURRENCY", _clamp(cores // 8, 2, 6)
+    )
+    # Um quarto da RAM para os builds de índice (até 32GB no total) — o resto
+    # fica para shared_buffers, cache do SO e a carga que roda em paralelo
+    maintenance_work_mem = pick(
+        "maintenance_work_mem",
+        "MAINTENANCE_WORK_MEM",
+        _clamp(ram // 4, 256 * _MB, 32 * _GB),
+        parse_memory,
+    )
+    parallel_maintenance_workers = pick(
+        "parallel_maintenance_workers", "MAX_PARALLEL_MAINTENANCE_WORKERS", cores // 2
+    )
+    work_mem = pick(
+        "work_mem",
+        "WORK_MEM",
+        _clamp(ram // 20 // max(1, copy_concurrency), 4 * _MB, 256 * _MB),
+        parse_memory,
+    )
+
+    return TuningProfile(
+        cores=cores,
+        ram=ram,
+        encode_workers=max(1, encode_workers),
+        copy_concurrency=max(1, copy_concurrency),
+        work_mem=work_mem,
+        index_builds=max(1, index_builds),
+        maintenance_work_mem=maintenance_work_mem,
+        parallel_maintenance_workers=max(0, parallel_maintenance_workers),
+        share=share,
+        sources=sources,
+    )
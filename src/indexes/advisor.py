@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Advisor de índices: compara o catálogo (src/indexes/catalog.py) com a carga
+de consultas real do banco ativo.
+
+- `pg_stat_statements`: quais colunas das tabelas aparecem em filtros e
+  junções, e quanto tempo de execução essas consultas somam. Colunas com
+  tempo relevante sem índice que as cubra viram proposta de ADICIONAR (ou de
+  habilitar uma entrada desligada do catálogo).
+- `pg_stat_user_indexes`: índices do catálogo que não foram usados nenhuma
+  vez desde o último reset de estatísticas viram proposta de REMOVER — cada
+  um custa tempo de build todo mês. Índices que servem à chave da carga
+  incremental (FACT_TABLE_KEYS) nunca são propostos para remoção.
+
+O advisor só lê estatísticas e imprime as propostas; aplicá-las é editar o
+catálogo. Uso:
+
+    uv run src/indexes/advisor.py [--database receita_federal] [--min-share 1.0]
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+from rich.console import Console
+from rich.table import Table
+
+# Raiz do projeto no sys.path — permite importar o catálogo de índices
+# (src.indexes.catalog) quando o script roda direto via `uv run`
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.blue_green.constants import FACT_TABLE_KEYS  # noqa: E402
+from src.indexes.catalog import IndexSpec, catalog_indexes  # noqa: E402
+
+console = Console()
+
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_PREDICATE = re.compile(
+    r"(?:\b(\w+)\.)?\b(\w+)\s*(=|<>|<=|>=|<|>|\bIN\b|\bBETWEEN\b|\bI?LIKE\b|~~\*?)",
+    re.IGNORECASE,
+)
+# Palavras que o regex de aliases confundiria com um alias
+_SQL_KEYWORDS = {
+    "where", "join", "left", "right", "inner", "outer", "full", "cross", "on",
+    "using", "group", "order", "limit", "offset", "union", "lateral", "natural",
+}
+
+
+@dataclass
+class ColumnDemand:
+    table: str
+    column: str
+    # "eq" (igualdade/intervalo/junção → B-tree) ou "like" (trecho → GIN trigram)
+    kind: str
+    calls: int = 0
+    total_time: float = 0.0
+    queries: int = 0
+
+
+@dataclass
+class Proposal:
+    # "adicionar" | "habilitar" | "remover"
+    action: str
+    table: str
+    index: str
+    reason: str
+    sql: str = ""
+
+
+@dataclass
+class Advice:
+    proposals: list = field(default_factory=list)
+    # Tempo total das consultas analisadas (ms) e desde quando há estatísticas
+    workload_time: float = 0.0
+    statements: int = 0
+    stats_since: object = None
+    has_statements: bool = True
+
+
+def referenced_tables(query, known_tables):
+    """Tabelas do catálogo citadas na consulta, com os aliases usados."""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(query):
+        table = table.lower()
+        if table not in known_tables:
+            continue
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def extract_predicates(query, columns):
+    """
+    (tabela, coluna, tipo) das colunas usadas em comparações na consulta.
+    `columns` mapeia tabela → conjunto de colunas. Heurística por regex —
+    basta para as consultas normalizadas do pg_stat_statements deste projeto.
+    """
+    aliases = referenced_tables(query, columns)
+    if not aliases:
+        return set()
+    tables = set(aliases.values())
+    found = set()
+    for qualifier, column, operator in _PREDICATE.findall(query):
+        column = column.lower()
+        kind = "like" if "like" in operator.lower() or operator.startswith("~~") else "eq"
+        if qualifier:
+            table = aliases.get(qualifier.lower())
+            candidates = [table] if table else []
+        else:
+            candidates = sorted(tables)
+        for table in candidates:
+            if column in columns[table]:
+                found.add((table, column, kind))
+    return found
+
+
+async def fetch_statements(conn, limit):
+    """Consultas do banco atual no pg_stat_statements (None se indisponível)."""
+    if not await conn.fetchval("SELECT to_regclass('pg_stat_statements') IS NOT NULL"):
+        return None
+    # PG 13+ separou o tempo de planejamento: total_exec_time; antes, total_time
+    for time_column in ("total_exec_time", "total_time"):
+        try:
+            return await conn.fetch(
+                f"""
+                SELECT query, calls, {time_column} AS total_time
+                FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                ORDER BY {time_column} DESC
+                LIMIT $1
+                """,
+                limit,
+            )
+        except asyncpg.UndefinedColumnError:
+            continue
+    return None
+
+
+async def fetch_indexes(conn):
+    """Índices existentes: tabela, coluna líder, método e uso."""
+    return await conn.fetch(
+        """
+        SELECT s.indexrelname AS index, s.relname AS table, s.idx_scan,
+               pg_relation_size(s.indexrelid) AS size, am.amname AS method,
+               a.attname AS leading_column, i.indisunique
+        FROM pg_stat_user_indexes s
+        JOIN pg_index i ON i.indexrelid = s.indexrelid
+        JOIN pg_class c ON c.oid = s.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        LEFT JOIN pg_attribute a ON a.attrelid = s.relid AND a.attnum = i.indkey[0]
+        WHERE s.schemaname = current_schema()
+        """
+    )
+
+
+async def fetch_columns(conn, tables):
+    columns = defaultdict(set)
+    for r in await conn.fetch(
+        """
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = ANY($1::text[])
+        """,
+        list(tables),
+    ):
+        columns[r["table_name"]].add(r["column_name"])
+    return columns
+
+
+def _serves_incremental_key(spec):
+    key = FACT_TABLE_KEYS.get(spec.table)
+    return bool(key) and list(spec.columns) == key[: len(spec.columns)]
+
+
+def advise(statements, indexes, columns, min_share=1.0):
+    """
+    Monta as propostas a partir das linhas já lidas do banco. `min_share` é o
+    percentual mínimo do tempo total das consultas para uma coluna sem índice
+    justificar um build.
+    """
+    advice = Advice()
+    catalog = {spec.name: spec for spec in catalog_indexes(include_disabled=True)}
+
+    covered = set()
+    for idx in indexes:
+        kind = "like" if idx["method"] == "gin" else "eq"
+        covered.add((idx["table"], idx["leading_column"], kind))
+
+    if statements is None:
+        advice.has_statements = False
+        statements = []
+    demand = {}
+    for r in statements:
+        advice.statements += 1
+        advice.workload_time += r["total_time"]
+        for key in extract_predicates(r["query"], columns):
+            entry = demand.setdefault(key, ColumnDemand(*key))
+            entry.calls += r["calls"]
+            entry.total_time += r["total_time"]
+            entry.queries += 1
+
+    threshold = advice.workload_time * min_share / 100
+    for key, entry in sorted(demand.items(), key=lambda d: -d[1].total_time):
+        if key in covered or not entry.total_time or entry.total_time < threshold:
+            continue
+        share = 100 * entry.total_time / advice.workload_time
+        reason = (
+            f"{entry.queries} consultas, {entry.calls:,} execuções, "
+            f"{share:.1f}% do tempo total"
+        )
+        disabled = next(
+            (
+                spec
+                for spec in catalog.values()
+                if not spec.enabled
+                and not spec.where
+                and spec.table == entry.table
+                and spec.columns[0] == entry.column
+                and (spec.method == "gin") == (entry.kind == "like")
+            ),
+            None,
+        )
+        if disabled:
+            advice.proposals.append(
+                Proposal("habilitar", entry.table, disabled.name, reason, disabled.sql)
+            )
+            continue
+        if entry.kind == "like":
+            spec = IndexSpec(
+                f"{entry.table}_{entry.column}_trgm",
+                entry.table,
+                (entry.column,),
+                method="gin",
+                opclass="gin_trgm_ops",
+            )
+        else:
+            spec = IndexSpec(f"{entry.table}_{entry.column}", entry.table, (entry.column,))
+        advice.proposals.append(Proposal("adicionar", entry.table, spec.name, reason, spec.sql))
+
+    usage = {idx["index"]: idx for idx in indexes}
+    for spec in catalog.values():
+        idx = usage.get(spec.name)
+        if not spec.enabled or idx is None or idx["idx_scan"] > 0:
+            continue
+        if _serves_incremental_key(spec):
+            continue
+        advice.proposals.append(
+            Proposal(
+                "remover",
+                spec.table,
+                spec.name,
+                f"nenhum uso desde o reset das estatísticas ({idx['size'] / 1024**3:.1f} GB)",
+            )
+        )
+    return advice
+
+
+async def run_advisor(db_config, limit=500, min_share=1.0):
+    conn = await asyncpg.connect(**db_config)
+    try:
+        indexes = await fetch_indexes(conn)
+        tables = {spec.table for spec in catalog_indexes(include_disabled=True)}
+        columns = await fetch_columns(conn, tables)
+        statements = await fetch_statements(conn, limit)
+        advice = advise(statements, indexes, columns, min_share)
+        advice.stats_since = await conn.fetchval(
+            "SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()"
+        )
+        return advice
+    finally:
+        await conn.close()
+
+
+def print_advice(advice, database):
+    console.print(f"\n[bold]Advisor de índices — {database}[/bold]")
+    if advice.stats_since:
+        console.print(f"[dim]Estatísticas de uso desde {advice.stats_since:%Y-%m-%d %H:%M}[/dim]")
+    if not advice.has_statements:
+        console.print(
+            "[yellow]pg_stat_statements indisponível — só a análise de índices sem uso. "
+            "Habilite com shared_preload_libraries = 'pg_stat_statements' e "
+            "CREATE EXTENSION pg_stat_statements;[/yellow]"
+        )
+    else:
+        console.print(
+            f"[dim]{advice.statements} consultas analisadas, "
+            f"{advice.workload_time / 1000:.0f}s de execução[/dim]"
+        )
+
+    if not advice.proposals:
+        console.print("[green]✅ O catálogo atende a carga de consultas atual.[/green]")
+        return
+
+    t = Table(title="📐 Propostas para src/indexes/catalog.py")
+    t.add_column("Ação", style="cyan")
+    t.add_column("Índice")
+    t.add_column("Motivo")
+    t.add_column("SQL", style="dim")
+    colors = {"adicionar": "green", "habilitar": "green", "remover": "red"}
+    for p in advice.proposals:
+        t.add_row(f"[{colors[p.action]}]{p.action}[/{colors[p.action]}]", p.index, p.reason, p.sql)
+    console.print(t)
+
+
+def main():
+    load_dotenv(_PROJECT_ROOT / ".env")
+    parser = argparse.ArgumentParser(
+        description="Propõe mudanças no catálogo de índices a partir da carga de consultas"
+    )
+    parser.add_argument(
+        "--database",
+        default=os.getenv("DB_NAME", "receita_federal"),
+        help="Banco analisado (padrão: o ativo, DB_NAME)",
+    )
+    parser.add_argument(
+        "--min-share",
+        type=float,
+        default=1.0,
+        help="Percentual mínimo do tempo total de consultas para propor um índice (padrão: 1.0)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=500,
+        help="Consultas mais caras do pg_stat_statements analisadas (padrão: 500)",
+    )
+    args = parser.parse_args()
+
+    db_config = {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": int(os.getenv("DB_PORT", 5432)),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", ""),
+        "database": args.database,
+    }
+    try:
+        advice = asyncio.run(run_advisor(db_config, args.limit, args.min_share))
+    except Exception as e:
+        console.print(f"[red]Erro ao consultar estatísticas: {e}[/red]")
+        sys.exit(1)
+    print_advice(advice, args.database)
+
+
+if __name__ == "__main__":
+    main()
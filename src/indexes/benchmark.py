@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mede o efeito de índices do catálogo nas consultas do cartão CNPJ
+(src/auxiliary/python/consultar_empresa.py).
+
+Sorteia CNPJs do banco, roda cada consulta com EXPLAIN (ANALYZE, BUFFERS) e
+compara latência, buffers lidos e heap fetches antes e depois de criar os
+índices pedidos — normalmente entradas desligadas do catálogo (cobertura com
+INCLUDE, parciais). Junto com o tempo de build e o tamanho de cada índice, é
+o que decide se ele paga o build mensal. Os índices criados aqui são
+removidos no fim (a menos que `--keep`).
+
+Rode na staging ou numa cópia — o build disputa disco e CPU com as consultas:
+
+    uv run src/indexes/benchmark.py --index estabelecimento_cnpj_cobertura --sample 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+from rich.console import Console
+from rich.table import Table
+
+# Raiz do projeto no sys.path — permite importar o catálogo de índices
+# (src.indexes.catalog) quando o script roda direto via `uv run`
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.auxiliary.python.consultar_empresa import CONSULTAS  # noqa: E402
+from src.indexes.catalog import catalog_indexes  # noqa: E402
+
+console = Console()
+
+# Builds de índices com INCLUDE em estabelecimento passam de uma hora
+BUILD_TIMEOUT = 4 * 3600
+
+
+@dataclass
+class QueryStats:
+    latencies: list = field(default_factory=list)
+    # Blocos por execução: do cache (hit) e do disco/SO (read)
+    hits: list = field(default_factory=list)
+    reads: list = field(default_factory=list)
+    heap_fetches: int = 0
+    nodes: Counter = field(default_factory=Counter)
+
+    def p95(self):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def buffers(self):
+        return statistics.mean(h + r for h, r in zip(self.hits, self.reads))
+
+
+@dataclass
+class BuildResult:
+    name: str
+    elapsed: float
+    size: int
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+async def explain(conn, query, cnpj_basico):
+    """Execução de uma consulta: (ms, blocos hit, blocos read, heap fetches, nós de scan)."""
+    raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", cnpj_basico)
+    result = json.loads(raw)[0]
+    root = result["Plan"]
+    heap_fetches = 0
+    nodes = []
+    for node in _walk(root):
+        heap_fetches += node.get("Heap Fetches", 0)
+        if "Scan" in node["Node Type"]:
+            nodes.append(f"{node['Node Type']} ({node.get('Index Name') or node.get('Relation Name')})")
+    return (
+        result["Execution Time"],
+        root.get("Shared Hit Blocks", 0),
+        root.get("Shared Read Blocks", 0),
+        heap_fetches,
+        nodes,
+    )
+
+
+async def sample_cnpjs(conn, size):
+    rows = await conn.fetch(
+        """
+        SELECT DISTINCT cnpj_basico FROM estabelecimento TABLESAMPLE SYSTEM (0.1)
+        LIMIT $1
+        """,
+        size,
+    )
+    return [r["cnpj_basico"] for r in rows]
+
+
+async def measure(conn, cnpjs):
+    """
+    Roda cada consulta para cada CNPJ: uma vez para aquecer o cache, outra
+    com EXPLAIN ANALYZE. As duas rodadas (antes/depois) partem do mesmo estado
+    de cache, então a diferença é do plano e não do aquecimento.
+    """
+    stats = {name: QueryStats() for name in CONSULTAS}
+    for name, query in CONSULTAS.items():
+        for cnpj in cnpjs:
+            await conn.fetch(query, cnpj)
+            elapsed, hit, read, heap_fetches, nodes = await explain(conn, query, cnpj)
+            s = stats[name]
+            s.latencies.append(elapsed)
+            s.hits.append(hit)
+            s.reads.append(read)
+            s.heap_fetches += heap_fetches
+            s.nodes.update(nodes)
+    return stats
+
+
+async def build_indexes(conn, specs):
+    results = []
+    for spec in specs:
+        exists = await conn.fetchval(
+            "SELECT EXISTS(SELECT 1 FROM pg_indexes WHERE indexname = $1)", spec.name
+        )
+        if exists:
+            console.print(f"[blue]ℹ️  Índice {spec.name} já existe — medindo como está[/blue]")
+            continue
+        console.print(f"[cyan]🔨 Criando {spec.name}...[/cyan]")
+        start = time.time()
+        await conn.execute(spec.sql, timeout=BUILD_TIMEOUT)
+        # Index-only scan depende do mapa de visibilidade e o planner das
+        # estatísticas do índice novo
+        await conn.execute(f"VACUUM (ANALYZE) {spec.table}", timeout=BUILD_TIMEOUT)
+        size = await conn.fetchval("SELECT pg_relation_size($1::regclass)", spec.name)
+        results.append(BuildResult(spec.name, time.time() - start, size))
+    return results
+
+
+def print_report(before, after, builds, sample):
+    t = Table(title=f"📏 Consultas do cartão CNPJ ({sample} CNPJs)")
+    t.add_column("Consulta", style="cyan")
+    t.add_column("Mediana (ms)", justify="right")
+    t.add_column("p95 (ms)", justify="right")
+    t.add_column("Buffers/consulta", justify="right")
+    t.add_column("Heap fetches", justify="right")
+    t.add_column("Scans", style="dim")
+
+    def cell(b, a, fmt):
+        if a is None:
+            return fmt(b)
+        return f"{fmt(b)} → {fmt(a)}"
+
+    for name, b in before.items():
+        a = after.get(name) if after else None
+        t.add_row(
+            name,
+            cell(statistics.median(b.latencies), a and statistics.median(a.latencies), lambda v: f"{v:.2f}"),
+            cell(b.p95(), a and a.p95(), lambda v: f"{v:.2f}"),
+            cell(b.buffers(), a and a.buffers(), lambda v: f"{v:.1f}"),
+            cell(b.heap_fetches, a and a.heap_fetches, lambda v: f"{v:,}"),
+            "\n".join(n for n, _ in (a or b).nodes.most_common(3)),
+        )
+    console.print(t)
+
+    if builds:
+        bt = Table(title="🔨 Custo dos índices")
+        bt.add_column("Índice", style="cyan")
+        bt.add_column("Build", justify="right")
+        bt.add_column("Tamanho", justify="right")
+        for r in builds:
+            bt.add_row(r.name, f"{r.elapsed / 60:.1f} min", f"{r.size / 1024**3:.2f} GB")
+        console.print(bt)
+
+
+async def run_benchmark(db_config, index_names, sample, keep):
+    catalog = {spec.name: spec for spec in catalog_indexes(include_disabled=True)}
+    unknown = [n for n in index_names if n not in catalog]
+    if unknown:
+        raise ValueError(f"Índices fora do catálogo: {', '.join(unknown)}")
+
+    conn = await asyncpg.connect(**db_config)
+    builds = []
+    try:
+        cnpjs = await sample_cnpjs(conn, sample)
+        if not cnpjs:
+            raise RuntimeError("Nenhum CNPJ encontrado em estabelecimento")
+        console.print(f"[blue]Medindo {len(CONSULTAS)} consultas com {len(cnpjs)} CNPJs...[/blue]")
+        before = await measure(conn, cnpjs)
+        after = None
+        if index_names:
+            builds = await build_indexes(conn, [catalog[n] for n in index_names])
+            after = await measure(conn, cnpjs)
+        print_report(before, after, builds, len(cnpjs))
+    finally:
+        if not keep:
+            for r in builds:
+                await conn.execute(f"DROP INDEX IF EXISTS {r.name}")
+        await conn.close()
+
+
+def main():
+    load_dotenv(_PROJECT_ROOT / ".env")
+    parser = argparse.ArgumentParser(
+        description="Mede latência e buffers das consultas do cartão CNPJ antes/depois de índices do catálogo"
+    )
+    parser.add_argument(
+        "--index",
+        action="append",
+        default=[],
+        help="Índice do catálogo a criar e medir (pode repetir); sem ele, só a linha de base",
+    )
+    parser.add_argument("--sample", type=int, default=100, help="CNPJs sorteados (padrão: 100)")
+    parser.add_argument(
+        "--database",
+        default="receita_federal_staging",
+        help="Banco medido (padrão: receita_federal_staging)",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Mantém os índices criados para a medição"
+    )
+    args = parser.parse_args()
+
+    db_config = {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": int(os.getenv("DB_PORT", 5432)),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", ""),
+        "database": args.database,
+        "command_timeout": 300,
+    }
+    try:
+        asyncio.run(run_benchmark(db_config, args.index, args.sample, args.keep))
+    except Exception as e:
+        console.print(f"[red]❌ Erro na medição: {e}[/red]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo declarativo dos índices das tabelas do CNPJ.
+
+Fonte única para quem cria ou confere índices: o ETL
+(src/etl/ETL_dados_publicos_empresas.py), src/indexes/create_indexes.py,
+src/etl/resume_etl.py, a validação blue-green (EXPECTED_INDEXES) e
+src/validation/check_database_status.py. Para mudar o conjunto de índices,
+mude só aqui — e consulte antes o advisor (src/indexes/advisor.py), que mostra
+o que a carga de consultas do banco ativo usa de fato.
+
+Entradas com `enabled=False` ficam documentadas mas não são criadas nem
+exigidas: as de src/sql/database_setup.sql, que nenhuma consulta conhecida
+usa, e candidatas (cobertura com INCLUDE, parciais) que ainda precisam provar
+que pagam o próprio build. O advisor aponta quando passam a valer; o
+src/indexes/benchmark.py mede o ganho nas consultas de consultar_empresa.
+
+Cada índice habilita uma capacidade de consulta (`capability`) e pertence a um
+nível: CORE, exigido antes do switch blue-green, ou DEFERRED — os GIN trigram,
+mais lentos que todos os B-tree juntos. Na disponibilidade progressiva
+(`run_prod.py --progressive`) o banco é promovido só com os CORE e os DEFERRED
+são criados depois, com CONCURRENTLY, no banco já ativo
+(src/indexes/deferred.py).
+"""
+
+from dataclasses import dataclass
+
+CORE = "core"
+DEFERRED = "deferred"
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    name: str
+    table: str
+    columns: tuple
+    # btree | gin
+    method: str = "btree"
+    # Classe de operadores aplicada a todas as colunas (ex.: gin_trgm_ops)
+    opclass: str = None
+    # Colunas só armazenadas no índice (B-tree): a consulta que lê apenas
+    # colunas da chave + INCLUDE vira index-only scan, sem ir ao heap
+    include: tuple = ()
+    # Predicado de índice parcial (ex.: "situacao_cadastral = 2")
+    where: str = None
+    # O snapshot é só leitura: B-trees cheias, sem espaço para inserções
+    fillfactor: int = 100
+    enabled: bool = True
+    # Consulta ou uso que justifica o índice
+    purpose: str = ""
+    # Capacidade de consulta que depende do índice (ver capabilities)
+    capability: str = None
+    # CORE | DEFERRED
+    tier: str = CORE
+
+    @property
+    def sql(self):
+        return self.create_sql()
+
+    def create_sql(self, concurrently=False):
+        columns = ", ".join(
+            f"{c} {self.opclass}" if self.opclass else c for c in self.columns
+        )
+        using = f" USING {self.method.upper()} " if self.method != "btree" else ""
+        include = f" INCLUDE ({', '.join(self.include)})" if self.include else ""
+        # GIN não aceita fillfactor
+        storage = f" WITH (fillfactor = {self.fillfactor})" if self.method == "btree" else ""
+        where = f" WHERE {self.where}" if self.where else ""
+        create = "CREATE INDEX CONCURRENTLY" if concurrently else "CREATE INDEX"
+        return (
+            f"{create} IF NOT EXISTS {self.name} ON {self.table}"
+            f"{using}({columns}){include}{storage}{where};"
+        )
+
+    def as_dict(self):
+        """Formato aceito pelos scripts de criação e pelo IndexBuildScheduler."""
+        columns = ", ".join(self.columns)
+        if self.method != "btree":
+            columns += f" ({self.method.upper()}{' ' + self.opclass if self.opclass else ''})"
+        if self.include:
+            columns += f" INCLUDE ({', '.join(self.include)})"
+        if self.where:
+            columns += f" WHERE {self.where}"
+        return {
+            "name": self.name,
+            "table": self.table,
+            "columns": columns,
+            "sql": self.sql,
+            "tier": self.tier,
+        }
+
+
+INDEX_CATALOG = [
+    IndexSpec(
+        "empresa_cnpj",
+        "empresa",
+        ("cnpj_basico",),
+        purpose="consulta por CNPJ; junção com estabelecimento",
+        capability="consulta_cnpj",
+    ),
+    IndexSpec(
+        "estabelecimento_cnpj",
+        "estabelecimento",
+        ("cnpj_basico",),
+        purpose="estabelecimentos de uma empresa",
+        capability="consulta_cnpj",
+    ),
+    IndexSpec(
+        "estabelecimento_cnpj_completo",
+        "estabelecimento",
+        ("cnpj_basico", "cnpj_ordem", "cnpj_dv"),
+        purpose="consulta por CNPJ completo; chave da carga incremental",
+        capability="consulta_cnpj",
+    ),
+    IndexSpec(
+        "socios_cnpj",
+        "socios",
+        ("cnpj_basico",),
+        purpose="sócios de uma empresa",
+        capability="consulta_cnpj",
+    ),
+    IndexSpec(
+        "simples_cnpj",
+        "simples",
+        ("cnpj_basico",),
+        purpose="opção pelo Simples/MEI de uma empresa",
+        capability="consulta_cnpj",
+    ),
+    IndexSpec(
+        "estabelecimento_situacao",
+        "estabelecimento",
+        ("situacao_cadastral",),
+        purpose="filtro por situação cadastral",
+        capability="filtro_situacao",
+    ),
+    IndexSpec(
+        "estabelecimento_municipio",
+        "estabelecimento",
+        ("municipio",),
+        purpose="filtro por município",
+        capability="filtro_municipio",
+    ),
+    IndexSpec(
+        "empresa_razao_social_trgm",
+        "empresa",
+        ("razao_social",),
+        method="gin",
+        opclass="gin_trgm_ops",
+        purpose="busca por trecho da razão social (ILIKE)",
+        capability="busca_razao_social",
+        tier=DEFERRED,
+    ),
+    IndexSpec(
+        "estabelecimento_nome_fantasia_trgm",
+        "estabelecimento",
+        ("nome_fantasia",),
+        method="gin",
+        opclass="gin_trgm_ops",
+        purpose="busca por trecho do nome fantasia (ILIKE)",
+        capability="busca_nome_fantasia",
+        tier=DEFERRED,
+    ),
+    IndexSpec(
+        "estabelecimento_uf",
+        "estabelecimento",
+        ("uf",),
+        enabled=False,
+        purpose="filtro por UF (database_setup.sql)",
+    ),
+    IndexSpec(
+        "estabelecimento_cnae_principal",
+        "estabelecimento",
+        ("cnae_fiscal_principal",),
+        enabled=False,
+        purpose="filtro por CNAE principal (database_setup.sql)",
+    ),
+    # Cobertura: tudo que consultar_estabelecimentos lê de estabelecimento. A
+    # chave inclui cnpj_ordem (ORDER BY da consulta). Quase dobra o espaço da
+    # tabela — medir com src/indexes/benchmark.py antes de habilitar
+    IndexSpec(
+        "estabelecimento_cnpj_cobertura",
+        "estabelecimento",
+        ("cnpj_basico", "cnpj_ordem"),
+        include=(
+            "cnpj_dv",
+            "nome_fantasia",
+            "situacao_cadastral",
+            "data_situacao_cadastral",
+            "motivo_situacao_cadastral",
+            "data_inicio_atividade",
+            "cnae_fiscal_principal",
+            "cnae_fiscal_secundaria",
+            "tipo_logradouro",
+            "logradouro",
+            "numero",
+            "complemento",
+            "bairro",
+            "cep",
+            "uf",
+            "municipio",
+            "ddd_1",
+            "telefone_1",
+            "ddd_2",
+            "telefone_2",
+            "correio_eletronico",
+        ),
+        enabled=False,
+        purpose="index-only scan em consultar_estabelecimentos",
+    ),
+    IndexSpec(
+        "socios_cnpj_cobertura",
+        "socios",
+        ("cnpj_basico", "nome_socio"),
+        include=(
+            "identificador_socio",
+            "cnpj_cpf_socio",
+            "qualificacao_socio",
+            "data_entrada_sociedade",
+            "pais",
+            "faixa_etaria",
+        ),
+        enabled=False,
+        purpose="index-only scan em consultar_socios (ORDER BY nome_socio)",
+    ),
+    # Parcial: só estabelecimentos ativos — bem menor que o índice completo
+    IndexSpec(
+        "estabelecimento_ativos_municipio",
+        "estabelecimento",
+        ("municipio",),
+        where="situacao_cadastral = 2",
+        enabled=False,
+        purpose="estabelecimentos ativos de um município",
+    ),
+]
+
+
+def catalog_indexes(tables=None, include_disabled=False, tier=None):
+    """Entradas do catálogo, opcionalmente só das tabelas em `tables` e do nível `tier`."""
+    return [
+        spec
+        for spec in INDEX_CATALOG
+        if (include_disabled or spec.enabled)
+        and (tables is None or spec.table in tables)
+        and (tier is None or spec.tier == tier)
+    ]
+
+
+def index_definitions(tables=None, tier=None):
+    """Índices a criar, como dicts name/table/columns/sql/tier."""
+    return [spec.as_dict() for spec in catalog_indexes(tables, tier=tier)]
+
+
+def index_names(tables=None, tier=None):
+    """Nomes dos índices que um banco carregado deve ter."""
+    return [spec.name for spec in catalog_indexes(tables, tier=tier)]
+
+
+def capabilities(valid_indexes):
+    """
+    Capacidade de consulta → disponível, dado o conjunto de índices válidos
+    no banco. Uma capacidade só está disponível com todos os seus índices.
+    """
+    available = {}
+    for spec in catalog_indexes():
+        if spec.capability:
+            available[spec.capability] = (
+                available.get(spec.capability, True) and spec.name in valid_indexes
+            )
+    return available
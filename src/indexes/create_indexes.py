@@ -12,10 +12,20 @@ import asyncpg
 import os
 import sys
 import time
+from pathlib import Path
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 
+# Raiz do projeto no sys.path — permite importar o catálogo de índices
+# (src.indexes.catalog) quando o script roda direto via `uv run`
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.indexes.catalog import index_definitions  # noqa: E402
+from src.validation.table_stats import table_stats  # noqa: E402
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -36,63 +46,8 @@ DB_CONFIG = {
     }
 }
 
-# Lista de índices a serem criados
-INDEXES = [
-    {
-        'name': 'empresa_cnpj',
-        'table': 'empresa',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS empresa_cnpj ON empresa(cnpj_basico);'
-    },
-    {
-        'name': 'estabelecimento_cnpj',
-        'table': 'estabelecimento',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_cnpj ON estabelecimento(cnpj_basico);'
-    },
-    {
-        'name': 'estabelecimento_cnpj_completo',
-        'table': 'estabelecimento',
-        'columns': 'cnpj_basico, cnpj_ordem, cnpj_dv',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_cnpj_completo ON estabelecimento(cnpj_basico, cnpj_ordem, cnpj_dv);'
-    },
-    {
-        'name': 'socios_cnpj',
-        'table': 'socios',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS socios_cnpj ON socios(cnpj_basico);'
-    },
-    {
-        'name': 'simples_cnpj',
-        'table': 'simples',
-        'columns': 'cnpj_basico',
-        'sql': 'CREATE INDEX IF NOT EXISTS simples_cnpj ON simples(cnpj_basico);'
-    },
-    {
-        'name': 'estabelecimento_situacao',
-        'table': 'estabelecimento',
-        'columns': 'situacao_cadastral',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_situacao ON estabelecimento(situacao_cadastral);'
-    },
-    {
-        'name': 'estabelecimento_municipio',
-        'table': 'estabelecimento',
-        'columns': 'municipio',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_municipio ON estabelecimento(municipio);'
-    },
-    {
-        'name': 'empresa_razao_social_trgm',
-        'table': 'empresa',
-        'columns': 'razao_social (GIN trgm)',
-        'sql': 'CREATE INDEX IF NOT EXISTS empresa_razao_social_trgm ON empresa USING GIN (razao_social gin_trgm_ops);'
-    },
-    {
-        'name': 'estabelecimento_nome_fantasia_trgm',
-        'table': 'estabelecimento',
-        'columns': 'nome_fantasia (GIN trgm)',
-        'sql': 'CREATE INDEX IF NOT EXISTS estabelecimento_nome_fantasia_trgm ON estabelecimento USING GIN (nome_fantasia gin_trgm_ops);'
-    },
-]
+# Lista de índices a serem criados (src/indexes/catalog.py)
+INDEXES = index_definitions()
 
 
 async def create_db_pool():
@@ -116,14 +71,12 @@ async def check_table_exists(pool, table_name):
 
 
 async def get_table_size(pool, table_name):
-    """Obtém o tamanho da tabela"""
+    """Obtém o número de registros da tabela (estimativa do catálogo, só para log)"""
     async with pool.acquire() as conn:
         try:
-            result = await conn.fetchval(
-                "SELECT COUNT(*) FROM " + table_name
-            )
-            return result
-        except:
+            stats = await table_stats(conn, [table_name])
+            return stats[table_name].rows
+        except Exception:
             return 0
 
 
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índices adiados (nível DEFERRED do catálogo) criados no banco já ativo.
+
+Na disponibilidade progressiva o ETL roda com `--defer-indexes`: cria só os
+índices CORE, grava a lista dos adiados em `etl_metadados` (DEFERRED_KEY) e o
+validador aceita a staging sem eles. Depois do switch, este módulo os cria no
+banco ativo com `CREATE INDEX CONCURRENTLY` — as consultas seguem atendidas
+durante o build — e, a cada índice pronto, atualiza no blue_green_state.json
+as capacidades de consulta disponíveis (`capabilities` do catálogo).
+
+Um build CONCURRENTLY interrompido deixa o índice inválido no catálogo; a
+próxima execução o remove e refaz. Uso manual:
+
+    uv run src/indexes/deferred.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+from rich.console import Console
+
+# Raiz do projeto no sys.path — permite importar o catálogo de índices
+# (src.indexes.catalog) quando o script roda direto via `uv run`
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.indexes.catalog import DEFERRED, capabilities, catalog_indexes  # noqa: E402
+
+console = Console()
+
+# Chave em etl_metadados com os índices que o ETL deixou para depois do switch
+DEFERRED_KEY = "indices_adiados"
+
+# Memória de cada build no banco ativo — divide a máquina com as consultas
+BUILD_MEMORY = os.getenv("DEFERRED_INDEX_MEMORY", "1GB")
+
+
+async def index_validity(conn):
+    """Índice do catálogo → válido, para os que existem no schema atual."""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, i.indisvalid AND i.indisready AS valid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY($1::text[])
+          AND c.relnamespace = current_schema()::regnamespace
+        """,
+        [spec.name for spec in catalog_indexes()],
+    )
+    return {r["relname"]: r["valid"] for r in rows}
+
+
+async def refresh_capabilities(conn, state_manager):
+    """Grava no estado as capacidades de consulta do banco ativo; devolve-as."""
+    validity = await index_validity(conn)
+    valid = {name for name, ok in validity.items() if ok}
+    available = capabilities(valid)
+    pending = [spec.name for spec in catalog_indexes() if spec.name not in valid]
+    state_manager.update_capabilities(available, pending)
+    return available
+
+
+async def _build(connect, spec, state_manager):
+    conn = await connect()
+    try:
+        valid = (await index_validity(conn)).get(spec.name)
+        if valid:
+            return spec.name, "exists", 0.0
+        start = time.time()
+        if valid is False:
+            # Sobra de um CONCURRENTLY interrompido: o IF NOT EXISTS o pularia
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {spec.name}")
+        console.print(f"[cyan]🔨 Criando {spec.name} (CONCURRENTLY)...[/cyan]")
+        await conn.execute(spec.create_sql(concurrently=True), timeout=None)
+        if state_manager is not None:
+            await refresh_capabilities(conn, state_manager)
+        return spec.name, "created", time.time() - start
+    except Exception as e:
+        console.print(f"[red]❌ {spec.name}: {e}[/red]")
+        return spec.name, "failed", 0.0
+    finally:
+        await conn.close()
+
+
+async def build_deferred_indexes(db_config, database, schema=None, state_manager=None):
+    """
+    Cria os índices DEFERRED que faltam em `database` (e `schema`, no layout
+    por schemas), um por conexão, em paralelo. Devolve (nome, status,
+    segundos) de cada um.
+    """
+    settings = {"maintenance_work_mem": BUILD_MEMORY}
+    if schema:
+        settings["search_path"] = f'"{schema}", public'
+
+    async def connect():
+        return await asyncpg.connect(
+            **db_config, database=database, timeout=30, server_settings=settings
+        )
+
+    specs = catalog_indexes(tier=DEFERRED)
+    results = await asyncio.gather(*(_build(connect, spec, state_manager) for spec in specs))
+
+    if state_manager is not None:
+        conn = await connect()
+        try:
+            await refresh_capabilities(conn, state_manager)
+        finally:
+            await conn.close()
+    return results
+
+
+def main():
+    load_dotenv(_PROJECT_ROOT / ".env")
+    from src.blue_green.layout import active_target
+    from src.blue_green.state import StateManager
+
+    db_config = {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": int(os.getenv("DB_PORT", 5432)),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", ""),
+    }
+    database, schema = active_target()
+    results = asyncio.run(build_deferred_indexes(db_config, database, schema, StateManager()))
+    for name, status, seconds in results:
+        label = {"created": f"criado em {seconds / 60:.1f} min", "exists": "já existia"}.get(
+            status, "falhou"
+        )
+        console.print(f"  • {name}: {label}")
+    sys.exit(1 if any(status == "failed" for _, status, _ in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -53,6 +53,8 @@ CREATE EXTENSION IF NOT EXISTS unaccent;
 -- 5. ÍNDICES OTIMIZADOS
 -- ============================================================================
 
+-- Os índices criados pelo ETL estão em src/indexes/catalog.py; os abaixo são
+-- para uma instalação manual a partir deste script
 -- Índices principais para consultas por CNPJ
 CREATE INDEX IF NOT EXISTS idx_empresa_cnpj_basico ON empresa(cnpj_basico);
 CREATE INDEX IF NOT EXISTS idx_estabelecimento_cnpj_basico ON estabelecimento(cnpj_basico);
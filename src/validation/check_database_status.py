@@ -4,13 +4,29 @@ Script para verificar o estado atual do banco de dados
 após o processo ETL da Receita Federal CNPJ
 """
 
+import argparse
 import asyncio
 import asyncpg
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.table import Table
 
+# Raiz do projeto no sys.path — permite importar o catálogo de índices
+# (src.indexes.catalog) quando o script roda direto via `uv run`
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from src.indexes.catalog import index_names  # noqa: E402
+from src.validation.table_stats import (  # noqa: E402
+    apply_exact_counts,
+    format_rows,
+    table_stats,
+)
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -40,15 +56,7 @@ EXPECTED_TABLES = [
 ]
 
 # Índices esperados
-EXPECTED_INDEXES = [
-    'empresa_cnpj',
-    'estabelecimento_cnpj',
-    'estabelecimento_cnpj_completo',
-    'socios_cnpj',
-    'simples_cnpj',
-    'estabelecimento_situacao',
-    'estabelecimento_municipio'
-]
+EXPECTED_INDEXES = index_names()
 
 
 async def create_db_connection():
@@ -61,37 +69,6 @@ async def create_db_connection():
         return None
 
 
-async def get_table_info(conn, table_name):
-    """Obtém informações de uma tabela"""
-    try:
-        # Verificar se a tabela existe
-        exists = await conn.fetchval(
-            "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = $1)",
-            table_name
-        )
-        
-        if not exists:
-            return {"exists": False, "count": 0, "size": "N/A"}
-        
-        # Obter contagem de registros
-        count = await conn.fetchval(f"SELECT COUNT(*) FROM {table_name}")
-        
-        # Obter tamanho da tabela
-        size_result = await conn.fetchval(
-            "SELECT pg_size_pretty(pg_total_relation_size($1))",
-            table_name
-        )
-        
-        return {
-            "exists": True,
-            "count": count,
-            "size": size_result
-        }
-        
-    except Exception as e:
-        return {"exists": False, "count": 0, "size": f"Error: {e}"}
-
-
 async def get_index_info(conn, index_name):
     """Verifica se um índice existe"""
     try:
@@ -115,7 +92,14 @@ async def get_database_size(conn):
         return "N/A"
 
 
-async def main():
+def format_size(size):
+    """Bytes em GB/MB para exibição"""
+    if size >= 1024**3:
+        return f"{size / 1024**3:.1f} GB"
+    return f"{size / 1024**2:.1f} MB"
+
+
+async def main(exact=False):
     """Função principal"""
     console.print("\n[bold magenta]" + "="*60 + "[/bold magenta]")
     console.print("[bold magenta]    STATUS DO BANCO DE DADOS - RECEITA FEDERAL    [/bold magenta]")
@@ -142,23 +126,25 @@ async def main():
         total_records = 0
         existing_tables = 0
         
-        for table_name in EXPECTED_TABLES:
-            info = await get_table_info(conn, table_name)
-            
-            if info["exists"]:
+        # Contagens do catálogo/ETL; exatas (COUNT(*) em paralelo) só com --exact
+        stats = await table_stats(conn, EXPECTED_TABLES)
+        if exact:
+            console.print("[yellow]Contando registros (COUNT(*) em paralelo)...[/yellow]")
+            await apply_exact_counts(DB_CONFIG, stats)
+        
+        for table_name, info in stats.items():
+            if info.exists:
                 existing_tables += 1
-                total_records += info["count"]
+                total_records += info.rows
                 status = "✅ Sim"
-                count_str = f"{info['count']:,}"
             else:
                 status = "❌ Não"
-                count_str = "0"
             
             table_info.add_row(
                 table_name,
                 status,
-                count_str,
-                info["size"]
+                format_rows(info),
+                format_size(info.size) if info.exists else "N/A"
             )
         
         console.print(table_info)
@@ -233,4 +219,10 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Verifica o estado do banco após o ETL")
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Conta os registros com COUNT(*) (lento: varre as tabelas, em paralelo)",
+    )
+    asyncio.run(main(exact=parser.parse_args().exact))
\ No newline at end of file
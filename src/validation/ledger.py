@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Conciliação do livro de carga (`etl_lotes`) com o catálogo do Postgres.
+
+O ETL registra cada lote na mesma transação do COPY: arquivo, trecho de bytes,
+linhas lidas, linhas gravadas, linhas com campo descartado e tempos (ver
+src/etl/batches.py). Confrontar esse registro com o que o banco diz ter
+detecta carga truncada ou parcial em milissegundos, sem `COUNT(*)`:
+
+- tabela esperada sem nenhum lote registrado;
+- arquivo baixado (lista gravada em `etl_metadados`, chave `arquivos:<tabela>`)
+  que não chegou ao livro;
+- arquivo cujos lotes não cobrem todos os seus bytes — a carga parou no meio;
+- soma das linhas lidas longe da estimativa do catálogo (`reltuples`, exata
+  depois do VACUUM da finalização) — linhas que sumiram ou sobraram.
+
+Linhas com campo descartado não reprovam a carga: são informadas por tabela.
+"""
+
+import json
+from dataclasses import dataclass, field
+
+# Diferença relativa tolerada entre o livro e a estimativa do catálogo
+ROW_TOLERANCE = 0.01
+
+
+@dataclass
+class LedgerIssue:
+    table: str
+    detail: str
+    file: str = None
+
+    def __str__(self):
+        where = f"{self.table}/{self.file}" if self.file else self.table
+        return f"{where}: {self.detail}"
+
+
+@dataclass
+class Reconciliation:
+    issues: list = field(default_factory=list)
+    # tabela → linhas com algum campo descartado no tratamento
+    rejected: dict = field(default_factory=dict)
+
+
+async def _expected_files(conn, tables):
+    if not await conn.fetchval("SELECT to_regclass('etl_metadados') IS NOT NULL"):
+        return {}
+    rows = await conn.fetch(
+        "SELECT chave, valor FROM etl_metadados WHERE chave = ANY($1::text[])",
+        [f"arquivos:{t}" for t in tables],
+    )
+    return {r["chave"].split(":", 1)[1]: json.loads(r["valor"]) for r in rows}
+
+
+async def reconcile(conn, stats):
+    """
+    Confronta `etl_lotes` com `stats` (resultado de table_stats) para as
+    tabelas existentes.
+    """
+    result = Reconciliation()
+    tables = [t for t, s in stats.items() if s.exists]
+    if not tables:
+        return result
+    if not await conn.fetchval("SELECT to_regclass('etl_lotes') IS NOT NULL"):
+        result.issues.append(LedgerIssue("etl_lotes", "livro de conciliação ausente"))
+        return result
+
+    files = await conn.fetch(
+        """
+        SELECT tabela, arquivo, SUM(bytes)::bigint AS bytes,
+               MAX(bytes_arquivo) AS bytes_arquivo, SUM(linhas)::bigint AS linhas,
+               SUM(rejeitadas)::bigint AS rejeitadas
+        FROM etl_lotes
+        WHERE tabela = ANY($1::text[])
+        GROUP BY tabela, arquivo
+        """,
+        tables,
+    )
+    by_table = {}
+    for r in files:
+        by_table.setdefault(r["tabela"], []).append(r)
+    expected = await _expected_files(conn, tables)
+
+    for table in tables:
+        entries = by_table.get(table, [])
+        if not entries:
+            result.issues.append(LedgerIssue(table, "nenhum lote registrado"))
+            continue
+
+        loaded = {r["arquivo"] for r in entries}
+        for name in expected.get(table, []):
+            if name not in loaded:
+                result.issues.append(LedgerIssue(table, "arquivo não carregado", name))
+
+        for r in entries:
+            # Lotes não se sobrepõem: bytes somados < tamanho = trecho faltando.
+            # bytes_arquivo NULL: lote de uma versão anterior do ETL
+            if r["bytes_arquivo"] is not None and r["bytes"] != r["bytes_arquivo"]:
+                result.issues.append(
+                    LedgerIssue(
+                        table,
+                        f"lotes cobrem {r['bytes']:,} de {r['bytes_arquivo']:,} bytes",
+                        r["arquivo"],
+                    )
+                )
+
+        read = sum(r["linhas"] for r in entries)
+        rejected = sum(r["rejeitadas"] for r in entries)
+        if rejected:
+            result.rejected[table] = rejected
+
+        # Sem ANALYZE a estimativa não é confiável — a validação já acusa a
+        # finalização pendente
+        s = stats[table]
+        if s.last_analyze is None:
+            continue
+        if abs(read - s.estimate) > ROW_TOLERANCE * max(read, s.estimate, 1):
+            result.issues.append(
+                LedgerIssue(
+                    table,
+                    f"livro registra {read:,} linhas, catálogo estima {s.estimate:,}",
+                )
+            )
+    return result
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Perfil de conteúdo das tabelas de fato por amostragem (`TABLESAMPLE`).
+
+Tabelas existirem e terem linhas não diz se a carga está certa: uma mudança
+de layout da Receita ou um cast quebrado gera colunas inteiras de NULL, datas
+absurdas ou códigos novos — e COUNT(*) não vê nada disso. Aqui cada tabela de
+fato é perfilada a partir de uma amostra de blocos (`TABLESAMPLE SYSTEM`):
+
+- taxa de NULL das colunas que quase nunca vêm vazias;
+- menor e maior data das colunas de data;
+- valores distintos das colunas de código com domínio pequeno.
+
+A validação blue-green compara o perfil da staging com o do banco ativo (a
+carga anterior) e aponta o que se afastou além dos limites — junto com a
+diferença de linhas por tabela (`compare_counts`). Máximos e valores
+distintos de duas amostras diferem por acaso; por isso data mais recente e
+códigos novos só reprovam depois de confirmados na tabela inteira
+(`confirm_profile`).
+"""
+
+import datetime
+import os
+from dataclasses import dataclass, field
+
+# Percentual de blocos amostrados: 0,5% de estabelecimento são ~300 mil linhas
+SAMPLE_PERCENT = float(os.getenv("VALIDATION_SAMPLE_PERCENT", 0.5))
+# Aumento tolerado na taxa de NULL de uma coluna, em pontos (0,05 = 5 p.p.)
+MAX_NULL_RATE_DELTA = float(os.getenv("VALIDATION_MAX_NULL_DELTA", 0.05))
+# Variação tolerada no número de linhas de uma tabela entre cargas mensais
+MAX_ROW_DELTA = float(os.getenv("VALIDATION_MAX_ROW_DELTA", 0.05))
+# Amostras menores que isso não sustentam comparação
+MIN_SAMPLE_ROWS = 1000
+
+PROFILE_TIMEOUT = 300
+
+
+@dataclass(frozen=True)
+class ProfileSpec:
+    not_null: tuple = ()
+    dates: tuple = ()
+    domains: tuple = ()
+
+
+PROFILE = {
+    "empresa": ProfileSpec(
+        not_null=("razao_social", "natureza_juridica", "porte_empresa"),
+        domains=("porte_empresa",),
+    ),
+    "estabelecimento": ProfileSpec(
+        not_null=(
+            "uf",
+            "municipio",
+            "situacao_cadastral",
+            "cnae_fiscal_principal",
+            "data_inicio_atividade",
+        ),
+        dates=("data_inicio_atividade", "data_situacao_cadastral"),
+        domains=("identificador_matriz_filial", "situacao_cadastral", "uf"),
+    ),
+    "socios": ProfileSpec(
+        not_null=("identificador_socio", "nome_socio", "qualificacao_socio"),
+        dates=("data_entrada_sociedade",),
+        domains=("identificador_socio", "faixa_etaria"),
+    ),
+    "simples": ProfileSpec(
+        not_null=("opcao_pelo_simples", "opcao_mei"),
+        dates=("data_opcao_simples", "data_opcao_mei"),
+        domains=("opcao_pelo_simples", "opcao_mei"),
+    ),
+}
+
+
+@dataclass
+class TableProfile:
+    table: str
+    rows: int = 0
+    null_rates: dict = field(default_factory=dict)
+    # coluna → (menor, maior)
+    date_ranges: dict = field(default_factory=dict)
+    domains: dict = field(default_factory=dict)
+
+
+async def profile_table(conn, table, sample_percent=SAMPLE_PERCENT):
+    """Perfil de `table` a partir de uma amostra de blocos."""
+    spec = PROFILE[table]
+    selects = ["count(*) AS n"]
+    selects += [f"count(*) FILTER (WHERE {c} IS NULL) AS null_{c}" for c in spec.not_null]
+    selects += [f"min({c}) AS min_{c}, max({c}) AS max_{c}" for c in spec.dates]
+    selects += [f"array_agg(DISTINCT {c}::text) AS dom_{c}" for c in spec.domains]
+    r = await conn.fetchrow(
+        f"SELECT {', '.join(selects)} FROM {table} TABLESAMPLE SYSTEM ({float(sample_percent)})",
+        timeout=PROFILE_TIMEOUT,
+    )
+    p = TableProfile(table, rows=r["n"])
+    if not p.rows:
+        return p
+    p.null_rates = {c: r[f"null_{c}"] / p.rows for c in spec.not_null}
+    p.date_ranges = {c: (r[f"min_{c}"], r[f"max_{c}"]) for c in spec.dates}
+    p.domains = {c: {v for v in r[f"dom_{c}"] if v is not None} for c in spec.domains}
+    return p
+
+
+def compare_profiles(staging, active, today=None):
+    """Problemas do perfil da staging frente ao do ativo."""
+    today = today or datetime.date.today()
+    issues = []
+    t = staging.table
+    if staging.rows < MIN_SAMPLE_ROWS:
+        return issues
+    for column, (_, newest) in staging.date_ranges.items():
+        if newest and newest > today:
+            issues.append(f"{t}.{column}: data no futuro ({newest})")
+    if active is None or active.rows < MIN_SAMPLE_ROWS:
+        return issues
+
+    for column, rate in staging.null_rates.items():
+        before = active.null_rates.get(column, 0.0)
+        if rate - before > MAX_NULL_RATE_DELTA:
+            issues.append(f"{t}.{column}: {rate:.1%} NULL na amostra (ativo: {before:.1%})")
+    return issues
+
+
+async def unknown_codes(conn, table, column, values):
+    """
+    Valores de `values` que não aparecem em nenhuma linha de `table.column`.
+    Os códigos comuns saem de pg_stats (o ativo já passou por ANALYZE); só o
+    resto — raros ou de fato novos — é procurado na tabela.
+    """
+    mcv = await conn.fetchval(
+        """
+        SELECT most_common_vals::text::text[] FROM pg_stats
+        WHERE schemaname = current_schema() AND tablename = $1 AND attname = $2
+        """,
+        table,
+        column,
+    )
+    remaining = sorted(set(values) - set(mcv or ()))
+    if not remaining:
+        return []
+    rows = await conn.fetch(
+        f"""
+        SELECT v FROM unnest($1::text[]) AS v
+        WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {column}::text = v)
+        """,
+        remaining,
+        timeout=PROFILE_TIMEOUT,
+    )
+    return [r["v"] for r in rows]
+
+
+async def confirm_profile(staging_conn, active_conn, staging, active):
+    """
+    Data mais recente e códigos de domínio: diferenças entre as duas amostras
+    viram problema só se a tabela inteira as confirmar. Amostras
+    independentes raramente têm o mesmo máximo ou os mesmos códigos raros.
+    """
+    issues = []
+    t = staging.table
+    if active is None or min(staging.rows, active.rows) < MIN_SAMPLE_ROWS:
+        return issues
+    for column, (_, newest) in staging.date_ranges.items():
+        _, active_newest = active.date_ranges.get(column, (None, None))
+        if not (newest and active_newest and newest < active_newest):
+            continue
+        # O snapshot novo não pode ser mais antigo que o anterior: basta uma
+        # linha da staging tão recente quanto a amostra do ativo
+        if not await staging_conn.fetchval(
+            f"SELECT EXISTS(SELECT 1 FROM {t} WHERE {column} >= $1)",
+            active_newest,
+            timeout=PROFILE_TIMEOUT,
+        ):
+            issues.append(f"{t}.{column}: nenhuma data a partir de {active_newest}, que o ativo tem")
+    for column, values in staging.domains.items():
+        new = values - active.domains.get(column, set())
+        if new:
+            new = await unknown_codes(active_conn, t, column, new)
+        if new:
+            issues.append(f"{t}.{column}: códigos que o ativo não tem: {', '.join(new)}")
+    return issues
+
+
+def compare_counts(staging_stats, active_stats, max_delta=MAX_ROW_DELTA):
+    """Tabelas cuja contagem (table_stats) variou além de `max_delta` frente ao ativo."""
+    issues = []
+    for table, s in staging_stats.items():
+        a = active_stats.get(table)
+        if not s.exists or a is None or not a.exists or not a.rows:
+            continue
+        delta = (s.rows - a.rows) / a.rows
+        if abs(delta) > max_delta:
+            issues.append(f"{table}: {s.rows:,} linhas, ativo {a.rows:,} ({delta:+.1%})")
+    return issues
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Teste de fumaça de desempenho antes do switch blue-green.
+
+A validação estrutural confere que tabelas, índices e estatísticas existem;
+não diz se as consultas de produção vão rodar tão rápido quanto hoje. Aqui uma
+bateria representativa — cartão CNPJ (as consultas de consultar_empresa.py),
+busca por trecho de nome (GIN trigram) e listagens por município e por CNAE —
+roda na staging e no ativo com os mesmos parâmetros, sorteados da staging.
+
+Para cada consulta compara-se a latência (mediana e p95, medidas no cliente
+depois de uma execução de aquecimento por parâmetro) e o formato do plano
+(`EXPLAIN`, só os nós de leitura). A staging é reprovada quando fica mais
+lenta que o ativo além de `SMOKE_MAX_SLOWDOWN` (e de `SMOKE_MIN_SLOWDOWN_MS`
+em valor absoluto — ruído de milissegundos não conta), quando troca um
+acesso por índice do ativo por `Seq Scan` (índice faltando ou estatística
+ruim) ou quando uma consulta estoura `QUERY_TIMEOUT`.
+
+Consultas cujo índice foi adiado (`run_prod.py --progressive`) são puladas na
+staging: o índice só nasce depois do switch.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import asyncpg
+
+from src.auxiliary.python.consultar_empresa import CONSULTAS
+from src.indexes.catalog import capabilities
+from src.indexes.deferred import index_validity
+
+# block: reprova o switch; warn: só avisa; off: não roda
+SMOKE_MODE = os.getenv("SMOKE_TEST", "block").strip().lower()
+# Quanto a staging pode ser mais lenta que o ativo (1,5 = 50%)
+MAX_SLOWDOWN = float(os.getenv("SMOKE_MAX_SLOWDOWN", 1.5))
+# Diferença mínima, em ms, para uma lentidão contar
+MIN_SLOWDOWN_MS = float(os.getenv("SMOKE_MIN_SLOWDOWN_MS", 5))
+# Parâmetros sorteados por tipo (CNPJs, nomes, municípios, CNAEs)
+SAMPLE_SIZE = int(os.getenv("SMOKE_SAMPLE", 30))
+
+QUERY_TIMEOUT = 30
+
+
+@dataclass(frozen=True)
+class SmokeQuery:
+    name: str
+    sql: str
+    # Parâmetro $1: cnpj | nome | municipio | cnae
+    param: str
+    # Capacidade do catálogo de índices de que a consulta depende
+    capability: str = None
+
+
+BATTERY = [
+    *(
+        SmokeQuery(f"cartao_{name}", sql, "cnpj", "consulta_cnpj")
+        for name, sql in CONSULTAS.items()
+    ),
+    SmokeQuery(
+        "busca_razao_social",
+        "SELECT cnpj_basico, razao_social FROM empresa "
+        "WHERE razao_social ILIKE '%' || $1 || '%' LIMIT 20",
+        "nome",
+        "busca_razao_social",
+    ),
+    SmokeQuery(
+        "busca_nome_fantasia",
+        "SELECT cnpj_basico, cnpj_ordem, cnpj_dv, nome_fantasia FROM estabelecimento "
+        "WHERE nome_fantasia ILIKE '%' || $1 || '%' LIMIT 20",
+        "nome",
+        "busca_nome_fantasia",
+    ),
+    SmokeQuery(
+        "lista_municipio",
+        "SELECT cnpj_basico, cnpj_ordem, cnpj_dv, nome_fantasia FROM estabelecimento "
+        "WHERE municipio = $1 AND situacao_cadastral = 2 LIMIT 50",
+        "municipio",
+        "filtro_municipio",
+    ),
+    SmokeQuery(
+        "lista_cnae",
+        "SELECT cnpj_basico, cnpj_ordem, cnpj_dv, nome_fantasia FROM estabelecimento "
+        "WHERE cnae_fiscal_principal = $1 LIMIT 50",
+        "cnae",
+    ),
+]
+
+# Parâmetros por tipo, sorteados de uma amostra de blocos
+_PARAM_SQL = {
+    "cnpj": "SELECT DISTINCT cnpj_basico FROM estabelecimento TABLESAMPLE SYSTEM (0.1)",
+    # Primeira palavra da razão social: trecho realista para busca por nome
+    "nome": """
+        SELECT DISTINCT lower(split_part(razao_social, ' ', 1))
+        FROM empresa TABLESAMPLE SYSTEM (0.1)
+        WHERE length(split_part(razao_social, ' ', 1)) >= 5
+    """,
+    "municipio": """
+        SELECT DISTINCT municipio FROM estabelecimento TABLESAMPLE SYSTEM (0.1)
+        WHERE municipio IS NOT NULL
+    """,
+    "cnae": """
+        SELECT DISTINCT cnae_fiscal_principal FROM estabelecimento TABLESAMPLE SYSTEM (0.1)
+        WHERE cnae_fiscal_principal IS NOT NULL
+    """,
+}
+
+
+@dataclass
+class QueryTiming:
+    latencies: list = field(default_factory=list)
+    # Nós de leitura do plano, ex.: "Index Scan (empresa_cnpj)"
+    plan: tuple = ()
+    error: str = None
+
+    def p50(self):
+        return statistics.median(self.latencies)
+
+    def p95(self):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+@dataclass
+class SmokeResult:
+    staging: dict = field(default_factory=dict)
+    active: dict = field(default_factory=dict)
+    issues: list = field(default_factory=list)
+    # Consultas puladas por dependerem de índice adiado
+    skipped: list = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.issues
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+async def plan_shape(conn, sql, value):
+    raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", value, timeout=QUERY_TIMEOUT)
+    return tuple(
+        sorted(
+            f"{node['Node Type']} ({node.get('Index Name') or node.get('Relation Name')})"
+            for node in _walk(json.loads(raw)[0]["Plan"])
+            if "Scan" in node["Node Type"]
+        )
+    )
+
+
+async def sample_params(conn, size=SAMPLE_SIZE):
+    params = {}
+    for kind, sql in _PARAM_SQL.items():
+        rows = await conn.fetch(f"{sql} LIMIT $1", size, timeout=QUERY_TIMEOUT)
+        params[kind] = [r[0] for r in rows]
+    return params
+
+
+async def run_battery(conn, params, queries):
+    """Latências e plano de cada consulta; uma execução de aquecimento por parâmetro."""
+    timings = {}
+    for q in queries:
+        t = timings[q.name] = QueryTiming()
+        values = params[q.param]
+        if not values:
+            continue
+        try:
+            for value in values:
+                await conn.fetch(q.sql, value, timeout=QUERY_TIMEOUT)
+                start = time.perf_counter()
+                await conn.fetch(q.sql, value, timeout=QUERY_TIMEOUT)
+                t.latencies.append((time.perf_counter() - start) * 1000)
+            t.plan = await plan_shape(conn, q.sql, values[0])
+        except asyncio.TimeoutError:
+            t.error = f"excedeu {QUERY_TIMEOUT}s"
+        except asyncpg.PostgresError as e:
+            t.error = str(e)
+    return timings
+
+
+def compare_timings(staging, active):
+    """Problemas da staging frente ao ativo (sem ativo: só erros e timeouts)."""
+    issues = []
+    for name, s in staging.items():
+        if s.error:
+            issues.append(f"{name}: {s.error}")
+            continue
+        a = active.get(name)
+        if not s.latencies or a is None or a.error or not a.latencies:
+            continue
+        for label, mine, theirs in (("mediana", s.p50(), a.p50()), ("p95", s.p95(), a.p95())):
+            if mine > theirs * MAX_SLOWDOWN and mine - theirs > MIN_SLOWDOWN_MS:
+                issues.append(f"{name}: {label} {mine:.1f} ms (ativo: {theirs:.1f} ms)")
+        # Seq Scan onde o ativo usa índice: índice ausente ou estatística ruim
+        seq = {n for n in s.plan if n.startswith("Seq Scan")} - set(a.plan)
+        if seq:
+            issues.append(f"{name}: {', '.join(sorted(seq))} (ativo: {', '.join(a.plan)})")
+    return issues
+
+
+async def _connect(db_config, database, schema):
+    return await asyncpg.connect(
+        **db_config,
+        database=database,
+        timeout=30,
+        server_settings={"search_path": f'"{schema}", public'} if schema else None,
+    )
+
+
+async def smoke_test(db_config, staging, active):
+    """
+    Roda a bateria em `staging` e `active` — tuplas (banco, schema) — uma
+    depois da outra, para as medições não disputarem a máquina. Sem ativo
+    acessível (primeira carga), mede só a staging.
+    """
+    result = SmokeResult()
+    conn = await _connect(db_config, *staging)
+    try:
+        params = await sample_params(conn)
+        validity = await index_validity(conn)
+        ready = capabilities({name for name, ok in validity.items() if ok})
+        queries = [q for q in BATTERY if q.capability is None or ready.get(q.capability)]
+        result.skipped = [q.name for q in BATTERY if q not in queries]
+        result.staging = await run_battery(conn, params, queries)
+    finally:
+        await conn.close()
+
+    if active != staging:
+        try:
+            conn = await _connect(db_config, *active)
+        except (OSError, asyncpg.PostgresError):
+            conn = None
+        if conn is not None:
+            try:
+                result.active = await run_battery(conn, params, queries)
+            finally:
+                await conn.close()
+
+    result.issues = compare_timings(result.staging, result.active)
+    return result
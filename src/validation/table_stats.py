@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Contagem de linhas das tabelas sem `SELECT COUNT(*)`.
+
+COUNT(*) numa tabela de 60M+ linhas é uma varredura completa — minutos por
+tabela, repetidos a cada validação. Aqui a contagem vem, em ordem de
+preferência, de:
+
+1. `etl_lotes`: linhas gravadas pelo ETL (`linhas_copiadas`), lote a lote,
+   na mesma transação do COPY — exata depois de uma carga completa. Na carga
+   incremental o livro só tem o delta, então as tabelas listadas em
+   `etl_metadados` (`INCREMENTAL_KEY`) usam a estimativa abaixo;
+2. `pg_class.reltuples`: estimativa do último VACUUM/ANALYZE (a finalização
+   do ETL roda os dois);
+3. `pg_stat_user_tables.n_live_tup`: contador do coletor de estatísticas,
+   para tabelas que ainda não passaram por ANALYZE.
+
+"Tabela vazia" nunca depende de estimativa: quando a contagem dá zero, um
+`EXISTS` (lê no máximo uma página) confirma. Contagem exata só sob demanda,
+com `exact_counts`, em paralelo — uma conexão por tabela.
+"""
+
+import asyncio
+import json
+from dataclasses import dataclass
+
+import asyncpg
+
+LOADER = "loader"
+ESTIMATE = "estimativa"
+EXACT = "exata"
+
+# Chave de etl_metadados com as tabelas carregadas em modo incremental
+INCREMENTAL_KEY = "tabelas_incrementais"
+
+
+@dataclass
+class TableStats:
+    table: str
+    exists: bool = False
+    rows: int = 0
+    # De onde veio `rows`: loader | estimativa | exata
+    source: str = ""
+    # Tabela + índices + TOAST, em bytes
+    size: int = 0
+    has_rows: bool = False
+    last_analyze: object = None
+    # Estimativa do catálogo (reltuples, ou n_live_tup), mesmo quando `rows`
+    # vem do loader — é com ela que o livro de conciliação é confrontado
+    estimate: int = 0
+
+
+async def _loader_counts(conn):
+    """Tabela → linhas gravadas segundo o livro, sem as de carga incremental."""
+    if not await conn.fetchval("SELECT to_regclass('etl_lotes') IS NOT NULL"):
+        return {}
+    incremental = set()
+    if await conn.fetchval("SELECT to_regclass('etl_metadados') IS NOT NULL"):
+        raw = await conn.fetchval(
+            "SELECT valor FROM etl_metadados WHERE chave = $1", INCREMENTAL_KEY
+        )
+        incremental = set(json.loads(raw)) if raw else set()
+    # linhas_copiadas NULL: lote de uma versão anterior do ETL, que gravava
+    # todas as linhas lidas
+    rows = await conn.fetch(
+        """
+        SELECT tabela, SUM(COALESCE(linhas_copiadas, linhas))::bigint
+        FROM etl_lotes GROUP BY tabela
+        """
+    )
+    return {table: count for table, count in rows if table not in incremental}
+
+
+async def table_stats(conn, tables):
+    """TableStats de cada tabela em `tables` (as inexistentes com exists=False)."""
+    stats = {table: TableStats(table) for table in tables}
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, c.reltuples::bigint AS reltuples,
+               pg_total_relation_size(c.oid) AS size, s.n_live_tup,
+               GREATEST(s.last_analyze, s.last_autoanalyze) AS last_analyze
+        FROM pg_class c
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE c.relname = ANY($1::text[]) AND c.relkind IN ('r', 'p')
+          AND c.relnamespace = current_schema()::regnamespace
+        """,
+        list(tables),
+    )
+    loader = await _loader_counts(conn)
+
+    for r in rows:
+        s = stats[r["relname"]]
+        s.exists = True
+        s.size = r["size"]
+        s.last_analyze = r["last_analyze"]
+        # reltuples -1 (PG 14+): nunca passou por VACUUM/ANALYZE
+        s.estimate = r["reltuples"] if r["reltuples"] >= 0 else r["n_live_tup"] or 0
+        if loader.get(s.table):
+            s.rows, s.source = loader[s.table], LOADER
+        else:
+            s.rows, s.source = s.estimate, ESTIMATE
+        s.has_rows = s.rows > 0
+        if not s.has_rows:
+            s.has_rows = await conn.fetchval(f"SELECT EXISTS(SELECT 1 FROM {s.table})")
+    return stats
+
+
+async def exact_counts(db_config, tables, concurrency=4, timeout=3600):
+    """COUNT(*) das tabelas em paralelo, cada uma na própria conexão."""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def count(table):
+        async with slots:
+            conn = await asyncpg.connect(**db_config)
+            try:
+                return table, await conn.fetchval(f"SELECT COUNT(*) FROM {table}", timeout=timeout)
+            finally:
+                await conn.close()
+
+    return dict(await asyncio.gather(*(count(t) for t in tables)))
+
+
+async def apply_exact_counts(db_config, stats, concurrency=4):
+    """Troca a contagem das tabelas existentes em `stats` pela exata."""
+    existing = [s.table for s in stats.values() if s.exists]
+    for table, count in (await exact_counts(db_config, existing, concurrency)).items():
+        stats[table].rows = count
+        stats[table].source = EXACT
+        stats[table].has_rows = count > 0
+    return stats
+
+
+def format_rows(s):
+    """Contagem para exibição — estimativas com '~'."""
+    if not s.exists:
+        return "0"
+    prefix = "~" if s.source == ESTIMATE else ""
+    return f"{prefix}{s.rows:,}"